@@ -0,0 +1,214 @@
+import argparse
+import heapq
+import time
+import numpy as np
+from scoring import DEFAULT_BLOCK_SIZE, has_edges, normalize_rows
+from model_store import load_embeddings
+from instrumentation import run_report
+
+N_PROBE = 8  # clusters scanned per query
+RECALL_K = 10
+RECALL_N_PROBES = [1, 2, 4, 8, 16]
+RECALL_SAMPLE_SIZE = 1000  # query artists compared with exhaustive search
+
+# inverted-file (IVF) index for cosine similarity over artist embeddings.
+# vectors are clustered with spherical k-means; a query only scans the n_probe closest clusters,
+# so candidate generation is sub-linear in the number of artists
+class IVFIndex:
+    def __init__(self, centroids, vectors, list_ids, list_offsets, n_probe=N_PROBE):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.n_probe = n_probe
+
+    @property
+    def num_vectors(self):
+        return self.vectors.shape[0]
+
+    @property
+    def num_lists(self):
+        return self.centroids.shape[0]
+
+    # cluster the normalized embeddings and bucket every vector into its closest centroid
+    @classmethod
+    def build(cls, embeddings, n_lists=None, n_probe=N_PROBE, n_iter=10, seed=0):
+        vectors = normalize_rows(embeddings)
+        num_nodes = vectors.shape[0]
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(num_nodes)))
+        n_lists = min(n_lists, num_nodes)
+
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(num_nodes, n_lists, replace=False)].copy()
+
+        for _ in range(n_iter):
+            assign = _assign(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            counts = np.bincount(assign, minlength=n_lists)
+
+            # re-seed empty clusters with random vectors
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = vectors[rng.choice(num_nodes, int(empty.sum()), replace=False)]
+            centroids = normalize_rows(sums)
+
+        assign = _assign(vectors, centroids)
+        list_ids = np.argsort(assign, kind='stable').astype(np.int32)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))]).astype(np.int64)
+
+        return cls(centroids, vectors, list_ids, list_offsets, n_probe=min(n_probe, n_lists))
+
+    # batched k-nearest-neighbour search. returns (indices, scores), both shaped (len(queries), k),
+    # sorted by descending cosine similarity and padded with -1 / -inf if fewer candidates exist
+    def query(self, queries, k, n_probe=None):
+        queries = normalize_rows(np.atleast_2d(queries))
+        n_probe = min(n_probe or self.n_probe, self.num_lists)
+        num_queries = queries.shape[0]
+
+        best_ids = np.full((num_queries, k), -1, dtype=np.int64)
+        best_scores = np.full((num_queries, k), -np.inf, dtype=np.float32)
+
+        # closest clusters per query
+        centroid_scores = queries @ self.centroids.T
+        if n_probe < self.num_lists:
+            probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            probes = np.tile(np.arange(self.num_lists), (num_queries, 1))
+
+        # scan list by list, scoring all queries that probe it in one matmul
+        probe_rows = np.repeat(np.arange(num_queries), n_probe)
+        probe_lists = probes.ravel()
+        order = np.argsort(probe_lists, kind='stable')
+        probe_rows, probe_lists = probe_rows[order], probe_lists[order]
+        bounds = np.searchsorted(probe_lists, np.arange(self.num_lists + 1))
+
+        for lst in range(self.num_lists):
+            rows = probe_rows[bounds[lst]:bounds[lst + 1]]
+            ids = self.list_ids[self.list_offsets[lst]:self.list_offsets[lst + 1]]
+            if len(rows) == 0 or len(ids) == 0:
+                continue
+            scores = queries[rows] @ self.vectors[ids].T
+
+            merged_scores = np.concatenate([best_scores[rows], scores], axis=1)
+            merged_ids = np.concatenate([best_ids[rows], np.broadcast_to(ids, scores.shape)], axis=1)
+            top = np.argsort(-merged_scores, axis=1, kind='stable')[:, :k]
+            best_scores[rows] = np.take_along_axis(merged_scores, top, axis=1)
+            best_ids[rows] = np.take_along_axis(merged_ids, top, axis=1)
+
+        return best_ids, best_scores
+
+    def save(self, path):
+        np.savez(
+            path,
+            centroids=self.centroids,
+            vectors=self.vectors,
+            list_ids=self.list_ids,
+            list_offsets=self.list_offsets,
+            n_probe=self.n_probe,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['centroids'], f['vectors'], f['list_ids'], f['list_offsets'], n_probe=int(f['n_probe']))
+
+# index of the closest centroid for every vector, computed in row blocks
+def _assign(vectors, centroids, block_size=DEFAULT_BLOCK_SIZE):
+    assign = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], block_size):
+        assign[start:start + block_size] = np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+    return assign
+
+# per-artist top-K through the index: yields (start, indices, scores) like scoring.top_k_per_row.
+# self-pairs are dropped, existing edges too if edge_keys is given
+def top_k_per_row_ann(index, k, block_size=DEFAULT_BLOCK_SIZE, edge_keys=None, n_probe=None):
+    num_nodes = index.num_vectors
+    extra = 1 if edge_keys is None else 1 + k  # headroom for candidates that get filtered out
+    for start in range(0, num_nodes, block_size):
+        stop = min(start + block_size, num_nodes)
+        ids, scores = index.query(index.vectors[start:stop], k + extra, n_probe=n_probe)
+
+        rows = np.repeat(np.arange(start, stop), ids.shape[1]).reshape(ids.shape)
+        drop = (ids == rows) | (ids < 0)
+        drop |= has_edges(edge_keys, rows, np.maximum(ids, 0), num_nodes)
+        scores = np.where(drop, -np.inf, scores)
+
+        # stable sort moves dropped candidates to the end
+        order = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+        yield start, np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+# global top-K over unordered pairs (i < j), built from each artist's approximate neighbours.
+# returns a list of (i, j, score) sorted by descending score, like scoring.top_k_pairs
+def top_k_pairs_ann(index, k, neighbours_per_node=10, block_size=DEFAULT_BLOCK_SIZE, edge_keys=None, n_probe=None):
+    heap = []
+    seen = set()
+    for start, ids, scores in top_k_per_row_ann(index, neighbours_per_node, block_size, edge_keys, n_probe):
+        for r in range(ids.shape[0]):
+            i = start + r
+            for j, score in zip(ids[r].tolist(), scores[r].tolist()):
+                if not np.isfinite(score):
+                    continue
+                a, b = min(i, j), max(i, j)
+                if (a, b) in seen:
+                    continue
+                entry = (score, -a, -b)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                    seen.add((a, b))
+                elif entry > heap[0]:
+                    _, old_a, old_b = heapq.heapreplace(heap, entry)
+                    seen.discard((-old_a, -old_b))
+                    seen.add((a, b))
+    return [(-a, -b, score) for score, a, b in sorted(heap, reverse=True)]
+
+# recall of the index against exhaustive search, for a sample of query artists
+def recall_report(index, k=RECALL_K, n_probes=RECALL_N_PROBES, sample_size=RECALL_SAMPLE_SIZE, seed=0):
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(index.num_vectors, min(sample_size, index.num_vectors), replace=False)
+    sample.sort()
+
+    t0 = time.perf_counter()
+    exact = np.argsort(-(index.vectors[sample] @ index.vectors.T), axis=1, kind='stable')[:, :k]
+    exact_time = time.perf_counter() - t0
+
+    report = []
+    for n_probe in n_probes:
+        if n_probe > index.num_lists:
+            continue
+        t0 = time.perf_counter()
+        approx, _ = index.query(index.vectors[sample], k, n_probe=n_probe)
+        elapsed = time.perf_counter() - t0
+
+        hits = sum(len(np.intersect1d(a, e)) for a, e in zip(approx, exact))
+        report.append({
+            'n_probe': n_probe,
+            'recall': hits / (len(sample) * k),
+            'query_time': elapsed,
+            'exact_time': exact_time,
+        })
+        print(f"n_probe {n_probe:3d} | recall@{k}: {report[-1]['recall']:.3f} | "
+              f"{elapsed:.3f}s vs exhaustive {exact_time:.3f}s")
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recall of the IVF index against exhaustive search on saved embeddings")
+    parser.add_argument('model', choices=['graphSAGE', 'node2vec'])
+    parser.add_argument('--k', type=int, default=RECALL_K, help="neighbours per query artist")
+    parser.add_argument('--n-probes', type=int, nargs='+', default=RECALL_N_PROBES, help="clusters scanned per query")
+    parser.add_argument('--n-lists', type=int, default=None, help="clusters of the index (default: sqrt of the artists)")
+    parser.add_argument('--sample-size', type=int, default=RECALL_SAMPLE_SIZE, help="query artists")
+    return parser.parse_args()
+
+def main(args):
+    embeddings, _, _, _ = load_embeddings(args.model)
+    start = time.perf_counter()
+    index = IVFIndex.build(np.asarray(embeddings), n_lists=args.n_lists)
+    print(f"IVF index of {index.num_lists} lists over {index.num_vectors} artists built in {time.perf_counter() - start:.3f}s")
+    recall_report(index, args.k, args.n_probes, args.sample_size)
+
+if __name__ == "__main__":
+    args = parse_args()
+    with run_report('ann_index'):
+        main(args)
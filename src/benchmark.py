@@ -0,0 +1,279 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import time
+import numpy as np
+from crawl_journal import ARTIST_FIELDS
+from graph_store import GraphStore, build_store
+from instrumentation import metrics, timer
+
+SIZES = [1000, 10000, 100000, 1000000]
+PREDICTORS = ['graphSAGE', 'node2vec', 'rules']
+SYNTHETIC_DIR = 'data/synthetic'
+RESULTS_FILE = 'benchmarks/results.json'
+BASELINE_FILE = 'benchmarks/baseline.json'
+AVG_DEGREE = 6  # the shipped graph has about 2,900 collaborations between 1,000 artists
+EPOCHS = 3  # timed training epochs per run
+TOP_K = 10
+EXACT_SCORING_LIMIT = 100000  # above this many artists, embeddings are scored through the ANN index
+TOLERANCE = 0.25  # allowed slowdown against the baseline before a stage counts as a regression
+MIN_SECONDS = 0.05  # stages faster than this are too noisy to compare
+
+GENRES = [
+    'pop', 'dance pop', 'rap', 'hip hop', 'trap', 'r&b', 'rock', 'indie', 'alternative rock', 'edm',
+    'house', 'latin', 'reggaeton', 'k-pop', 'country', 'soul', 'afrobeats', 'drill', 'metal', 'jazz',
+]
+COUNTRIES = ['US', 'GB', 'CA', 'DE', 'FR', 'SE', 'KR', 'JP', 'BR', 'MX', 'ES', 'AU', 'NL', 'NG', 'PR', 'CO', 'IT', 'NO']
+
+# synthetic artists and collaborations with a power-law degree distribution (Chung-Lu model:
+# endpoints are drawn proportionally to heavy-tailed weights) and feature columns distributed
+# like the crawled data. more popular artists get more collaborations, like in the real graph
+def generate_graph(num_nodes, out_dir, avg_degree=AVG_DEGREE, seed=0):
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Spotify-like 22 character base62 IDs
+    alphabet = np.array(list('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'))
+    ids = np.ascontiguousarray(alphabet[rng.integers(0, 62, (num_nodes, 22))]).view('<U22').ravel()
+
+    weights = rng.pareto(1.5, num_nodes) + 1
+    num_rows = num_nodes * avg_degree // 2
+    p = weights / weights.sum()
+    src = rng.choice(num_nodes, num_rows, p=p)
+    dst = rng.choice(num_nodes, num_rows, p=p)
+    pairs = np.unique(np.sort(np.stack([src, dst], axis=1)[src != dst], axis=1), axis=0)
+    rng.shuffle(pairs)
+
+    rank = np.empty(num_nodes)
+    rank[np.argsort(-weights)] = np.arange(num_nodes) / num_nodes
+    followers = (rng.lognormal(13, 1.5, num_nodes) * (1 + 10 * (1 - rank))).astype(np.int64)
+    popularity = np.clip(np.round(100 - 60 * rank + rng.normal(0, 5, num_nodes)), 0, 100).astype(np.int64)
+
+    genre_p = 1 / np.arange(1, len(GENRES) + 1)
+    genre_p /= genre_p.sum()
+    num_genres = rng.choice(4, num_nodes, p=[0.48, 0.17, 0.2, 0.15])  # about half the artists have no genres
+    genre_draws = rng.choice(len(GENRES), (num_nodes, 3), p=genre_p)
+    genres = [', '.join(dict.fromkeys(GENRES[g] for g in row[:k])) for row, k in zip(genre_draws.tolist(), num_genres.tolist())]
+
+    debut = rng.integers(1960, 2025, num_nodes)
+    last_active = np.minimum(debut + rng.geometric(0.08, num_nodes) - 1, 2025)
+    no_albums = rng.random(num_nodes) < 0.07
+    countries = np.array(COUNTRIES)[rng.choice(len(COUNTRIES), num_nodes)]
+    cities = np.char.add('City ', rng.zipf(1.6, num_nodes).clip(max=5000).astype(str))
+
+    artists = pd.DataFrame({
+        'id': ids,
+        'name': np.char.add('Artist ', np.arange(num_nodes).astype(str)),
+        'followers': followers,
+        'genres': genres,
+        'popularity': popularity,
+        'num_albums': np.where(no_albums, 0, rng.integers(1, 26, num_nodes)),
+        'debut_year': np.where(no_albums, None, debut),
+        'last_active_year': np.where(no_albums, None, last_active),
+        'active_years': np.where(no_albums, None, last_active - debut + 1),
+        'country': np.where(rng.random(num_nodes) < 0.09, None, countries),
+        'begin_area': np.where(rng.random(num_nodes) < 0.1, None, cities),
+    }, columns=ARTIST_FIELDS)
+    artists.to_csv(os.path.join(out_dir, 'artists.csv'), index=False)
+    pd.DataFrame({'artist_1': ids[pairs[:, 0]], 'artist_2': ids[pairs[:, 1]]}).to_csv(
+        os.path.join(out_dir, 'collaborations.csv'), index=False)
+
+# directory of the synthetic graph with num_nodes artists, generated on first use
+def synthetic_graph(num_nodes, seed=0):
+    out_dir = os.path.join(SYNTHETIC_DIR, f'{num_nodes}-{seed}')
+    if not os.path.exists(os.path.join(out_dir, 'collaborations.csv')):
+        print(f"Generating synthetic graph with {num_nodes} artists...")
+        generate_graph(num_nodes, out_dir, seed=seed)
+    return out_dir
+
+# time a benchmark stage. the label keeps it apart from the timers inside the predictors
+def stage(name):
+    return timer(name, run='benchmark')
+
+# {stage: (seconds, peak RSS in MB)} of the stages timed so far in this process
+def stage_totals():
+    return {name: (entry['total'], entry['peak_rss_mb'])
+            for (name, labels), entry in metrics.timers.items() if dict(labels).get('run') == 'benchmark'}
+
+def run_graphsage(store, out_dir, epochs):
+    import graphSAGE
+
+    with stage('graph_build'):
+        data = graphSAGE.load_graph_data(store)
+        model = graphSAGE.GraphSAGE(in_channels=data.num_node_features, hidden_channels=32, out_channels=16)
+    with stage('training'):
+        graphSAGE.train(model, data, epochs=epochs)
+    with stage('scoring'):
+        backend = 'exact' if store.num_nodes <= EXACT_SCORING_LIMIT else 'ann'
+        ranking = graphSAGE.compute_ranking(graphSAGE.embed(model, data), TOP_K, backend=backend)
+    with stage('csv_write'):
+        graphSAGE.PREDICTIONS_FILE = os.path.join(out_dir, 'graphSAGE.csv')
+        graphSAGE.write_ranking(data, ranking, store.names.tolist())
+
+def run_node2vec(store, out_dir, epochs):
+    import node2vec
+    from scoring import build_edge_keys
+
+    with stage('graph_build'):
+        connected, id_map, pairs = node2vec.load_graph(store)
+        existing = build_edge_keys(pairs[:, 0], pairs[:, 1], len(connected))
+        model = node2vec.build_model(pairs, len(connected))
+    with stage('walk_corpus'):
+        loader = node2vec.corpus_loader(store, connected, id_map, corpus_dir=os.path.join(out_dir, 'walks'))
+    with stage('training'):
+        node2vec.fit(model, loader, epochs)
+    with stage('scoring'):
+        node2vec.SCORING_BACKEND = 'exact' if len(connected) <= EXACT_SCORING_LIMIT else 'ann'
+        top_links = node2vec.score_pairs(node2vec.get_embeddings(model), existing, node2vec.TOP_K)
+    with stage('csv_write'):
+        node2vec.PREDICTIONS_FILE = os.path.join(out_dir, 'node2vec.csv')
+        node2vec.write_predictions(top_links, store.names[connected])
+
+# the rule query of logical_knowledge.py, computed in-process by the sparse rule engine
+def run_rules(store, out_dir, epochs):
+    from rule_engine import DEFAULT_WEIGHTS, RuleEngine, write_predictions
+
+    with stage('graph_build'):
+        engine = RuleEngine(store)
+    with stage('scoring'):
+        columns = engine.predict(DEFAULT_WEIGHTS, top_k=TOP_K, per_artist=True)
+    with stage('csv_write'):
+        write_predictions(store, columns, os.path.join(out_dir, 'logical_rules.csv'))
+
+RUNNERS = {'graphSAGE': run_graphsage, 'node2vec': run_node2vec, 'rules': run_rules}
+
+# one predictor on one graph. runs in its own process, so peak RSS belongs to this run alone
+def _run(predictor, graph_dir, epochs, results):
+    import resource
+
+    metrics.start_memory_sampler()
+    result = {'predictor': predictor, 'status': 'ok'}
+    work_dir = os.path.join(graph_dir, f'run-{predictor}')
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    try:
+        # load: parse the CSVs into a fresh graph store
+        with stage('load'):
+            build_store(os.path.join(graph_dir, 'artists.csv'), os.path.join(graph_dir, 'collaborations.csv'),
+                        os.path.join(work_dir, 'store'))
+            store = GraphStore(os.path.join(work_dir, 'store'))
+        result.update(num_nodes=store.num_nodes, num_edges=store.num_edges)
+        RUNNERS[predictor](store, work_dir, epochs)
+    except ImportError as e:
+        result.update(status='skipped', reason=str(e))
+    except MemoryError as e:
+        result.update(status='failed', reason=f"out of memory: {e}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    totals = stage_totals()
+    result['stages'] = {name: seconds for name, (seconds, _) in totals.items()}
+    result['stage_peak_rss_mb'] = {name: peak for name, (_, peak) in totals.items()}
+    if 'training' in result['stages']:
+        result['epoch_time'] = result['stages']['training'] / epochs
+    # ru_maxrss is in kilobytes on Linux
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put(result)
+
+def run_benchmarks(sizes=SIZES, predictors=PREDICTORS, epochs=EPOCHS, seed=0):
+    ctx = multiprocessing.get_context('spawn')
+    runs = []
+    for num_nodes in sizes:
+        graph_dir = synthetic_graph(num_nodes, seed)
+        for predictor in predictors:
+            results = ctx.Queue()
+            proc = ctx.Process(target=_run, args=(predictor, graph_dir, epochs, results))
+            proc.start()
+            proc.join()
+            if proc.exitcode != 0:
+                result = {'predictor': predictor, 'num_nodes': num_nodes, 'status': 'failed',
+                          'reason': f"exit code {proc.exitcode}", 'stages': {}}
+            else:
+                result = results.get()
+            result['size'] = num_nodes
+            runs.append(result)
+            print_run(result)
+    return {
+        'created_at': time.time(),
+        'machine': {'platform': platform.platform(), 'python': sys.version.split()[0], 'cpus': os.cpu_count()},
+        'epochs': epochs,
+        'runs': runs,
+    }
+
+def print_run(run):
+    label = f"{run['predictor']:>9} @ {run['size']:>7}"
+    if run['status'] != 'ok':
+        print(f"{label} | {run['status']}: {run.get('reason', '')}")
+        return
+    stages = ' | '.join(f"{name} {seconds:.2f}s" for name, seconds in run['stages'].items())
+    epoch = f" | {run['epoch_time']:.2f}s/epoch" if 'epoch_time' in run else ''
+    print(f"{label} | {stages}{epoch} | peak RSS {run['peak_rss_mb']:.0f} MB")
+
+# stages and peak memory that got slower or bigger than the baseline by more than `tolerance`
+def find_regressions(report, baseline, tolerance=TOLERANCE):
+    base_runs = {(run['predictor'], run['size']): run for run in baseline['runs'] if run['status'] == 'ok'}
+    regressions = []
+    for run in report['runs']:
+        base = base_runs.get((run['predictor'], run['size']))
+        if base is None:
+            continue
+        if run['status'] != 'ok':
+            regressions.append(f"{run['predictor']} @ {run['size']}: {run['status']} ({run.get('reason', '')})")
+            continue
+        checks = [(name, seconds, base['stages'].get(name), 's') for name, seconds in run['stages'].items()]
+        checks.append(('peak_rss', run['peak_rss_mb'], base['peak_rss_mb'], ' MB'))
+        for name, value, base_value, unit in checks:
+            if base_value is None or (unit == 's' and max(value, base_value) < MIN_SECONDS):
+                continue
+            if value > base_value * (1 + tolerance):
+                regressions.append(f"{run['predictor']} @ {run['size']}: {name} {value:.2f}{unit} "
+                                   f"vs baseline {base_value:.2f}{unit} (+{value / base_value - 1:.0%})")
+    return regressions
+
+def write_json(path, report):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Synthetic scale-out benchmark of the three predictors")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="numbers of artists")
+    parser.add_argument('--predictors', nargs='+', default=PREDICTORS, choices=PREDICTORS)
+    parser.add_argument('--epochs', type=int, default=EPOCHS, help="timed training epochs")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=RESULTS_FILE, help="JSON results file")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="results to compare against")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="allowed relative slowdown")
+    parser.add_argument('--update-baseline', action='store_true', help="store these results as the new baseline")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    report = run_benchmarks(args.sizes, args.predictors, args.epochs, args.seed)
+    write_json(args.output, report)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        write_json(args.baseline, report)
+        print(f"Baseline updated: {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --update-baseline to create one.")
+        return
+
+    with open(args.baseline, encoding='utf-8') as f:
+        regressions = find_regressions(report, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print("No regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import time
+import numpy as np
+from instrumentation import count, gauge, run_report, timer
+from populate_neo4j import ARTISTS_FILE, ATTRIBUTES, COLLABORATIONS_FILE
+
+EXPORT_DIR = 'data/.neo4j_import'
+CHUNK_ROWS = 1000000  # CSV rows read, and written per output file, at once
+IMPORT_DIR = '/import'  # where the export directory is mounted in the Neo4j container
+INT_COLUMNS = ['followers', 'popularity', 'num_albums', 'debut_year', 'last_active_year', 'active_years']
+STRING_COLUMNS = ['id', 'name', 'genres', 'country', 'begin_area']
+
+# neo4j-admin header rows. artists keep the same properties and types populate_neo4j.py writes
+HEADERS = {
+    'artists': ['id:ID(Artist)', 'name', 'followers:long', 'genres', 'popularity:long', 'num_albums:long',
+                'debut_year:long', 'last_active_year:long', 'active_years:long', 'country', 'begin_area'],
+    'collaborations': [':START_ID(Artist)', ':END_ID(Artist)'],
+}
+for column, (label, key, relationship) in ATTRIBUTES.items():
+    HEADERS[label.lower()] = [f'{key}:ID({label})']
+    HEADERS[relationship.lower()] = [':START_ID(Artist)', f':END_ID({label})']
+
+# numbered part files of one node or relationship file, each at most CHUNK_ROWS rows, plus the
+# header file neo4j-admin reads the columns from
+class PartWriter:
+    def __init__(self, out_dir, name, compress=False):
+        self.out_dir = out_dir
+        self.name = name
+        self.compress = compress
+        self.files = [os.path.join(out_dir, f'{name}_header.csv')]
+        self.rows = 0
+        with open(self.files[0], 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerow(HEADERS[name])
+
+    # write one chunk of already formatted CSV text into the next part file
+    def write(self, text, num_rows):
+        if not num_rows:
+            return
+        path = os.path.join(self.out_dir, f'{self.name}-{len(self.files) - 1:04d}.csv' + ('.gz' if self.compress else ''))
+        data = text.encode('utf-8')
+        if self.compress:
+            # level 1: the import is bounded by disk throughput, not by saving the last few percent
+            with gzip.open(path, 'wb', compresslevel=1) as f:
+                f.write(data)
+        else:
+            with open(path, 'wb') as f:
+                f.write(data)
+        self.files.append(path)
+        self.rows += num_rows
+        count('bulk_rows_written', num_rows, file=self.name)
+
+# rows of (start, end) ID pairs as CSV text. Spotify IDs are base62, so no quoting is needed
+def id_pairs(start, end):
+    return ''.join(f'{a},{b}\n' for a, b in zip(start.tolist(), end.tolist()))
+
+# CSV text of column arrays. strings are always quoted, so empty ones are imported as empty
+# strings instead of missing properties; numbers are not
+def csv_rows(*columns):
+    text = io.StringIO()
+    csv.writer(text, quoting=csv.QUOTE_NONNUMERIC, lineterminator='\n').writerows(zip(*(c.tolist() for c in columns)))
+    return text.getvalue()
+
+# ascending unique values of an int64 array. sorting is faster than np.unique's hashing for keys
+def sorted_unique(keys):
+    keys = np.sort(keys)
+    return keys[np.concatenate([[True], keys[1:] != keys[:-1]])] if len(keys) else keys
+
+# stream the artists into node files. returns the artist IDs in node order and the attribute
+# links (node index, value) of the normalized model
+def export_artists(artists_file, out_dir, compress=False, normalized=False, chunk_rows=CHUNK_ROWS):
+    import pandas as pd
+
+    # like the MERGE ... SET of populate_neo4j.py, the last row of a duplicated ID sets the properties,
+    # while the attributes of every row are linked. a first pass over the IDs alone finds the last rows
+    all_ids = pd.read_csv(artists_file, usecols=['id'], dtype=str, keep_default_na=False)['id']
+    last = ~all_ids.duplicated(keep='last').to_numpy()
+    ids = all_ids.to_numpy()[last]
+    node_of_row = pd.Index(ids).get_indexer(all_ids)
+
+    nodes = PartWriter(out_dir, 'artists', compress)
+    links = {column: [] for column in ATTRIBUTES}
+    offset = 0
+    # numbers are parsed by the C parser, missing ones become 0 as in populate_neo4j.artist_params
+    reader = pd.read_csv(artists_file, dtype={column: str for column in STRING_COLUMNS}, keep_default_na=False,
+                         na_values={column: [''] for column in INT_COLUMNS}, chunksize=chunk_rows)
+    for chunk in reader:
+        chunk_last = last[offset:offset + len(chunk)]
+        kept = chunk[chunk_last]
+        columns = [header.split(':')[0] for header in HEADERS['artists']]
+        nodes.write(csv_rows(*(kept[column].fillna(0).to_numpy(dtype=np.int64) if column in INT_COLUMNS
+                               else kept[column].to_numpy() for column in columns)), len(kept))
+
+        if normalized:
+            chunk = chunk.reset_index(drop=True)
+            rows = node_of_row[offset:offset + len(chunk)]
+            # same values as populate_neo4j.artist_attributes: stripped, distinct, non-empty genres
+            genres = chunk['genres'].str.split(',').explode().str.strip()
+            genres = pd.DataFrame({'row': rows[genres.index.to_numpy()], 'value': genres.to_numpy()})
+            links['genres'].append(genres[genres['value'] != ''])
+            for column in ['country', 'begin_area']:
+                has_value = (chunk[column] != '').to_numpy()
+                links[column].append(pd.DataFrame({'row': rows[has_value], 'value': chunk[column].to_numpy()[has_value]}))
+        offset += len(chunk)
+
+    print(f"Exported {nodes.rows} artists into {len(nodes.files) - 1} files")
+    return ids, nodes, links
+
+# stream the collaborations into relationship files. rows with unknown artists are dropped and
+# repeated (artist_1, artist_2) rows are written once, like the MATCH ... MERGE of populate_neo4j.py;
+# only an int64 key per collaboration is kept in memory
+def export_collaborations(collaborations_file, ids, out_dir, compress=False, chunk_rows=CHUNK_ROWS):
+    import pandas as pd
+
+    index = pd.Index(ids)
+    num_nodes = len(ids)
+    keys = []
+    for chunk in pd.read_csv(collaborations_file, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+        a1 = index.get_indexer(chunk['artist_1'])
+        a2 = index.get_indexer(chunk['artist_2'])
+        known = (a1 >= 0) & (a2 >= 0)
+        keys.append(a1[known].astype(np.int64) * num_nodes + a2[known])
+    keys = sorted_unique(np.concatenate(keys)) if keys else np.empty(0, dtype=np.int64)
+
+    relationships = PartWriter(out_dir, 'collaborations', compress)
+    for start in range(0, len(keys), chunk_rows):
+        block = keys[start:start + chunk_rows]
+        relationships.write(id_pairs(ids[block // num_nodes], ids[block % num_nodes]), len(block))
+    print(f"Exported {relationships.rows} collaborations into {len(relationships.files) - 1} files")
+    return relationships
+
+# Genre, Country and City node and relationship files of the normalized model
+def export_attributes(links, ids, out_dir, compress=False, chunk_rows=CHUNK_ROWS):
+    import pandas as pd
+
+    writers = []
+    for column, (label, key, relationship) in ATTRIBUTES.items():
+        # duplicated artists and repeated genres link to the same node once, like MERGE
+        column_links = pd.concat(links[column]).drop_duplicates() if links[column] else pd.DataFrame({'row': [], 'value': []})
+        values = np.sort(column_links['value'].unique().astype(str))
+        nodes = PartWriter(out_dir, label.lower(), compress)
+        rels = PartWriter(out_dir, relationship.lower(), compress)
+        for start in range(0, len(values), chunk_rows):
+            block = values[start:start + chunk_rows]
+            nodes.write(csv_rows(block), len(block))
+        for start in range(0, len(column_links), chunk_rows):
+            block = column_links.iloc[start:start + chunk_rows]
+            rels.write(csv_rows(ids[block['row'].to_numpy(dtype=np.int64)], block['value'].to_numpy()), len(block))
+        print(f"Exported {nodes.rows} {label} nodes and {rels.rows} {relationship} relationships")
+        writers.append((label, nodes, relationship, rels))
+    return writers
+
+# neo4j-admin command importing the export, with paths as seen inside the container
+def import_command(manifest, import_dir=IMPORT_DIR, database='neo4j'):
+    def files(entry):
+        return ','.join(f"{import_dir}/{os.path.basename(path)}" for path in entry['files'])
+
+    args = ['neo4j-admin', 'database', 'import', 'full', '--overwrite-destination']
+    args += [f"--nodes={label}={files(entry)}" for label, entry in manifest['nodes'].items()]
+    args += [f"--relationships={rel_type}={files(entry)}" for rel_type, entry in manifest['relationships'].items()]
+    return ' '.join(args + [database])
+
+# export both CSV files into neo4j-admin import files in out_dir (replaced), and write a
+# manifest.json with the files and row counts of every label and relationship type
+def export(artists_file=ARTISTS_FILE, collaborations_file=COLLABORATIONS_FILE, out_dir=EXPORT_DIR, compress=False,
+           normalized=False, chunk_rows=CHUNK_ROWS):
+    start = time.perf_counter()
+    tmp = out_dir + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    with timer('bulk_export', kind='artists'):
+        ids, artists, links = export_artists(artists_file, tmp, compress, normalized, chunk_rows)
+    with timer('bulk_export', kind='collaborations'):
+        collaborations = export_collaborations(collaborations_file, ids, tmp, compress, chunk_rows)
+    manifest = {
+        'nodes': {'Artist': {'files': artists.files, 'rows': artists.rows}},
+        'relationships': {'COLLABORATED_WITH': {'files': collaborations.files, 'rows': collaborations.rows}},
+    }
+    if normalized:
+        with timer('bulk_export', kind='attributes'):
+            for label, nodes, relationship, rels in export_attributes(links, ids, tmp, compress, chunk_rows):
+                manifest['nodes'][label] = {'files': nodes.files, 'rows': nodes.rows}
+                manifest['relationships'][relationship] = {'files': rels.files, 'rows': rels.rows}
+
+    # paths relative to the export directory, which is renamed into place last
+    for entry in [*manifest['nodes'].values(), *manifest['relationships'].values()]:
+        entry['files'] = [os.path.basename(path) for path in entry['files']]
+    manifest.update(compressed=compress, normalized=normalized, artists_file=artists_file,
+                    collaborations_file=collaborations_file)
+    with open(os.path.join(tmp, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.rename(tmp, out_dir)
+
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(os.path.getsize(os.path.join(out_dir, name)) for name in os.listdir(out_dir))
+    gauge('bulk_export_mb_per_second', total_bytes / 2**20 / max(elapsed, 1e-9))
+    print(f"Export took {elapsed:.1f}s ({total_bytes / 2**20:.1f} MB, {total_bytes / 2**20 / max(elapsed, 1e-9):.0f} MB/s)")
+    return manifest
+
+def load_manifest(out_dir=EXPORT_DIR):
+    with open(os.path.join(out_dir, 'manifest.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+# compare the node and relationship counts of the running database with the manifest of the
+# export it was imported from. returns the mismatches as {name: (expected, actual)}
+def verify_counts(manifest):
+    from neo4j_client import get_driver
+
+    mismatches = {}
+    with get_driver().session() as session:
+        for label, entry in manifest['nodes'].items():
+            actual = session.run(f"MATCH (n:{label}) RETURN count(n) AS n").single()['n']
+            print(f"{label:>18} | {entry['rows']:>10} exported | {actual:>10} in Neo4j")
+            if actual != entry['rows']:
+                mismatches[label] = (entry['rows'], actual)
+        for rel_type, entry in manifest['relationships'].items():
+            actual = session.run(f"MATCH ()-[r:{rel_type}]->() RETURN count(r) AS n").single()['n']
+            print(f"{rel_type:>18} | {entry['rows']:>10} exported | {actual:>10} in Neo4j")
+            if actual != entry['rows']:
+                mismatches[rel_type] = (entry['rows'], actual)
+    return mismatches
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the CSV files as neo4j-admin bulk-import files")
+    parser.add_argument('--artists', default=ARTISTS_FILE)
+    parser.add_argument('--collaborations', default=COLLABORATIONS_FILE)
+    parser.add_argument('--output', default=EXPORT_DIR, help="export directory, replaced on every export")
+    parser.add_argument('--compress', action='store_true', help="gzip the part files")
+    parser.add_argument('--normalized', action='store_true', help="also export Genre, Country and City nodes")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="rows per part file")
+    parser.add_argument('--verify', action='store_true',
+                        help="only compare the counts in Neo4j with the last export, after importing it")
+    return parser.parse_args()
+
+def main(args):
+    if args.verify:
+        mismatches = verify_counts(load_manifest(args.output))
+        if mismatches:
+            raise SystemExit(f"Counts differ from the export: {mismatches}")
+        print("All node and relationship counts match the export.")
+        return
+
+    manifest = export(args.artists, args.collaborations, args.output, args.compress, args.normalized, args.chunk_rows)
+    print("Import with the database stopped, e.g.:")
+    print(f"  docker compose stop neo4j && docker compose run --rm neo4j {import_command(manifest)}")
+    print("then start it, run `python src/populate_neo4j.py --constraints-only` and check the counts with --verify.")
+
+if __name__ == "__main__":
+    args = parse_args()
+    with run_report('bulk_export'):
+        main(args)
@@ -0,0 +1,82 @@
+import argparse
+import os
+import runpy
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# command -> (script in src/, description). a script is only imported when its command runs, so
+# --help and the numpy-only commands never load torch, pandas, scipy or a database driver
+COMMANDS = {
+    'crawl': ('load_spotify_data', "crawl artists and collaborations from Spotify and MusicBrainz"),
+    'neo4j': ('populate_neo4j', "load the CSV files into Neo4j"),
+    'rules': ('logical_knowledge', "logical rule predictions through Neo4j (or --backend sparse)"),
+    'sparse-rules': ('rule_engine', "logical rule predictions in-process, without Neo4j"),
+    'tune': ('tune_rules', "grid search over the rule weights"),
+    'graphsage': ('graphSAGE', "train GraphSAGE and rank collaborations"),
+    'node2vec': ('node2vec', "train node2vec and rank collaborations"),
+    'predict': ('predict', "rank collaborations from saved embeddings, without torch"),
+    'quantize': ('quantize', "size, speed and accuracy of quantized embeddings"),
+    'ann-recall': ('ann_index', "recall of the approximate nearest-neighbour index on saved embeddings"),
+    'bulk-export': ('bulk_export', "export the CSV files as neo4j-admin bulk-import files"),
+    'neo4j-benchmark': ('neo4j_benchmark', "rule query time and db hits of both Neo4j graph models"),
+    'serve': ('query_service', "collaboration query service over HTTP"),
+    'pipeline': ('pipeline', "run the stages as a DAG, skipping unchanged ones"),
+    'benchmark': ('benchmark', "scale-out benchmark on synthetic graphs"),
+    'graph-store': ('graph_store', "compile the CSV files into the graph store"),
+}
+HEAVY_MODULES = ['torch', 'torch_geometric', 'pandas', 'scipy', 'neo4j', 'spotipy', 'musicbrainzngs', 'requests']
+
+# run a command's script as if it was started directly, with the remaining arguments
+def run_command(command, args):
+    module = COMMANDS[command][0]
+    sys.argv = [sys.argv[0], *args]  # argv[0] becomes the script's path
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+
+# import time of every command's script and the heavy libraries it loads, each in a fresh
+# interpreter, plus the wall time of `<command> --help` through this entry point
+def startup_report(commands=COMMANDS):
+    probe = ("import sys, time; start = time.perf_counter(); import {module}; "
+             "print(time.perf_counter() - start, ','.join(m for m in {heavy!r} if m in sys.modules))")
+    report = {}
+    for command in commands:
+        module = COMMANDS[command][0]
+        result = subprocess.run([sys.executable, '-c', probe.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=SRC_DIR, capture_output=True, text=True)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(SRC_DIR, 'cli.py'), command, '--help'], capture_output=True)
+        help_seconds = time.perf_counter() - start
+
+        if result.returncode != 0:
+            error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}"
+            report[command] = {'error': error, 'help_seconds': help_seconds}
+            print(f"{command:>12} | import failed: {error}")
+            continue
+        seconds, _, loaded = result.stdout.strip().rpartition('\n')[2].partition(' ')
+        report[command] = {'import_seconds': float(seconds), 'help_seconds': help_seconds,
+                           'heavy_modules': loaded.split(',') if loaded else []}
+        print(f"{command:>12} | import {float(seconds) * 1000:6.0f} ms | --help {help_seconds * 1000:6.0f} ms | "
+              f"loads {loaded or '-'}")
+    return report
+
+def parse_args(argv=None):
+    epilog = '\n'.join(f"  {name:<14}{description}" for name, (_, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        description="Collaboration prediction commands. Run '<command> --help' for the options of a command.",
+        epilog=f"commands:\n{epilog}\n  {'startup':<14}import time of every command",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=[*COMMANDS, 'startup'], metavar='command')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="arguments of the command")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.command == 'startup':
+        startup_report(COMMANDS if not args.args else args.args)
+    else:
+        run_command(args.command, args.args)
+
+if __name__ == "__main__":
+    main()
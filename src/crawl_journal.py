@@ -0,0 +1,162 @@
+import csv
+import hashlib
+import os
+import sqlite3
+import numpy as np
+from graph_store import open_store
+
+JOURNAL_FILE = 'data/crawl_journal.sqlite'
+FLUSH_ROWS = 1000  # buffered rows written to the CSVs at once
+TAIL_BYTES = 4096
+
+ARTIST_FIELDS = [
+    'id', 'name', 'followers', 'genres', 'popularity',
+    'num_albums', 'debut_year', 'last_active_year', 'active_years', 'country', 'begin_area'
+]
+COLLABORATION_FIELDS = ['artist_1', 'artist_2']
+
+# crash-safe, resumable writer for the crawl output.
+# rows are buffered and appended to the CSVs in batches. checkpoint() fsyncs both CSVs and then
+# commits, in one SQLite transaction, their byte sizes together with the artists processed and
+# the collaboration pairs seen since the last checkpoint. on open, the CSVs are truncated back
+# to the last checkpoint, so rows of unfinished work are neither duplicated nor lost: the
+# affected artists are simply not marked processed and get crawled again
+class CrawlJournal:
+    def __init__(self, artists_file, collaborations_file, path=JOURNAL_FILE, flush_rows=FLUSH_ROWS):
+        self.artists_file = artists_file
+        self.collaborations_file = collaborations_file
+        self.flush_rows = flush_rows
+        self.pending_artists = []
+        self.pending_collaborations = []
+        self.pending_processed = set()
+        self.pending_pairs = set()
+
+        self.db = sqlite3.connect(path)
+        # journals from before the tail hashes cannot tell a replaced CSV from the checkpointed
+        # one. dropping their sizes makes the journal rebuild itself from the CSVs
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(files)")]
+        if columns and 'tail' not in columns:
+            self.db.execute("DROP TABLE files")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER NOT NULL, tail TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS processed (artist_id TEXT PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS pairs (artist_1 TEXT, artist_2 TEXT, PRIMARY KEY (artist_1, artist_2)) WITHOUT ROWID;
+        """)
+
+        _ensure_header(artists_file, ARTIST_FIELDS)
+        _ensure_header(collaborations_file, COLLABORATION_FIELDS)
+        if not self._restore():
+            self._bootstrap()
+
+        self.artists_out = open(artists_file, 'a', newline='', encoding='utf-8')
+        self.collaborations_out = open(collaborations_file, 'a', newline='', encoding='utf-8')
+        self.artists_writer = csv.DictWriter(self.artists_out, fieldnames=ARTIST_FIELDS)
+        self.collaborations_writer = csv.writer(self.collaborations_out)
+
+    # truncate the CSVs to their checkpointed sizes. returns False if there is no usable checkpoint,
+    # e.g. because a file is shorter than recorded or was replaced by a different one
+    def _restore(self):
+        checkpoints = {name: (size, tail) for name, size, tail in self.db.execute("SELECT name, size, tail FROM files")}
+        files = [self.artists_file, self.collaborations_file]
+        for f in files:
+            if f not in checkpoints or os.path.getsize(f) < checkpoints[f][0]:
+                return False
+            if _tail_hash(f, checkpoints[f][0]) != checkpoints[f][1]:
+                return False
+        sizes = {f: checkpoints[f][0] for f in files}
+        for f in files:
+            if os.path.getsize(f) > sizes[f]:
+                print(f"Dropping rows of {f} written after the last checkpoint.")
+                with open(f, 'r+b') as out:
+                    out.truncate(sizes[f])
+        return True
+
+    # rebuild the journal from the CSVs, e.g. on first use or after they were edited by hand.
+    # artists that appear as artist_1 of a collaboration count as processed
+    def _bootstrap(self):
+        print("Rebuilding crawl journal from the CSV files...")
+        store = open_store(self.artists_file, self.collaborations_file)
+        pair_ids = np.sort(store.ids[store.edges], axis=1)
+        with self.db:
+            self.db.execute("DELETE FROM processed")
+            self.db.execute("DELETE FROM pairs")
+            self.db.executemany("INSERT OR IGNORE INTO pairs VALUES (?, ?)", map(tuple, pair_ids.tolist()))
+            self.db.executemany("INSERT OR IGNORE INTO processed VALUES (?)",
+                                ((a,) for a in set(store.ids[store.edges[:, 0]].tolist())))
+            self._record_sizes()
+
+    def _record_sizes(self):
+        rows = []
+        for f in [self.artists_file, self.collaborations_file]:
+            size = os.path.getsize(f)
+            rows.append((f, size, _tail_hash(f, size)))
+        self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", rows)
+
+    def is_processed(self, artist_id):
+        if artist_id in self.pending_processed:
+            return True
+        return self.db.execute("SELECT 1 FROM processed WHERE artist_id = ?", (artist_id,)).fetchone() is not None
+
+    def has_pair(self, artist_1, artist_2):
+        pair = tuple(sorted([artist_1, artist_2]))
+        if pair in self.pending_pairs:
+            return True
+        return self.db.execute("SELECT 1 FROM pairs WHERE artist_1 = ? AND artist_2 = ?", pair).fetchone() is not None
+
+    def add_artist(self, artist):
+        self.pending_artists.append(artist)
+        if len(self.pending_artists) >= self.flush_rows:
+            self.flush()
+
+    # append a collaboration unless the pair is already known. returns True if it was added
+    def add_collaboration(self, artist_1, artist_2):
+        if self.has_pair(artist_1, artist_2):
+            return False
+        pair = tuple(sorted([artist_1, artist_2]))
+        self.pending_pairs.add(pair)
+        self.pending_collaborations.append(pair)
+        if len(self.pending_collaborations) >= self.flush_rows:
+            self.flush()
+        return True
+
+    def mark_processed(self, artist_id):
+        self.pending_processed.add(artist_id)
+
+    # write buffered rows to the CSVs, without making them durable yet
+    def flush(self):
+        self.artists_writer.writerows(self.pending_artists)
+        self.collaborations_writer.writerows(self.pending_collaborations)
+        self.pending_artists.clear()
+        self.pending_collaborations.clear()
+        self.artists_out.flush()
+        self.collaborations_out.flush()
+
+    # make everything written so far durable and record it in the journal
+    def checkpoint(self):
+        self.flush()
+        os.fsync(self.artists_out.fileno())
+        os.fsync(self.collaborations_out.fileno())
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO processed VALUES (?)", ((a,) for a in self.pending_processed))
+            self.db.executemany("INSERT OR IGNORE INTO pairs VALUES (?, ?)", self.pending_pairs)
+            self._record_sizes()
+        self.pending_processed.clear()
+        self.pending_pairs.clear()
+
+    def close(self):
+        self.checkpoint()
+        self.artists_out.close()
+        self.collaborations_out.close()
+        self.db.close()
+
+# hash of the last TAIL_BYTES before `size`, to recognize the checkpointed file again
+def _tail_hash(path, size):
+    with open(path, 'rb') as f:
+        f.seek(max(0, size - TAIL_BYTES))
+        return hashlib.sha1(f.read(min(size, TAIL_BYTES))).hexdigest()
+
+# write the CSV header if the file is missing or empty
+def _ensure_header(path, fields):
+    if not os.path.exists(path) or os.stat(path).st_size == 0:
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerow(fields)
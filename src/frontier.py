@@ -0,0 +1,130 @@
+import csv
+import json
+import os
+import sqlite3
+import time
+from crawl_journal import ARTIST_FIELDS, COLLABORATION_FIELDS
+
+FRONTIER_FILE = 'data/crawl_frontier.sqlite'
+CLAIM_TIMEOUT = 15 * 60  # claims older than this are assumed to belong to a crashed worker
+
+QUEUED, CLAIMED, DONE = 0, 1, 2
+
+# persistent crawl frontier shared by several worker processes.
+# every artist ever discovered has one row, so the table doubles as the visited set.
+# workers claim batches in IMMEDIATE transactions, so no artist is handed out twice,
+# and store each batch's results in the same transaction that marks it done
+class CrawlFrontier:
+    def __init__(self, path=FRONTIER_FILE, max_depth=3, max_nodes=100000, order='bfs'):
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.order = order
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS frontier (
+                artist_id TEXT PRIMARY KEY,
+                depth INTEGER NOT NULL,
+                priority REAL NOT NULL,
+                state INTEGER NOT NULL,
+                claimed_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS frontier_queue ON frontier (state, priority DESC);
+            CREATE TABLE IF NOT EXISTS artists (id TEXT PRIMARY KEY, info TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS collaborations (
+                artist_1 TEXT, artist_2 TEXT, PRIMARY KEY (artist_1, artist_2)
+            ) WITHOUT ROWID;
+        """)
+
+    # queue priority: breadth-first by depth, or most popular discovering artist first
+    def _priority(self, depth, popularity):
+        return -depth if self.order == 'bfs' else (popularity or 0)
+
+    # enqueue (artist_id, popularity) pairs found at `depth`. already discovered artists are only
+    # re-prioritized while still queued, never queued again
+    def _push(self, artists, depth):
+        if depth > self.max_depth:
+            return
+        self.db.executemany("""
+            INSERT INTO frontier (artist_id, depth, priority, state) VALUES (?, ?, ?, ?)
+            ON CONFLICT (artist_id) DO UPDATE SET priority = max(priority, excluded.priority)
+            WHERE state = ?
+        """, [(a, depth, self._priority(depth, p), QUEUED, QUEUED) for a, p in artists])
+
+    def seed(self, artists):
+        self.db.execute("BEGIN IMMEDIATE")
+        self._push(artists, 0)
+        self.db.execute("COMMIT")
+
+    # claim up to n queued artists as (artist_id, depth). returns [] once the node cap is reached
+    def claim(self, n):
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            # hand claims of crashed workers out again
+            self.db.execute("UPDATE frontier SET state = ? WHERE state = ? AND claimed_at < ?",
+                            (QUEUED, CLAIMED, now - CLAIM_TIMEOUT))
+            taken = self.db.execute("SELECT COUNT(*) FROM frontier WHERE state != ?", (QUEUED,)).fetchone()[0]
+            n = min(n, self.max_nodes - taken)
+            if n <= 0:
+                self.db.execute("COMMIT")
+                return []
+            rows = self.db.execute(
+                "SELECT artist_id, depth FROM frontier WHERE state = ? ORDER BY priority DESC, rowid LIMIT ?",
+                (QUEUED, n)).fetchall()
+            self.db.executemany("UPDATE frontier SET state = ?, claimed_at = ? WHERE artist_id = ?",
+                                [(CLAIMED, now, a) for a, _ in rows])
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return rows
+
+    # store the results of a claimed batch and enqueue the collaborators.
+    # results: (artist_id, depth, artist info row or None, [(collaborator_id, popularity)])
+    def complete(self, results):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            for artist_id, depth, info, collaborators in results:
+                if info is not None:
+                    self.db.execute("INSERT OR REPLACE INTO artists VALUES (?, ?)", (artist_id, json.dumps(info)))
+                self.db.executemany("INSERT OR IGNORE INTO collaborations VALUES (?, ?)",
+                                    [tuple(sorted([artist_id, c])) for c, _ in collaborators])
+                self._push(collaborators, depth + 1)
+                self.db.execute("UPDATE frontier SET state = ? WHERE artist_id = ?", (DONE, artist_id))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    # True while there is queued work below the node cap, or claimed work that may add more
+    def has_work(self):
+        counts = dict(self.db.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state").fetchall())
+        below_cap = counts.get(CLAIMED, 0) + counts.get(DONE, 0) < self.max_nodes
+        return (counts.get(QUEUED, 0) > 0 and below_cap) or counts.get(CLAIMED, 0) > 0
+
+    def stats(self):
+        counts = dict(self.db.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state").fetchall())
+        return {'queued': counts.get(QUEUED, 0), 'claimed': counts.get(CLAIMED, 0), 'done': counts.get(DONE, 0)}
+
+    # write the crawled artists and the collaborations between them as the pipeline CSVs
+    def export(self, artists_file, collaborations_file):
+        infos = (json.loads(info) for info, in self.db.execute("SELECT info FROM artists ORDER BY rowid"))
+        _write_csv(artists_file, ARTIST_FIELDS, ([info.get(field) for field in ARTIST_FIELDS] for info in infos))
+        _write_csv(collaborations_file, COLLABORATION_FIELDS, self.db.execute("""
+            SELECT c.artist_1, c.artist_2 FROM collaborations c
+            JOIN artists a1 ON a1.id = c.artist_1
+            JOIN artists a2 ON a2.id = c.artist_2
+        """))
+
+    def close(self):
+        self.db.close()
+
+# write a CSV through a temporary file, so readers never see a half-written one
+def _write_csv(path, header, rows):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    os.replace(tmp, path)
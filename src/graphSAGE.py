@@ -1,41 +1,45 @@
 
-import csv
+import argparse
+import multiprocessing
+import os
+import time
+import numpy as np
 import torch
-import pandas as pd
 import torch.nn.functional as F
 from torch_geometric.data import Data
 from torch_geometric.nn import SAGEConv
 from torch_geometric.utils import negative_sampling
+from graph_store import open_store
+from scoring import build_edge_keys, top_k_for_rows
+from ann_index import N_PROBE, IVFIndex, top_k_per_row_ann
+from incremental import DELTA_HOPS, GraphDelta, load_checkpoint, save_checkpoint
+from model_store import save_embeddings
+from predict import predict, write_per_artist
+from instrumentation import observe, run_report, timed, timer
 
 ARTISTS_FILE = 'data/artists.csv'
 COLLABORATIONS_FILE = 'data/collaborations.csv'
 PREDICTIONS_FILE = 'predictions/graphSAGE.csv'
+RANKING_BLOCK_SIZE = 1024  # rows of the similarity matrix scored at once
+TOP_K = 10
+MODEL_NAME = 'graphSAGE'
+FINETUNE_EPOCHS = 5  # epochs of a warm-started incremental update
+FINETUNE_LR = 0.005
+NUM_LAYERS = 2  # SAGEConv layers of GraphSAGE, each samples its own fanout
 
-# load torch_geometric Data
-def load_graph_data():
-    artists = pd.read_csv(ARTISTS_FILE)
-    collaborations = pd.read_csv(COLLABORATIONS_FILE)
+# load torch_geometric Data from the compiled graph store
+def load_graph_data(store=None):
+    store = store or open_store(ARTISTS_FILE, COLLABORATIONS_FILE)
 
-    # map artist IDs to node indices
-    id_to_index = {artist_id: idx for idx, artist_id in enumerate(artists["id"])}
+    # build edge_index tensor, both directions of every collaboration row
+    edges = torch.from_numpy(store.edges).long()
+    edge_index = torch.stack([edges, edges.flip(1)], dim=1).reshape(-1, 2).t().contiguous()
 
-    # build edge_index tensor
-    edges = []
-    for _, row in collaborations.iterrows():
-        a1 = id_to_index.get(row['artist_1'])
-        a2 = id_to_index.get(row['artist_2'])
-        if a1 is not None and a2 is not None:
-            edges.append([a1, a2])
-            edges.append([a2, a1])  # ensure bi-directional edges
+    # normalize real features
+    artist_features = np.nan_to_num(store.features, nan=0.0)
+    artist_features = (artist_features - artist_features.mean(axis=0)) / artist_features.std(axis=0, ddof=1)
 
-    edge_index = torch.tensor(edges, dtype=torch.long).t().contiguous()
-
-    # select and normalize real features
-    feature_cols = ['followers', 'popularity', 'num_albums', 'debut_year', 'last_active_year', 'active_years']
-    artist_features = artists[feature_cols].fillna(0)
-    artist_features = (artist_features - artist_features.mean()) / artist_features.std()
-
-    x = torch.tensor(artist_features.values, dtype=torch.float)
+    x = torch.tensor(artist_features, dtype=torch.float)
 
     return Data(x=x, edge_index=edge_index)
 
@@ -56,6 +60,7 @@ def train(model, data, epochs=100, lr=0.01):
     optimizer = torch.optim.Adam(model.parameters(), lr=lr)
 
     for epoch in range(epochs):
+        epoch_start = time.perf_counter()
         model.train()
         optimizer.zero_grad()
 
@@ -82,57 +87,258 @@ def train(model, data, epochs=100, lr=0.01):
         loss = F.binary_cross_entropy_with_logits(scores, labels)
         loss.backward()
         optimizer.step()
+        observe('train_samples_per_second', scores.numel() / (time.perf_counter() - epoch_start), model=MODEL_NAME)
 
         if epoch % 10 == 0 or epoch == epochs - 1:
             print(f"Epoch {epoch:3d} | Loss: {loss.item():.4f}")
 
-# evaluate, then print output to CSV
-def rank_collaborations(model, data, top_k=10, artists=None, artist_ids=None, existing_collabs=None):
-    model.eval()
-    out = model(data.x, data.edge_index)
-
-    # normalize embeddings to unit vectors
-    out = F.normalize(out, p=2, dim=1)
+# mini-batch training on link-level neighbour samples.
+# each batch holds batch_size positive edges plus half as many negatives, and the subgraph
+# reached by sampling num_neighbors[l] neighbours per node for SAGEConv layer l,
+# so memory is bounded by the batch and fan-outs instead of by the whole graph
+def train_minibatch(model, data, epochs=100, lr=0.01, num_neighbors=(10, 10), batch_size=1024, num_workers=None):
+    from torch_geometric.loader import LinkNeighborLoader
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 0
+
+    loader = LinkNeighborLoader(
+        data,
+        num_neighbors=list(num_neighbors),
+        edge_label_index=data.edge_index,
+        neg_sampling=dict(mode='binary', amount=0.5),
+        batch_size=batch_size,
+        shuffle=True,
+        num_workers=num_workers,
+        persistent_workers=num_workers > 0,
+    )
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
 
-    # cosine similarity = dot product after normalization
-    scores = torch.matmul(out, out.t())
-    scores.fill_diagonal_(-float('inf'))
+    for epoch in range(epochs):
+        epoch_start = time.perf_counter()
+        model.train()
+        total_loss = 0
+        total_examples = 0
 
-    top_k_scores, top_k_indices = torch.topk(scores, top_k, dim=1)
+        for batch in loader:
+            optimizer.zero_grad()
+            out = model(batch.x, batch.edge_index)
 
-    collaborations = []
+            # edge_label_index holds both the positive and the sampled negative edges
+            src, dst = batch.edge_label_index
+            scores = (out[src] * out[dst]).sum(dim=1)
 
-    for i in range(scores.size(0)):
-        for j, score in zip(top_k_indices[i], top_k_scores[i]):
-            id1 = artist_ids[i]
-            id2 = artist_ids[j.item()]
-            pair = frozenset([id1, id2])
-            if existing_collabs is None or pair not in existing_collabs:
-                collaborations.append([artists[i], artists[j.item()], score.item()])
+            loss = F.binary_cross_entropy_with_logits(scores, batch.edge_label)
+            loss.backward()
+            optimizer.step()
 
-    with open(PREDICTIONS_FILE, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(["Artist 1", "Artist 2", "Score"])
-        writer.writerows(collaborations)
+            total_loss += loss.item() * scores.numel()
+            total_examples += scores.numel()
+        observe('train_samples_per_second', total_examples / (time.perf_counter() - epoch_start), model=MODEL_NAME)
 
-    print(f"Collaborations saved to {PREDICTIONS_FILE}")
+        if epoch % 10 == 0 or epoch == epochs - 1:
+            print(f"Epoch {epoch:3d} | Loss: {total_loss / total_examples:.4f}")
 
-def main():
-    artists_df = pd.read_csv(ARTISTS_FILE)
-    artist_names = artists_df["name"].tolist()
-    artist_ids = artists_df["id"].tolist()
-    collabs_df = pd.read_csv(COLLABORATIONS_FILE)
-    existing_collabs = {frozenset([a, b]) for a, b in zip(collabs_df["artist_1"], collabs_df["artist_2"])}
+# run a few epochs of one training mode and report seconds per epoch and peak RSS.
+# runs in its own process so the peak memory of one mode does not hide the other
+def _profile_training(mini_batch, epochs, minibatch_kwargs, results):
+    import resource
 
     data = load_graph_data()
+    model = GraphSAGE(in_channels=data.num_node_features, hidden_channels=32, out_channels=16)
+
+    start = time.perf_counter()
+    if mini_batch:
+        train_minibatch(model, data, epochs=epochs, **minibatch_kwargs)
+    else:
+        train(model, data, epochs=epochs)
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put((elapsed / epochs, peak_mb))
+
+# epoch time and peak memory of full-batch vs mini-batch training
+def compare_training(epochs=5, **minibatch_kwargs):
+    ctx = multiprocessing.get_context('spawn')
+    report = {}
+
+    for name, mini_batch in [('full-batch', False), ('mini-batch', True)]:
+        results = ctx.Queue()
+        proc = ctx.Process(target=_profile_training, args=(mini_batch, epochs, minibatch_kwargs, results))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0:
+            print(f"{name} training failed with exit code {proc.exitcode}")
+            continue
+        epoch_time, peak_mb = results.get()
+        report[name] = {'epoch_time': epoch_time, 'peak_rss_mb': peak_mb}
+
+    for name, row in report.items():
+        print(f"{name:>10} | {row['epoch_time']:.3f}s / epoch | peak RSS {row['peak_rss_mb']:.1f} MB")
+    return report
+
+# exact per-artist top-K in row blocks: yields (start, indices, scores) as numpy arrays
+def exact_top_k_blocks(out, top_k, block_size):
+    num_nodes = out.size(0)
+    for start in range(0, num_nodes, block_size):
+        stop = min(start + block_size, num_nodes)
+
+        # cosine similarity = dot product after normalization
+        scores = torch.matmul(out[start:stop], out.t())
+        rows = torch.arange(stop - start)
+        scores[rows, rows + start] = -float('inf')
+
+        top_k_scores, top_k_indices = torch.topk(scores, top_k, dim=1)
+        yield start, top_k_indices.numpy(), top_k_scores.numpy()
+
+# unit-length node embeddings of the trained model
+def embed(model, data):
+    model.eval()
+    with torch.no_grad():
+        out = model(data.x, data.edge_index)
+    return F.normalize(out, p=2, dim=1)
+
+# evaluate, then stream output to CSV one row block at a time
+# peak memory is O(block_size x num_nodes) instead of the dense num_nodes x num_nodes score matrix.
+# backend 'ann' searches candidates through an IVF index, scanning n_probe clusters per artist,
+# instead of scoring every artist.
+# returns the ranking as (indices, scores) arrays of shape (num_nodes, top_k), before exclusions
+def rank_collaborations(model, data, top_k=TOP_K, artists=None, block_size=RANKING_BLOCK_SIZE, exclude_existing=True, backend='exact',
+                        n_probe=N_PROBE):
+    ranking = compute_ranking(embed(model, data), top_k, block_size, backend, n_probe)
+    write_ranking(data, ranking, artists, block_size, exclude_existing)
+    return ranking
+
+# per-artist top-K of normalized embeddings as (indices, scores) arrays of shape (num_nodes, top_k)
+@timed('scoring', model=MODEL_NAME)
+def compute_ranking(out, top_k=TOP_K, block_size=RANKING_BLOCK_SIZE, backend='exact', n_probe=N_PROBE):
+    num_nodes = out.size(0)
+    if backend == 'ann':
+        blocks = top_k_per_row_ann(IVFIndex.build(out.numpy(), n_probe=n_probe), top_k, block_size=block_size)
+    else:
+        blocks = exact_top_k_blocks(out, top_k, block_size)
+
+    indices = np.full((num_nodes, top_k), -1, dtype=np.int64)
+    scores = np.full((num_nodes, top_k), -np.inf, dtype=np.float32)
+    for start, top_k_indices, top_k_scores in blocks:
+        stop = start + top_k_indices.shape[0]
+        indices[start:stop, :top_k_indices.shape[1]] = top_k_indices
+        scores[start:stop, :top_k_scores.shape[1]] = top_k_scores
+    return indices, scores
+
+# stream a ranking to the predictions CSV, dropping candidates that already collaborated
+def write_ranking(data, ranking, artists, block_size=RANKING_BLOCK_SIZE, exclude_existing=True):
+    indices, scores = ranking
+    num_nodes = indices.shape[0]
+
+    # integer-keyed sorted edge index of existing collaborations
+    edge_keys = None
+    if exclude_existing:
+        edge_keys = build_edge_keys(data.edge_index[0].numpy(), data.edge_index[1].numpy(), num_nodes)
+    with timer('csv_write', model=MODEL_NAME):
+        write_per_artist(indices, scores, artists, edge_keys, PREDICTIONS_FILE, block_size)
+
+# warm-started update after the crawler added collaborations: fine-tune the last checkpoint for a
+# few epochs, then re-rank only the artists near changed edges and keep the other rankings.
+# returns the new ranking, or None if there is no usable checkpoint
+def update_incrementally(model, data, store, top_k=TOP_K, epochs=FINETUNE_EPOCHS, hops=DELTA_HOPS,
+                         block_size=RANKING_BLOCK_SIZE):
+    checkpoint = load_checkpoint(MODEL_NAME)
+    if checkpoint is None or checkpoint['ranking'][0].shape[1] != top_k:
+        print("No matching checkpoint, training from scratch.")
+        return None
+    model.load_state_dict(checkpoint['state_dict'])
+
+    delta = GraphDelta(store, checkpoint['ids'], checkpoint['edges'], hops)
+    print(f"Graph delta: {delta.summary()}")
+    if not delta.is_empty:
+        with timer('training', model=MODEL_NAME):
+            train(model, data, epochs=epochs, lr=FINETUNE_LR)
+
+    # previous rankings, moved to the current node indices
+    old_indices, old_scores = checkpoint['ranking']
+    indices = np.full((store.num_nodes, top_k), -1, dtype=np.int64)
+    scores = np.full((store.num_nodes, top_k), -np.inf, dtype=np.float32)
+    kept = delta.remap >= 0
+    moved = old_indices[kept]
+    indices[delta.remap[kept]] = np.where(moved >= 0, delta.remap[np.maximum(moved, 0)], -1)
+    scores[delta.remap[kept]] = old_scores[kept]
+
+    # re-rank affected artists and those whose ranking lost a removed artist
+    lost = ((old_indices[kept] >= 0) & (indices[delta.remap[kept]] < 0)).any(axis=1)
+    stale = delta.affected.copy()
+    stale[delta.remap[kept][lost]] = True
+    rows = np.flatnonzero(stale)
+    print(f"Re-ranking {len(rows)} of {store.num_nodes} artists")
+
+    out = embed(model, data).numpy()
+    with timer('scoring', model=MODEL_NAME):
+        for block_rows, top_k_indices, top_k_scores in top_k_for_rows(out, rows, top_k, block_size):
+            indices[block_rows] = -1
+            scores[block_rows] = -np.inf
+            indices[block_rows, :top_k_indices.shape[1]] = top_k_indices
+            scores[block_rows, :top_k_scores.shape[1]] = top_k_scores
+    return indices, scores
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="GraphSAGE link prediction")
+    parser.add_argument('--mini-batch', action='store_true', help="train on neighbour-sampled mini-batches")
+    parser.add_argument('--fanout', type=int, nargs='+', default=[10] * NUM_LAYERS,
+                        help=f"neighbours sampled per SAGEConv layer, {NUM_LAYERS} values")
+    parser.add_argument('--batch-size', type=int, default=1024, help="positive edges per mini-batch")
+    parser.add_argument('--num-workers', type=int, default=None, help="sampling worker processes (default: all cores)")
+    parser.add_argument('--compare-training', action='store_true', help="only compare epoch time and memory of both training modes")
+    parser.add_argument('--incremental', action='store_true', help="fine-tune the last checkpoint and only re-rank artists near new collaborations")
+    parser.add_argument('--finetune-epochs', type=int, default=FINETUNE_EPOCHS, help="epochs of an incremental update")
+    parser.add_argument('--predict-only', action='store_true', help="rank the saved embeddings without training")
+    parser.add_argument('--top-k', type=int, default=TOP_K, help="candidates per artist")
+    parser.add_argument('--backend', choices=['exact', 'ann'], default='exact',
+                        help="score every artist, or only each artist's approximate nearest neighbours from an IVF index")
+    parser.add_argument('--n-probe', type=int, default=N_PROBE, help="IVF clusters scanned per artist with --backend ann")
+    args = parser.parse_args()
+    if len(args.fanout) != NUM_LAYERS:
+        parser.error(f"--fanout needs one value per SAGEConv layer ({NUM_LAYERS}), got {len(args.fanout)}")
+    return args
+
+def main(args):
+    if args.compare_training:
+        compare_training(num_neighbors=args.fanout, batch_size=args.batch_size, num_workers=args.num_workers)
+        return
+    if args.predict_only:
+        predict(MODEL_NAME, args.top_k)
+        return
+
+    with timer('load', model=MODEL_NAME):
+        store = open_store(ARTISTS_FILE, COLLABORATIONS_FILE)
+        data = load_graph_data(store)
+    artist_names = store.names.tolist()
     print(f"Graph loaded: {data.num_nodes} nodes, {data.num_edges} edges")
 
     model = GraphSAGE(in_channels=data.num_node_features, hidden_channels=32, out_channels=16)
 
-    train(model, data)
+    ranking = None
+    if args.incremental:
+        ranking = update_incrementally(model, data, store, top_k=args.top_k, epochs=args.finetune_epochs)
+        if ranking is not None:
+            write_ranking(data, ranking, artist_names)
+
+    if ranking is None:
+        with timer('training', model=MODEL_NAME):
+            if args.mini_batch:
+                train_minibatch(model, data, num_neighbors=args.fanout, batch_size=args.batch_size, num_workers=args.num_workers)
+            else:
+                train(model, data)
+        ranking = rank_collaborations(model, data, top_k=args.top_k, artists=artist_names, backend=args.backend,
+                                      n_probe=args.n_probe)
 
-    rank_collaborations(model, data, top_k=10, artists=artist_names, artist_ids=artist_ids, existing_collabs=existing_collabs)
+    with timer('save', model=MODEL_NAME):
+        save_checkpoint(MODEL_NAME, model.state_dict(), store.ids, store.edges, ranking)
+        save_embeddings(MODEL_NAME, embed(model, data).numpy(), store.ids, store.names,
+                        ranking='per_artist', top_k=args.top_k, predictions_file=PREDICTIONS_FILE, graph_store=store.path)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    with run_report(MODEL_NAME):
+        main(args)
\ No newline at end of file
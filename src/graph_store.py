@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from instrumentation import timer
+
+ARTISTS_FILE = 'data/artists.csv'
+COLLABORATIONS_FILE = 'data/collaborations.csv'
+STORE_DIR = 'data/.graph_store'
+
+# bump when the on-disk layout changes, so old stores get rebuilt
+STORE_VERSION = 1
+
+FEATURE_COLUMNS = ['followers', 'popularity', 'num_albums', 'debut_year', 'last_active_year', 'active_years']
+
+# compiled, memory-mapped view of the artist and collaboration CSVs.
+# node indices follow the row order of the artists CSV
+class GraphStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        # copy-on-write maps: zero-copy for reads, writable so torch.from_numpy accepts them
+        def load(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='c')
+
+        self.ids = load('ids')
+        self.names = load('names')
+        self.features = load('features')           # (num_nodes, len(FEATURE_COLUMNS)) float64, column-major, NaN = missing
+        self.edges = load('edges')                 # (num_rows, 2) int32, collaborations CSV rows in file order
+        self.indptr = load('indptr')               # CSR adjacency of the undirected, deduplicated graph
+        self.indices = load('indices')
+        self.genre_indptr = load('genre_indptr')   # per-artist genre tokens, as split by Neo4j's split(genres, ',')
+        self.genre_indices = load('genre_indices')
+        self.genre_vocab = load('genre_vocab')
+        self.country = load('country')             # index into country_vocab, -1 = missing
+        self.country_vocab = load('country_vocab')
+        self.city = load('city')                   # index into city_vocab (begin_area), -1 = missing
+        self.city_vocab = load('city_vocab')
+        self._id_to_index = None
+
+    @property
+    def num_nodes(self):
+        return len(self.ids)
+
+    @property
+    def num_edges(self):
+        return len(self.indices) // 2
+
+    def feature(self, name):
+        return self.features[:, FEATURE_COLUMNS.index(name)]
+
+    def degree(self):
+        return np.diff(self.indptr)
+
+    def neighbours(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    # boolean mask of the seed nodes and every node within `hops` collaborations of them
+    def k_hop(self, seeds, hops):
+        mask = np.zeros(self.num_nodes, dtype=bool)
+        mask[seeds] = True
+        frontier = np.flatnonzero(mask)
+        for _ in range(hops):
+            if len(frontier) == 0:
+                break
+            reached = np.concatenate([self.neighbours(node) for node in frontier.tolist()])
+            frontier = np.unique(reached[~mask[reached]])
+            mask[frontier] = True
+        return mask
+
+    # node index of a Spotify artist ID, or None if it is unknown
+    def index_of(self, artist_id):
+        if self._id_to_index is None:
+            self._id_to_index = {artist_id: idx for idx, artist_id in enumerate(self.ids.tolist())}
+        return self._id_to_index.get(artist_id)
+
+    # both directions of the undirected graph as int64 (src, dst) arrays
+    def coo(self):
+        src = np.repeat(np.arange(self.num_nodes, dtype=np.int64), self.degree())
+        return src, self.indices.astype(np.int64)
+
+# sha256 over the input files and the store layout version
+def content_hash(*files):
+    h = hashlib.sha256(f'graph-store-v{STORE_VERSION}'.encode())
+    for file in files:
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    return h.hexdigest()[:16]
+
+# map string values to vocabulary indices; missing or empty values become -1
+def _encode(values):
+    import pandas as pd
+
+    codes, vocab = pd.factorize(values.where(values != '', None))
+    return codes.astype(np.int32), np.asarray(vocab, dtype=str)
+
+# compile the CSVs into a store directory
+def build_store(artists_file, collaborations_file, path):
+    # pandas is only needed to compile a store, not to read one
+    import pandas as pd
+
+    # read strings verbatim like the csv module does, so e.g. country code 'NA' is not a missing value
+    artists = pd.read_csv(artists_file, dtype=str, keep_default_na=False)
+    collaborations = pd.read_csv(collaborations_file, dtype=str, keep_default_na=False)
+    num_nodes = len(artists)
+
+    # map collaboration rows to node indices, dropping unknown artists
+    index = pd.Index(artists['id'])
+    a1 = index.get_indexer(collaborations['artist_1'])
+    a2 = index.get_indexer(collaborations['artist_2'])
+    known = (a1 >= 0) & (a2 >= 0)
+    edges = np.stack([a1[known], a2[known]], axis=1).astype(np.int32)
+
+    # symmetric, deduplicated CSR adjacency
+    src = np.concatenate([edges[:, 0], edges[:, 1]]).astype(np.int64)
+    dst = np.concatenate([edges[:, 1], edges[:, 0]]).astype(np.int64)
+    keys = np.unique(src * num_nodes + dst)
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(keys // num_nodes, minlength=num_nodes))]).astype(np.int64)
+    indices = (keys % num_nodes).astype(np.int32)
+
+    # genre tokens exactly as Neo4j splits the stored string, including '' for no genres
+    tokens = artists['genres'].str.split(',')
+    genre_indptr = np.concatenate([[0], np.cumsum(tokens.str.len())]).astype(np.int64)
+    genre_codes, genre_vocab = pd.factorize(tokens.explode())
+
+    country, country_vocab = _encode(artists['country'])
+    city, city_vocab = _encode(artists['begin_area'])
+
+    # write into a temporary directory and rename, so readers never see a half-built store.
+    # the directory is per process, so processes compiling the same store do not write into each other
+    tmp = f'{path}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    arrays = {
+        'ids': np.asarray(artists['id'], dtype=str),
+        'names': np.asarray(artists['name'], dtype=str),
+        'features': np.asfortranarray(artists[FEATURE_COLUMNS].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)),
+        'edges': edges,
+        'indptr': indptr,
+        'indices': indices,
+        'genre_indptr': genre_indptr,
+        'genre_indices': genre_codes.astype(np.int32),
+        'genre_vocab': np.asarray(genre_vocab, dtype=str),
+        'country': country,
+        'country_vocab': country_vocab,
+        'city': city,
+        'city_vocab': city_vocab,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f'{name}.npy'), array)
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': STORE_VERSION,
+            'artists_file': artists_file,
+            'collaborations_file': collaborations_file,
+            'feature_columns': FEATURE_COLUMNS,
+            'num_nodes': num_nodes,
+            'num_edges': len(indices) // 2,
+        }, f, indent=2)
+
+    # another process may have finished the same (identical) store in the meantime
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            raise
+
+# open the store for the given CSVs, compiling it first if the inputs changed
+def open_store(artists_file=ARTISTS_FILE, collaborations_file=COLLABORATIONS_FILE, store_dir=STORE_DIR):
+    path = os.path.join(store_dir, content_hash(artists_file, collaborations_file))
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        print(f"Compiling graph store {path}...")
+        os.makedirs(store_dir, exist_ok=True)
+        with timer('graph_store_compile'):
+            build_store(artists_file, collaborations_file, path)
+        _remove_stale(store_dir, path, artists_file, collaborations_file)
+    return GraphStore(path)
+
+# delete older stores compiled from the same input files
+def _remove_stale(store_dir, current, artists_file, collaborations_file):
+    for name in os.listdir(store_dir):
+        path = os.path.join(store_dir, name)
+        if path == current or '.tmp' in name or not os.path.isdir(path):
+            continue
+        try:
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta.get('artists_file') == artists_file and meta.get('collaborations_file') == collaborations_file:
+            shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == "__main__":
+    store = open_store()
+    print(f"Graph store {store.path}: {store.num_nodes} nodes, {store.num_edges} edges")
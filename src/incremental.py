@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import torch
+from model_store import model_path
+
+DELTA_HOPS = 2  # artists this many collaborations away from a changed edge count as affected
+
+# state of the last training run, needed to warm-start the next one
+def checkpoint_path(name):
+    return os.path.join(model_path(name), 'checkpoint.pt')
+
+# save model weights, the artist IDs of the node indices, the training edges (node index pairs)
+# and the ranking that was written, so the next run can work out what changed
+def save_checkpoint(name, state_dict, ids, edges, ranking):
+    os.makedirs(model_path(name), exist_ok=True)
+    path = checkpoint_path(name)
+    torch.save({
+        'state_dict': state_dict,
+        'ids': np.asarray(ids),
+        'edges': np.asarray(edges),
+        'ranking': ranking,
+    }, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+# the last checkpoint of a model, or None if it was never trained
+def load_checkpoint(name):
+    path = checkpoint_path(name)
+    if not os.path.exists(path):
+        return None
+    return torch.load(path, weights_only=False)
+
+# difference between the graph of a checkpoint and the current graph store.
+# remap maps old node indices to store indices (-1 = artist removed),
+# affected marks store nodes within `hops` of an added or removed edge, and new artists.
+# `nodes` masks the store nodes a model embeds (e.g. only connected artists for node2vec); the
+# others are neither new nor affected
+class GraphDelta:
+    def __init__(self, store, old_ids, old_edges, hops=DELTA_HOPS, nodes=None):
+        n = store.num_nodes
+        nodes = np.ones(n, dtype=bool) if nodes is None else np.asarray(nodes, dtype=bool)
+
+        # old artist IDs -> store indices
+        order = np.argsort(store.ids)
+        pos = np.searchsorted(store.ids[order], old_ids)
+        pos[pos == n] = 0
+        found = store.ids[order][pos] == old_ids
+        self.remap = np.where(found, order[pos], -1)
+
+        self.new_nodes = nodes.copy()
+        self.new_nodes[self.remap[found]] = False
+
+        # undirected edge keys in store index space
+        old = self.remap[old_edges]
+        removed_node = (old < 0).any(axis=1)
+        old_keys = _pair_keys(old[~removed_node], n)
+        new_keys = _pair_keys(store.edges, n)
+        changed = np.concatenate([np.setdiff1d(new_keys, old_keys), np.setdiff1d(old_keys, new_keys)])
+
+        # endpoints of changed edges, including the surviving side of edges to removed artists
+        seeds = np.concatenate([changed // n, changed % n, old[removed_node].ravel()])
+        seeds = np.unique(seeds[seeds >= 0])
+        self.num_changed_edges = len(changed) + int(removed_node.sum())
+        self.affected = (store.k_hop(seeds, hops) | self.new_nodes) & nodes
+
+    @property
+    def is_empty(self):
+        return self.num_changed_edges == 0 and not self.new_nodes.any()
+
+    def summary(self):
+        return (f"{self.num_changed_edges} changed edges, {int(self.new_nodes.sum())} new artists, "
+                f"{int(self.affected.sum())} affected artists")
+
+# unique a * n + b keys of undirected (a, b) pairs, with a <= b
+def _pair_keys(pairs, num_nodes):
+    pairs = np.sort(np.asarray(pairs, dtype=np.int64), axis=1)
+    return np.unique(pairs[:, 0] * num_nodes + pairs[:, 1])
@@ -0,0 +1,221 @@
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+REPORTS_DIR = os.environ.get('PIPELINE_REPORTS', 'reports')
+PROFILE = os.environ.get('PIPELINE_PROFILE')  # 'cprofile' or 'torch' captures a profile of the whole run
+MEMORY_SAMPLE_INTERVAL = 0.1  # seconds between RSS samples
+METRIC_PREFIX = 'spotifycollabs_'
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# resident set size of this process in MB
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / (1 << 20)
+    except OSError:
+        return peak_rss_mb()
+
+# peak resident set size of this process so far in MB. ru_maxrss is in kilobytes on Linux;
+# without the resource module (Windows) this is the highest RSS the memory sampler has seen
+def peak_rss_mb():
+    if resource is None:
+        return metrics.peak_sampled_mb
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# metric name plus sorted labels, e.g. ('api_calls', (('api', 'Spotify'),))
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+# process-wide timers, counters, gauges and samples. thread-safe, so crawler workers and
+# HTTP handler threads can record into the same registry
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timers = {}    # key -> {'count', 'total', 'max', 'peak_rss_mb'}
+        self.counters = {}  # key -> value
+        self.gauges = {}    # key -> value
+        self.samples = {}   # key -> {'count', 'sum', 'min', 'max', 'last'}
+        self.active_peaks = {}  # running stages -> highest RSS sampled while they run
+        self.sampler = None
+        self.peak_sampled_mb = 0.0
+
+    # time a block of code. nested and concurrent timers are fine
+    @contextmanager
+    def timer(self, name, **labels):
+        token = object()
+        with self.lock:
+            self.active_peaks[token] = current_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                peak = max(self.active_peaks.pop(token), current_rss_mb())
+                timer = self.timers.setdefault(_key(name, labels), {'count': 0, 'total': 0.0, 'max': 0.0, 'peak_rss_mb': 0.0})
+                timer['count'] += 1
+                timer['total'] += elapsed
+                timer['max'] = max(timer['max'], elapsed)
+                timer['peak_rss_mb'] = max(timer['peak_rss_mb'], peak)
+
+    # decorator version of timer(); the name defaults to the function name
+    def timed(self, name=None, **labels):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name or fn.__name__, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    # record one observation, e.g. the samples/sec of an epoch
+    def observe(self, name, value, **labels):
+        with self.lock:
+            sample = self.samples.setdefault(_key(name, labels), {'count': 0, 'sum': 0.0, 'min': value, 'max': value, 'last': value})
+            sample['count'] += 1
+            sample['sum'] += value
+            sample['min'] = min(sample['min'], value)
+            sample['max'] = max(sample['max'], value)
+            sample['last'] = value
+
+    # sample RSS in a background thread, so stages record their peak memory
+    def start_memory_sampler(self, interval=MEMORY_SAMPLE_INTERVAL):
+        if self.sampler is not None:
+            return
+
+        def sample():
+            while True:
+                rss = current_rss_mb()
+                with self.lock:
+                    self.peak_sampled_mb = max(self.peak_sampled_mb, rss)
+                    for token, peak in self.active_peaks.items():
+                        self.active_peaks[token] = max(peak, rss)
+                time.sleep(interval)
+
+        self.sampler = threading.Thread(target=sample, daemon=True)
+        self.sampler.start()
+
+    def report(self):
+        def entries(table):
+            return [dict(name=name, labels=dict(labels), **({'value': value} if not isinstance(value, dict) else value))
+                    for (name, labels), value in sorted(table.items())]
+
+        with self.lock:
+            return {
+                'timers': entries(self.timers),
+                'counters': entries(self.counters),
+                'gauges': entries(self.gauges),
+                'samples': entries(self.samples),
+                'peak_rss_mb': max(self.peak_sampled_mb, peak_rss_mb()),
+            }
+
+    # Prometheus text exposition format
+    def prometheus(self):
+        families = {}  # metric name -> (type, [(suffix, labels, value)])
+
+        def add(name, kind, suffix, labels, value):
+            families.setdefault(METRIC_PREFIX + name, (kind, []))[1].append((suffix, labels, value))
+
+        with self.lock:
+            for (name, labels), timer in self.timers.items():
+                add(f'{name}_seconds', 'summary', '_sum', labels, timer['total'])
+                add(f'{name}_seconds', 'summary', '_count', labels, timer['count'])
+                add(f'{name}_seconds_max', 'gauge', '', labels, timer['max'])
+                add(f'{name}_peak_rss_megabytes', 'gauge', '', labels, timer['peak_rss_mb'])
+            for (name, labels), value in self.counters.items():
+                add(f'{name}_total', 'counter', '', labels, value)
+            for (name, labels), value in self.gauges.items():
+                add(name, 'gauge', '', labels, value)
+            for (name, labels), sample in self.samples.items():
+                add(name, 'summary', '_sum', labels, sample['sum'])
+                add(name, 'summary', '_count', labels, sample['count'])
+                add(f'{name}_last', 'gauge', '', labels, sample['last'])
+            add('peak_rss_megabytes', 'gauge', '', (), max(self.peak_sampled_mb, peak_rss_mb()))
+
+        lines = []
+        for name, (kind, rows) in sorted(families.items()):
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in sorted(rows, key=lambda row: (row[1], row[0])):
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{name}{suffix}{{{label_text}}} {value}" if labels else f"{name}{suffix} {value}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+timer = metrics.timer
+timed = metrics.timed
+count = metrics.count
+gauge = metrics.gauge
+observe = metrics.observe
+
+# capture a cProfile or torch.profiler profile of the block, written next to the run reports
+@contextmanager
+def profiled(name, kind=PROFILE, reports_dir=REPORTS_DIR):
+    if kind not in ('cprofile', 'torch'):
+        yield
+        return
+
+    os.makedirs(reports_dir, exist_ok=True)
+    if kind == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = os.path.join(reports_dir, f'{name}.prof')
+            profiler.dump_stats(path)
+            print(f"cProfile stats written to {path}")
+    else:
+        import torch
+
+        with torch.profiler.profile(record_shapes=True, profile_memory=True) as profiler:
+            yield
+        path = os.path.join(reports_dir, f'{name}.trace.json')
+        profiler.export_chrome_trace(path)
+        print(f"torch profiler trace written to {path}")
+
+def write_reports(name, reports_dir=REPORTS_DIR, **info):
+    os.makedirs(reports_dir, exist_ok=True)
+    report = dict(run=name, finished_at=time.time(), **info, **metrics.report())
+    with open(os.path.join(reports_dir, f'{name}.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    with open(os.path.join(reports_dir, f'{name}.prom'), 'w', encoding='utf-8') as f:
+        f.write(metrics.prometheus())
+    return report
+
+# instrument a whole script run: memory sampling, optional profiling (PIPELINE_PROFILE),
+# and a JSON + Prometheus report in REPORTS_DIR at the end, also when the run fails
+@contextmanager
+def run_report(name):
+    metrics.start_memory_sampler()
+    start = time.perf_counter()
+    status = 'failed'
+    try:
+        with profiled(name):
+            yield metrics
+        status = 'ok'
+    finally:
+        elapsed = time.perf_counter() - start
+        report = write_reports(name, status=status, wall_time=elapsed)
+        print(f"Run report written to {os.path.join(REPORTS_DIR, name)}.json/.prom "
+              f"({elapsed:.1f}s, peak RSS {report['peak_rss_mb']:.0f} MB)")
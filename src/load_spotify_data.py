@@ -1,30 +1,168 @@
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-import csv
+import argparse
+import multiprocessing
 import os
+import threading
 import time
-import musicbrainzngs
-import pandas as pd
+from crawl_journal import CrawlJournal
+from frontier import FRONTIER_FILE, CrawlFrontier
+from graph_store import open_store
+from instrumentation import count, gauge, metrics, run_report, write_reports
+from rate_limit import RateLimitedAPI, map_concurrent, parse_retry_after
+from response_cache import ResponseCache
 
 # Spotify API credentials
 # not concealed so this can be easily run
 MY_CLIENT_ID = '171c422d25de4589a5f076d40dd57de2'
 MY_CLIENT_SECRET = '17c4c41877244f85b3ed0e85355a5df1'
 
-# auth setup
-client_credentials_manager = SpotifyClientCredentials(client_id=MY_CLIENT_ID, client_secret=MY_CLIENT_SECRET)
-sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager, requests_timeout=20)
-
-# setup MusicBrainz
-musicbrainzngs.set_useragent("spotifycollabs", "0.1", "maximilian.j.pfeil@gmail.com")
-
 ARTISTS_FILE = 'data/artists.csv'
 COLLABORATIONS_FILE = 'data/collaborations.csv'
+CACHE_FILE = 'data/api_cache.sqlite'
+JOURNAL_FILE = 'data/crawl_journal.sqlite'
+
+# API endpoints can be redirected, e.g. to a local stub server for testing
+SPOTIFY_API_PREFIX = os.environ.get('SPOTIFY_API_PREFIX')
+SPOTIFY_TOKEN_URL = os.environ.get('SPOTIFY_TOKEN_URL')
+MUSICBRAINZ_HOST = os.environ.get('MUSICBRAINZ_HOST')
+
+# request rates. MusicBrainz allows 1 request per second
+SPOTIFY_RATE = 10.0
+SPOTIFY_BURST = 10
+MUSICBRAINZ_RATE = 1.0
+CONCURRENCY = 8  # parallel fetches
+FILL_CHUNK_SIZE = 200  # artists whose collaborations are fetched and written together
+
+# frontier crawl defaults
+FRONTIER_GENRES = ['pop', 'hip hop', 'rock', 'r&b', 'latin', 'edm']
+SEEDS_PER_GENRE = 50
+FRONTIER_WORKERS = 4
+FRONTIER_BATCH_SIZE = 50  # artists claimed by a worker at once
+MAX_DEPTH = 3
+MAX_NODES = 100000
+MAX_CACHED_ALBUMS = 200000  # album track listings a worker keeps in memory
+
+# API clients and the response cache are created on first use, so importing this module (for
+# --help, or in every spawned crawl worker) neither loads spotipy and musicbrainzngs nor opens the cache
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Spotify client. retries are handled by the rate limiter below, not by spotipy. spotipy's own
+# session retries 429s in urllib3 and then raises without the response headers, losing Retry-After,
+# so it gets a plain session that hands every error response to spotipy as is
+def spotify_client():
+    with _clients_lock:
+        if 'spotify' not in _clients:
+            import requests
+            import spotipy
+            from spotipy.oauth2 import SpotifyClientCredentials
+
+            if SPOTIFY_TOKEN_URL:
+                SpotifyClientCredentials.OAUTH_TOKEN_URL = SPOTIFY_TOKEN_URL
+            client_credentials_manager = SpotifyClientCredentials(client_id=MY_CLIENT_ID, client_secret=MY_CLIENT_SECRET)
+            sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager, requests_timeout=20,
+                                 requests_session=requests.Session())
+            if SPOTIFY_API_PREFIX:
+                sp.prefix = SPOTIFY_API_PREFIX
+            _clients['spotify'] = sp
+        return _clients['spotify']
+
+# musicbrainzngs, with its built-in 1 req/s sleep replaced by the shared limiter
+def musicbrainz_client():
+    with _clients_lock:
+        if 'musicbrainz' not in _clients:
+            import musicbrainzngs
+
+            musicbrainzngs.set_useragent("spotifycollabs", "0.1", "maximilian.j.pfeil@gmail.com")
+            musicbrainzngs.set_rate_limit(False)
+            if MUSICBRAINZ_HOST:
+                musicbrainzngs.set_hostname(MUSICBRAINZ_HOST)
+            _clients['musicbrainz'] = musicbrainzngs
+        return _clients['musicbrainz']
+
+# responses are cached on disk, so resumed crawls only fetch what is new
+def response_cache():
+    with _clients_lock:
+        if 'cache' not in _clients:
+            _clients['cache'] = ResponseCache(CACHE_FILE)
+        return _clients['cache']
+
+def close_response_cache():
+    with _clients_lock:
+        cache = _clients.pop('cache', None)
+    if cache is not None:
+        cache.close()
+
+# retry policy for Spotify: honour Retry-After on 429, back off on server and network errors
+def spotify_retry_delay(exc):
+    import requests
+    import spotipy
+
+    if isinstance(exc, spotipy.SpotifyException):
+        if exc.http_status == 429:
+            return parse_retry_after(getattr(exc, 'headers', None)) or 0.0
+        if exc.http_status >= 500:
+            return 0.0
+        return None
+    if isinstance(exc, requests.exceptions.RequestException):
+        return 0.0
+    return None
+
+# retry policy for MusicBrainz, which answers 503 when a client is too fast
+def musicbrainz_retry_delay(exc):
+    musicbrainzngs = musicbrainz_client()
+    if isinstance(exc, musicbrainzngs.NetworkError):
+        return 0.0
+    if isinstance(exc, musicbrainzngs.ResponseError):
+        cause = getattr(exc, 'cause', None)
+        if getattr(cause, 'code', None) in (429, 503):
+            return parse_retry_after(getattr(cause, 'headers', None)) or 0.0
+    return None
+
+spotify_api = RateLimitedAPI('Spotify', SPOTIFY_RATE, SPOTIFY_BURST, retry_delay=spotify_retry_delay)
+musicbrainz_api = RateLimitedAPI('MusicBrainz', MUSICBRAINZ_RATE, 1, retry_delay=musicbrainz_retry_delay)
+
+# rate-limited, cached call of a spotipy client method, e.g. spotify_get('artist', artist_id)
+def spotify_get(method, *args, **kwargs):
+    fetch = lambda: spotify_api.call(getattr(spotify_client(), method), *args, **kwargs)
+    return response_cache().call(f'spotify.{method}', fetch, args, kwargs)
+
+# objects by ID from a multi-ID endpoint, e.g. spotify_get_many('albums', album_ids, 20). every object
+# is cached on its own under the single-ID endpoint (spotify.album:<id>), so cache hits do not depend on
+# which IDs happened to be requested together, and only uncached IDs are fetched, per_request at a time.
+# IDs that Spotify does not know or whose request failed are missing from the result
+def spotify_get_many(method, ids, per_request, concurrency=1):
+    cache = response_cache()
+    endpoint = f'spotify.{method[:-1]}'
+    found = {}
+    missing = []
+    for item_id in dict.fromkeys(ids):
+        value = cache.get(endpoint, (item_id,))
+        if value is None:
+            missing.append(item_id)
+        else:
+            found[item_id] = value
+
+    batches = [missing[i:i + per_request] for i in range(0, len(missing), per_request)]
+    fetch = lambda batch: spotify_api.call(getattr(spotify_client(), method), batch)
+    for batch, result, error in map_concurrent(fetch, batches, concurrency):
+        if error is not None:
+            print(f"Error retrieving {len(batch)} {method}: {error}")
+            continue
+        for item_id, value in zip(batch, result[method]):
+            if value:
+                cache.put(endpoint, value, (item_id,))
+                found[item_id] = value
+    return found
+
+# rate-limited, cached call of a musicbrainzngs function
+def musicbrainz_get(function, *args, **kwargs):
+    fetch = lambda: musicbrainz_api.call(getattr(musicbrainz_client(), function), *args, **kwargs)
+    return response_cache().call(f'musicbrainz.{function}', fetch, args, kwargs)
 
 # get artist country and begin_area from musicbrainz
 def get_musicbrainz_info(artist_name):
     try:
-        result = musicbrainzngs.search_artists(artist=artist_name, limit=1)
+        result = musicbrainz_get('search_artists', artist=artist_name, limit=1)
         if result['artist-list']:
             artist = result['artist-list'][0]
             return {
@@ -35,10 +173,67 @@ def get_musicbrainz_info(artist_name):
         print(f"MusicBrainz error for '{artist_name}': {e}")
     return {'country': None, 'begin_area': None}
 
-# get most artist data from spotify API
-def get_artist_info(artist_id):
-    artist = sp.artist(artist_id)
-    albums = sp.artist_albums(artist_id, album_type='album', limit=25)['items']
+# Spotify's multi-ID endpoints accept at most this many IDs per request
+ARTISTS_PER_REQUEST = 50
+ALBUMS_PER_REQUEST = 20
+
+# plans Spotify requests for a set of artists:
+# - artist metadata through the multi-ID `artists` endpoint
+# - one album list per artist, shared by the metadata (first 25 albums) and the collaborations
+# - album track listings through the multi-ID `albums` endpoint, each album fetched once
+class RequestPlanner:
+    def __init__(self, concurrency=CONCURRENCY):
+        self.concurrency = concurrency
+        self.artist_albums = {}   # artist ID -> album items, limit 50
+        self.album_artists = {}   # album ID -> IDs of all artists on its tracks
+
+    # fetch album lists for artists that do not have one yet
+    def fetch_albums(self, artist_ids):
+        missing = [a for a in dict.fromkeys(artist_ids) if a not in self.artist_albums]
+        fetch = lambda artist_id: spotify_get('artist_albums', artist_id, album_type='album', limit=50)['items']
+        for artist_id, albums, error in map_concurrent(fetch, missing, self.concurrency):
+            if error is not None:
+                print(f"Error retrieving albums for {artist_id}: {error}")
+                albums = []
+            self.artist_albums[artist_id] = albums
+
+    # fetch track listings for albums that were not seen before, ALBUMS_PER_REQUEST at a time
+    def fetch_album_tracks(self, album_ids):
+        missing = [a for a in dict.fromkeys(album_ids) if a not in self.album_artists]
+        albums = spotify_get_many('albums', missing, ALBUMS_PER_REQUEST, self.concurrency)
+        for album_id, album in albums.items():
+            tracks = album['tracks']['items']
+            self.album_artists[album_id] = {artist['id'] for track in tracks for artist in track['artists']}
+
+    # artist info rows (see get_artist_info) in the order of artist_ids; failed lookups are skipped
+    def artist_infos(self, artist_ids):
+        artist_ids = list(dict.fromkeys(artist_ids))
+        self.fetch_albums(artist_ids)
+
+        found = spotify_get_many('artists', artist_ids, ARTISTS_PER_REQUEST, self.concurrency)
+        artists = [found[artist_id] for artist_id in artist_ids if artist_id in found]
+
+        # MusicBrainz lookups are the slowest part, run them in parallel too
+        infos = map_concurrent(lambda artist: artist_info(artist, self.artist_albums.get(artist['id'], [])[:25]),
+                               artists, self.concurrency)
+        return [info for _, info, error in infos if error is None]
+
+    # sorted collaborator IDs of each artist
+    def collaborations(self, artist_ids):
+        self.fetch_albums(artist_ids)
+        self.fetch_album_tracks(album['id'] for a in artist_ids for album in self.artist_albums[a])
+
+        result = {}
+        for artist_id in artist_ids:
+            collaborations = set()
+            for album in self.artist_albums[artist_id]:
+                collaborations |= self.album_artists.get(album['id'], set())
+            collaborations.discard(artist_id)
+            result[artist_id] = sorted(collaborations)
+        return result
+
+# build the artist info row from the artist object and its first 25 albums
+def artist_info(artist, albums):
     years = []
 
     for album in albums:
@@ -68,62 +263,39 @@ def get_artist_info(artist_id):
         'begin_area': mb_info['begin_area']
     }
 
+# get most artist data from spotify API
+def get_artist_info(artist_id):
+    artist = spotify_get('artist', artist_id)
+    albums = spotify_get('artist_albums', artist_id, album_type='album', limit=25)['items']
+    return artist_info(artist, albums)
+
 # get collaborations from artist ID
 def get_collaborations(artist_id):
-    collaborations = set()
     try:
-        albums = sp.artist_albums(artist_id, album_type='album', limit=50)
-        for album in albums['items']:
-            tracks = sp.album_tracks(album['id'], limit=50)
-            for track in tracks['items']:
-                for artist in track['artists']:
-                    if artist['id'] != artist_id:
-                        collaborations.add(artist['id'])
-        return sorted(collaborations)
-
+        return RequestPlanner(concurrency=1).collaborations([artist_id])[artist_id]
     except Exception as e:
         print(f"Error retrieving collaborations for {artist_id}: {e}")
         return set()
 
 
-# save artist info
-def save_artist(artist):
-    file_exists = os.path.exists(ARTISTS_FILE)
-    with open(ARTISTS_FILE, 'a', newline='', encoding='utf-8') as csvfile:
-        fieldnames = [
-            'id', 'name', 'followers', 'genres', 'popularity',
-            'num_albums', 'debut_year', 'last_active_year', 'active_years', 'country', 'begin_area'
-        ]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(artist)
-
-# save collaboration info
-def save_collaboration(artist1, artist2):
-    file_exists = os.path.exists(COLLABORATIONS_FILE)
-    with open(COLLABORATIONS_FILE, 'a', newline='') as csvfile:
-        fieldnames = ['artist_id', 'collaboration_id']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow({'artist_id': artist1, 'collaboration_id': artist2})
-
 # clear CSV files
 def clear_csv_files():
     for file in [ARTISTS_FILE, COLLABORATIONS_FILE]:
         if os.path.exists(file):
             open(file, 'w').close()
+    # the crawl journal describes the old contents
+    if os.path.exists(JOURNAL_FILE):
+        os.remove(JOURNAL_FILE)
     print("Cleared all CSV files.")
 
-# get artists from a given genre
-def search_artists_by_genre(genre_name, limit=50):
+# (artist ID, popularity) of up to `limit` artists from a genre search, in search order
+def search_artist_ids(genre_name, limit=50):
     artists = []
     seen_ids = set()
     offset = 0
 
     while len(artists) < limit:
-        result = sp.search(q=f'genre:"{genre_name}"', type='artist', limit=50, offset=offset)
+        result = spotify_get('search', q=f'genre:"{genre_name}"', type='artist', limit=50, offset=offset)
         new_artists = result.get('artists', {}).get('items', [])
 
         if not new_artists:
@@ -131,26 +303,7 @@ def search_artists_by_genre(genre_name, limit=50):
 
         for artist in new_artists:
             if artist['id'] not in seen_ids:
-                artist_info = get_artist_info(artist['id'])
-
-                # try avoid API limits
-                time.sleep(0.5)
-                print(artist_info['name'])
-
-                # Add the fetched artist info to the artists list
-                artists.append({
-                    'id': artist_info['id'],
-                    'name': artist_info['name'],
-                    'followers': artist_info['followers'],
-                    'genres': artist_info['genres'],
-                    'popularity': artist_info['popularity'],
-                    'num_albums': artist_info['num_albums'],
-                    'debut_year': artist_info['debut_year'],
-                    'last_active_year': artist_info['last_active_year'],
-                    'active_years': artist_info['active_years'],
-                    'country': artist_info['country'],
-                    'begin_area': artist_info['begin_area']
-                })
+                artists.append((artist['id'], artist.get('popularity')))
                 seen_ids.add(artist['id'])
 
             if len(artists) >= limit:
@@ -160,104 +313,187 @@ def search_artists_by_genre(genre_name, limit=50):
 
     return artists
 
-# this is used to fill up the CSVs continuously 
-# as API limits tend to shut down the main script occasionally.
-def fill_collaborations_from_existing_artists():
-    # Load existing artist IDs
-    artists_df = pd.read_csv(ARTISTS_FILE)
-    artist_ids = set(artists_df["id"])
-
-    try:
-        collab_df = pd.read_csv(COLLABORATIONS_FILE)
-        existing_pairs = set(tuple(sorted([row['artist_1'], row['artist_2']])) for _, row in collab_df.iterrows())
-        processed_artists = set((row['artist_1']) for _, row in collab_df.iterrows())
-    except FileNotFoundError:
-        existing_pairs = set()
-
-    total = len(artist_ids)
-    for idx, artist_id in enumerate(artist_ids):
-        if artist_id in processed_artists:
-            print(f"[{idx+1}/{total}] {artist_id} already processed.")
-            continue
-        else:
-            print(f"[{idx+1}/{total}] Processing {artist_id}...")
-
-        try:
-            collabs = get_collaborations(artist_id)
-        except Exception as e:
-            print(f"Error for {artist_id}: {e}")
-            continue
+# get artists from a given genre
+def search_artists_by_genre(genre_name, limit=50, concurrency=CONCURRENCY, planner=None):
+    artist_ids = [artist_id for artist_id, _ in search_artist_ids(genre_name, limit)]
 
-        new_entries = []
-        for collab_id in collabs:
-            if collab_id in artist_ids:
-                pair = tuple(sorted([artist_id, collab_id]))
-                if pair not in existing_pairs:
-                    new_entries.append({"artist_1": pair[0], "artist_2": pair[1]})
-                    existing_pairs.add(pair)
+    # fetch artist info in batches, keeping the search order
+    planner = planner or RequestPlanner(concurrency)
+    artists = []
+    for info in planner.artist_infos(artist_ids):
+        print(info['name'])
+
+        # Add the fetched artist info to the artists list
+        artists.append({
+            'id': info['id'],
+            'name': info['name'],
+            'followers': info['followers'],
+            'genres': info['genres'],
+            'popularity': info['popularity'],
+            'num_albums': info['num_albums'],
+            'debut_year': info['debut_year'],
+            'last_active_year': info['last_active_year'],
+            'active_years': info['active_years'],
+            'country': info['country'],
+            'begin_area': info['begin_area']
+        })
 
-        if new_entries:
-            pd.DataFrame(new_entries).to_csv(COLLABORATIONS_FILE, mode='a', header=False, index=False)
+    return artists
 
-        time.sleep(0.5)  # avoid hitting rate limit
+# this is used to fill up the CSVs continuously 
+# as API limits tend to shut down the main script occasionally.
+# progress is checkpointed in the crawl journal after every chunk, so a crashed run resumes where it stopped
+def fill_collaborations_from_existing_artists(concurrency=CONCURRENCY):
+    journal = CrawlJournal(ARTISTS_FILE, COLLABORATIONS_FILE, JOURNAL_FILE)
+
+    # existing artist IDs from the compiled graph store
+    artist_ids = open_store(ARTISTS_FILE, COLLABORATIONS_FILE).ids.tolist()
+    known_ids = set(artist_ids)
+    to_process = [artist_id for artist_id in artist_ids if not journal.is_processed(artist_id)]
+    print(f"{len(artist_ids) - len(to_process)}/{len(artist_ids)} artists already processed.")
+
+    # fetch collaborations in chunks through the request planner, so albums shared
+    # between artists are fetched once
+    planner = RequestPlanner(concurrency)
+    for start in range(0, len(to_process), FILL_CHUNK_SIZE):
+        chunk = to_process[start:start + FILL_CHUNK_SIZE]
+        for artist_id, collabs in planner.collaborations(chunk).items():
+            for collab_id in collabs:
+                if collab_id in known_ids:
+                    journal.add_collaboration(artist_id, collab_id)
+            journal.mark_processed(artist_id)
+        journal.checkpoint()
+        count('artists_crawled', len(chunk))
+
+        print(f"[{start + len(chunk)}/{len(to_process)}] artists processed, "
+              f"{spotify_api.calls / (start + len(chunk)):.1f} Spotify requests per artist.")
+
+    journal.close()
 
 # save artist & collaboration info from a given genre
-def build_genre_graph(genre_name, top_x=50):
-
-    ensure_csv_headers()
+def build_genre_graph(genre_name, top_x=50, concurrency=CONCURRENCY):
+    journal = CrawlJournal(ARTISTS_FILE, COLLABORATIONS_FILE, JOURNAL_FILE)
 
     # Step 1: Get top X artists by genre
-    artists = search_artists_by_genre(genre_name, limit=top_x)
+    planner = RequestPlanner(concurrency)
+    artists = search_artists_by_genre(genre_name, limit=top_x, concurrency=concurrency, planner=planner)
     if not artists:
         print("No artists found.")
+        journal.close()
         return
 
     # Step 2: Save artist info
     discovered_ids = set()
     for artist in artists:
-        artist_id = artist['id']
-        save_artist(artist)
-        discovered_ids.add(artist_id)
+        journal.add_artist(artist)
+        discovered_ids.add(artist['id'])
+    journal.checkpoint()
 
-    # Step 3: Save collaborations
+    # Step 3: Save collaborations, reusing the album lists fetched in step 1
     print("Finding internal collaborations...")
-    total_artists = len(artists)
-    progress_interval = total_artists // 10  # log progress every 10% of artists processed
-    processed = 0
-
-    for artist in artists:
-        artist_id = artist['id']
-        collaborations = get_collaborations(artist_id)
-
-        for collab_id in collaborations:
+    collaborations = planner.collaborations([artist['id'] for artist in artists])
+    for artist_id, collab_ids in collaborations.items():
+        for collab_id in collab_ids:
             if collab_id in discovered_ids:
-                save_collaboration(artist_id, collab_id)
-
-        # log progress
-        processed += 1
-        if processed % progress_interval == 0 or processed == total_artists:
-            print(f"Progress: {processed}/{total_artists} artists processed...")
-
-        # try avoid API limit
-        time.sleep(0.5)
-
-# add headers to CSV files so they can be parsed later
-def ensure_csv_headers():
-    header_artists = ["id", "name", "followers", "genres", "popularity", "num_albums",
-                       "debut_year", "last_active_year", "active_years", "country", "begin_area"]
-    header_collabs = ["artist_1", "artist_2"]
-    
-    if not os.path.exists(ARTISTS_FILE) or os.stat(ARTISTS_FILE).st_size == 0:
-        with open(ARTISTS_FILE, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(header_artists) 
-
-    if not os.path.exists(COLLABORATIONS_FILE) or os.stat(COLLABORATIONS_FILE).st_size == 0:
-        with open(COLLABORATIONS_FILE, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(header_collabs) 
+                journal.add_collaboration(artist_id, collab_id)
+        journal.mark_processed(artist_id)
+    journal.close()
+
+    print(f"{len(artists)} artists processed with {spotify_api.calls} Spotify requests "
+          f"({spotify_api.calls / len(artists):.1f} per artist).")
+
+# one frontier worker process: claim batches of artists, fetch them and store the results,
+# until the frontier is drained or the node cap is reached
+def frontier_worker(num_workers, max_depth, max_nodes, order, batch_size, concurrency):
+    # the workers share the API rate limits
+    spotify_api.bucket.rate = SPOTIFY_RATE / num_workers
+    musicbrainz_api.bucket.rate = MUSICBRAINZ_RATE / num_workers
+
+    metrics.start_memory_sampler()
+    frontier = CrawlFrontier(FRONTIER_FILE, max_depth, max_nodes, order)
+    planner = RequestPlanner(concurrency)
+    while frontier.has_work():
+        batch = frontier.claim(batch_size)
+        if not batch:
+            time.sleep(1)  # other workers still hold claims that may queue more artists
+            continue
 
-def main():
+        artist_ids = [artist_id for artist_id, _ in batch]
+        infos = {info['id']: info for info in planner.artist_infos(artist_ids)}
+        collaborations = planner.collaborations(artist_ids)
+
+        # collaborators inherit the popularity of the artist they were found through
+        results = []
+        for artist_id, depth in batch:
+            info = infos.get(artist_id)
+            popularity = info['popularity'] if info else 0
+            results.append((artist_id, depth, info, [(c, popularity) for c in collaborations[artist_id]]))
+        frontier.complete(results)
+        count('artists_crawled', len(results))
+
+        # album lists are only needed for the current batch, track listings are worth keeping a while
+        planner.artist_albums.clear()
+        if len(planner.album_artists) > MAX_CACHED_ALBUMS:
+            planner.album_artists.clear()
+
+        stats = frontier.stats()
+        print(f"[{os.getpid()}] {stats['done']} crawled, {stats['queued']} queued, {stats['claimed']} in progress")
+
+    frontier.close()
+    close_response_cache()
+    # every worker process has its own metrics, reported next to the main run report
+    write_reports(f'crawl-worker-{os.getpid()}')
+
+# crawl outwards from the top artists of several genres into their collaborators, breadth-first
+# or most popular first. the frontier lives on disk, so an interrupted crawl resumes when rerun,
+# and the crawled graph replaces the CSVs at the end
+def crawl_frontier(genres=FRONTIER_GENRES, seeds_per_genre=SEEDS_PER_GENRE, workers=FRONTIER_WORKERS,
+                   max_depth=MAX_DEPTH, max_nodes=MAX_NODES, order='bfs', batch_size=FRONTIER_BATCH_SIZE,
+                   concurrency=CONCURRENCY):
+    frontier = CrawlFrontier(FRONTIER_FILE, max_depth, max_nodes, order)
+    for genre in genres:
+        seeds = search_artist_ids(genre, seeds_per_genre)
+        print(f"Seeding {len(seeds)} {genre} artists.")
+        frontier.seed(seeds)
+
+    # spawn, so every worker opens its own API clients and SQLite connections
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=frontier_worker,
+                        args=(workers, max_depth, max_nodes, order, batch_size, concurrency))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    stats = frontier.stats()
+    gauge('frontier_done', stats['done'])
+    gauge('frontier_queued', stats['queued'])
+    print(f"Crawl finished: {stats['done']} artists crawled, {stats['queued']} left in the queue.")
+    frontier.export(ARTISTS_FILE, COLLABORATIONS_FILE)
+    frontier.close()
+
+    # the crawl journal describes the old contents
+    if os.path.exists(JOURNAL_FILE):
+        os.remove(JOURNAL_FILE)
+    print(f"Wrote the crawled graph to {ARTISTS_FILE} and {COLLABORATIONS_FILE}.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Crawl artists and collaborations from Spotify and MusicBrainz")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="parallel API requests")
+    parser.add_argument('--frontier', action='store_true', help="crawl outwards from several genres into collaborators")
+    parser.add_argument('--genres', nargs='+', default=FRONTIER_GENRES, help="seed genres of the frontier crawl")
+    parser.add_argument('--seeds-per-genre', type=int, default=SEEDS_PER_GENRE)
+    parser.add_argument('--workers', type=int, default=FRONTIER_WORKERS, help="frontier crawl processes")
+    parser.add_argument('--max-depth', type=int, default=MAX_DEPTH, help="collaboration hops from the seeds")
+    parser.add_argument('--max-nodes', type=int, default=MAX_NODES, help="stop after crawling this many artists")
+    parser.add_argument('--order', choices=['bfs', 'popularity'], default='bfs', help="frontier expansion order")
+    parser.add_argument('--frontier-batch', type=int, default=FRONTIER_BATCH_SIZE, help="artists claimed per worker batch")
+    return parser.parse_args()
+
+def main(concurrency=CONCURRENCY):
     # clean up existing files (optional)
     # there is backup CSV files in case these are accidentally deleted
     clear_csv_files()
@@ -266,10 +502,18 @@ def main():
     max_artists = 1000 
 
     print(f"Getting {max_artists} {genre} artists...")
-    build_genre_graph(genre, max_artists)
+    build_genre_graph(genre, max_artists, concurrency=concurrency)
     
     print("Data collection complete.")
 
 if __name__ == "__main__":
-    # main()
-    fill_collaborations_from_existing_artists()
\ No newline at end of file
+    args = parse_args()
+    # main(args.concurrency)
+    with run_report('load_spotify_data'):
+        if args.frontier:
+            crawl_frontier(args.genres, args.seeds_per_genre, args.workers, args.max_depth, args.max_nodes,
+                           args.order, args.frontier_batch, args.concurrency)
+        else:
+            fill_collaborations_from_existing_artists(args.concurrency)
+        response_cache().report()
+    close_response_cache()
\ No newline at end of file
@@ -1,45 +1,113 @@
+import argparse
 import csv
-from neo4j import GraphDatabase
+import heapq
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import count, gauge, run_report, timer
+from neo4j_client import get_driver
 
-# Neo4j connection
-URI = "bolt://localhost:7687"
-AUTH = ("neo4j", "knowledgegraphs")
-driver = GraphDatabase.driver(URI, auth=AUTH)
+FETCH_SIZE = 10000  # records per network round trip when streaming partition results
 
-def do_logical_prediction(
-    log_path="predictions/logical_rules.csv",
-    weight_common_neighbors = 2.0,
-    weight_genre_overlap = 5.0,
-    weight_popularity = 5.0,
-    weight_same_country = 2.0,
-    weight_same_city = 5.0,
-):
-    query = """
-        MATCH (a:Artist)-[:COLLABORATED_WITH]-(common)-[:COLLABORATED_WITH]-(b:Artist)
-        WHERE a.id < b.id 
-        AND NOT (a)-[:COLLABORATED_WITH]-(b)
-        WITH a, b, 
+# per-pair rule features of the two graph models. 'string' compares the comma-joined genres and the
+# country/begin_area properties of both artists for every pair; 'normalized' counts the Genre,
+# Country and City nodes both artists link to (populate_neo4j.py --normalized). the normalized
+# genres are stripped and deduplicated, so e.g. ' pop' and 'pop' count as one shared genre there
+GRAPH_MODELS = {
+    'string': """
+        WITH a, b,
             COUNT(DISTINCT common) AS shared,
-            [g IN split(a.genres, ',') WHERE g IN split(b.genres, ',')] AS common_genres,
+            size([g IN split(a.genres, ',') WHERE g IN split(b.genres, ',')]) AS genre_overlap,
             abs(a.popularity - b.popularity) AS pop_diff,
             (a.country IS NOT NULL AND b.country IS NOT NULL AND a.country <> '' AND b.country <> '' AND a.country = b.country) AS same_country,
             (a.begin_area IS NOT NULL AND b.begin_area IS NOT NULL AND a.begin_area <> '' AND b.begin_area <> '' AND a.begin_area = b.begin_area) AS same_city
-        WITH a.name AS artist_1, b.name AS artist_2,
+    """,
+    'normalized': """
+        WITH a, b, COUNT(DISTINCT common) AS shared
+        WITH a, b, shared,
+            COUNT { (a)-[:HAS_GENRE]->(:Genre)<-[:HAS_GENRE]-(b) } AS genre_overlap,
+            abs(a.popularity - b.popularity) AS pop_diff,
+            EXISTS { (a)-[:FROM_COUNTRY]->(:Country)<-[:FROM_COUNTRY]-(b) } AS same_country,
+            EXISTS { (a)-[:STARTED_IN]->(:City)<-[:STARTED_IN]-(b) } AS same_city
+    """,
+}
+
+# rule query shared by both execution modes. partitioned queries only anchor on a.id in [$lo, $hi);
+# limit pushes a global ('global') or per-anchor ('per_artist') LIMIT $top_k into the query
+def build_rule_query(partitioned=False, limit=None, model='string'):
+    partition_filter = "AND a.id >= $lo AND ($hi IS NULL OR a.id < $hi)" if partitioned else ""
+    query = f"""
+        MATCH (a:Artist)-[:COLLABORATED_WITH]-(common)-[:COLLABORATED_WITH]-(b:Artist)
+        WHERE a.id < b.id {partition_filter}
+        AND NOT (a)-[:COLLABORATED_WITH]-(b)
+        {GRAPH_MODELS[model].strip()}
+        WITH a.id AS anchor, a.name AS artist_1, b.name AS artist_2,
             shared, 
-            size(common_genres) AS genre_overlap,
+            genre_overlap,
             pop_diff,
             same_country,
             same_city,
             (shared * $weight_common_neighbors) +
-            (size(common_genres) * $weight_genre_overlap) +
+            (genre_overlap * $weight_genre_overlap) +
             (1.0 / (1 + pop_diff)) * $weight_popularity +
             (CASE WHEN same_country THEN $weight_same_country ELSE 0 END) +
             (CASE WHEN same_city THEN $weight_same_city ELSE 0 END) AS score
+    """
+    if limit == 'per_artist':
+        query += """
+        ORDER BY score DESC
+        WITH anchor, collect([artist_1, artist_2, shared, genre_overlap, pop_diff, same_country, same_city, score])[0..$top_k] AS top
+        UNWIND top AS row
+        RETURN row[0] AS artist_1, row[1] AS artist_2, row[2] AS shared, row[3] AS genre_overlap,
+            row[4] AS pop_diff, row[5] AS same_country, row[6] AS same_city, row[7] AS score
+        ORDER BY score DESC
+        """
+    else:
+        query += """
         RETURN artist_1, artist_2, shared, genre_overlap, pop_diff, same_country, same_city, score
         ORDER BY score DESC
-    """
+        """
+        if limit == 'global':
+            query += "LIMIT $top_k\n"
+    return query
+
+RESULT_KEYS = ['artist_1', 'artist_2', 'shared', 'genre_overlap', 'pop_diff', 'same_country', 'same_city', 'score']
+
+# write predicted collaborations as CSV. rows hold the RESULT_KEYS values in order.
+# returns the number of rows written
+def write_predictions(log_path, rows):
+    with open(log_path, 'w', newline='', encoding='utf-8') as log_file:
+        writer = csv.writer(log_file)
+        
+        # Write header row
+        writer.writerow([
+            'Artist 1', 'Artist 2', 'Shared Neighbors',
+            'Genre Overlap', 'Popularity Diff',
+            'Same Country', 'Same City', 'Score'
+        ])
+
+        # Write the predicted collaborations
+        total = 0
+        for row in rows:
+            writer.writerow(row[:7] + [round(row[7], 2)])
+            total += 1
+    count('predictions_written', total)
+    return total
+
+def do_logical_prediction(
+    log_path="predictions/logical_rules.csv",
+    weight_common_neighbors = 2.0,
+    weight_genre_overlap = 5.0,
+    weight_popularity = 5.0,
+    weight_same_country = 2.0,
+    weight_same_city = 5.0,
+    model='string',
+):
+    query = build_rule_query(model=model)
 
-    with driver.session() as session:
+    start = time.perf_counter()
+    with timer('neo4j_query'), get_driver().session() as session:
         result = session.run(
             query,
 
@@ -49,31 +117,103 @@ def do_logical_prediction(
             weight_same_country=weight_same_country,
             weight_same_city=weight_same_city,
         )
+        # rows are streamed from the query straight into the CSV
+        rows_read = write_predictions(log_path, (record.values(*RESULT_KEYS) for record in result))
+    count('neo4j_rows_read', rows_read)
+    gauge('neo4j_rows_per_second', rows_read / max(time.perf_counter() - start, 1e-9), query='rules')
+    print("Prediction using logical rules complete.")
+
+# split the anchor artists into ID ranges of roughly equal size, as (lo, hi) pairs with hi=None for the last one
+def partition_bounds(num_partitions):
+    query = """
+        MATCH (a:Artist)
+        WITH a.id AS id ORDER BY id
+        WITH collect(id) AS ids
+        RETURN [i IN range(0, size(ids) - 1, size(ids) / $num_partitions + 1) | ids[i]] AS bounds
+    """
+    with get_driver().session() as session:
+        bounds = session.run(query, num_partitions=num_partitions).single()['bounds']
+    return list(zip(bounds, bounds[1:] + [None]))
+
+# run the rule query over ID-range partitions in parallel sessions and merge the partial results.
+# with top_k set, each partition only returns its best top_k rows (globally or per artist)
+def do_partitioned_prediction(
+    log_path="predictions/logical_rules.csv",
+    weight_common_neighbors = 2.0,
+    weight_genre_overlap = 5.0,
+    weight_popularity = 5.0,
+    weight_same_country = 2.0,
+    weight_same_city = 5.0,
+    top_k=None,
+    per_artist=False,
+    num_partitions=None,
+    workers=None,
+    model='string',
+):
+    workers = workers or os.cpu_count() or 1
+    num_partitions = num_partitions or 4 * workers
+    limit = None if top_k is None else ('per_artist' if per_artist else 'global')
+    query = build_rule_query(partitioned=True, limit=limit, model=model)
+
+    def run_partition(bounds):
+        lo, hi = bounds
+        with get_driver().session(fetch_size=FETCH_SIZE) as session:
+            result = session.run(
+                query,
+                lo=lo,
+                hi=hi,
+                top_k=top_k,
+                weight_common_neighbors=weight_common_neighbors,
+                weight_genre_overlap=weight_genre_overlap,
+                weight_popularity=weight_popularity,
+                weight_same_country=weight_same_country,
+                weight_same_city=weight_same_city,
+            )
+            return [record.values(*RESULT_KEYS) for record in result]
+
+    start = time.perf_counter()
+    with timer('neo4j_query'), ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(run_partition, partition_bounds(num_partitions)))
+    rows_read = sum(len(part) for part in parts)
+    count('neo4j_rows_read', rows_read)
+    gauge('neo4j_rows_per_second', rows_read / max(time.perf_counter() - start, 1e-9), query='rules')
+
+    # every partition is sorted by score, so a k-way heap merge keeps the global order
+    rows = heapq.merge(*parts, key=lambda row: -row[7])
+    if limit == 'global':
+        rows = itertools.islice(rows, top_k)
+
+    with timer('csv_write'):
+        write_predictions(log_path, rows)
+    print("Prediction using logical rules complete.")
 
-        # Open the log file as a CSV
-        with open(log_path, 'w', newline='', encoding='utf-8') as log_file:
-            writer = csv.writer(log_file)
-            
-            # Write header row
-            writer.writerow([
-                'Artist 1', 'Artist 2', 'Shared Neighbors',
-                'Genre Overlap', 'Popularity Diff',
-                'Same Country', 'Same City', 'Score'
-            ])
-
-            # Write the predicted collaborations
-            for record in result:
-                writer.writerow([
-                    record['artist_1'],
-                    record['artist_2'],
-                    record['shared'],
-                    record['genre_overlap'],
-                    record['pop_diff'],
-                    record['same_country'],
-                    record['same_city'],
-                    round(record['score'], 2)
-                ])
-        print("Prediction using logical rules complete.")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Link prediction with logical rules")
+    parser.add_argument('--backend', choices=['neo4j', 'sparse'], default='neo4j',
+                        help="run the Cypher query, or compute the same scores in-process without a database")
+    parser.add_argument('--partitions', type=int, default=None,
+                        help="run the Cypher query over this many ID-range partitions in parallel sessions")
+    parser.add_argument('--workers', type=int, default=None, help="parallel sessions for partitioned queries (default: all cores)")
+    parser.add_argument('--top-k', type=int, default=None, help="only keep the best K pairs")
+    parser.add_argument('--per-artist', action='store_true', help="apply --top-k per artist instead of globally")
+    parser.add_argument('--tuned', action='store_true', help="use the weights saved by tune_rules.py")
+    parser.add_argument('--graph-model', choices=list(GRAPH_MODELS), default='string',
+                        help="compare genre and location strings, or traverse the normalized Genre/Country/City nodes")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    do_logical_prediction()
\ No newline at end of file
+    args = parse_args()
+    weights = {}
+    if args.tuned:
+        from rule_engine import load_tuned_weights
+        weights = load_tuned_weights()
+    with run_report('logical_knowledge'):
+        if args.backend == 'sparse':
+            from rule_engine import do_sparse_prediction
+            do_sparse_prediction(top_k=args.top_k, per_artist=args.per_artist, **weights)
+        elif args.partitions or args.top_k:
+            do_partitioned_prediction(top_k=args.top_k, per_artist=args.per_artist,
+                                      num_partitions=args.partitions, workers=args.workers, model=args.graph_model,
+                                      **weights)
+        else:
+            do_logical_prediction(model=args.graph_model, **weights)
\ No newline at end of file
@@ -0,0 +1,39 @@
+import json
+import os
+import time
+import numpy as np
+
+MODEL_DIR = 'models'
+
+# directory of a trained model: embeddings.npy, ids.npy and names.npy (one row per node index),
+# meta.json, and the torch checkpoint for incremental training (see incremental.py).
+# everything but the checkpoint can be read with numpy alone
+def model_path(name):
+    return os.path.join(MODEL_DIR, name)
+
+# save the final embeddings with the artist ID and name of every row
+def save_embeddings(name, embeddings, ids, names, **meta):
+    path = model_path(name)
+    os.makedirs(path, exist_ok=True)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    arrays = {'embeddings': embeddings, 'ids': np.asarray(ids, dtype=str), 'names': np.asarray(names, dtype=str)}
+
+    # each file is written to a temporary name and renamed, meta.json last
+    for array_name, array in arrays.items():
+        target = os.path.join(path, f'{array_name}.npy')
+        np.save(target + '.tmp.npy', array)
+        os.replace(target + '.tmp.npy', target)
+    meta = dict(meta, model=name, num_nodes=embeddings.shape[0], dim=embeddings.shape[1], saved_at=time.time())
+    with open(os.path.join(path, 'meta.json.tmp'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(os.path.join(path, 'meta.json.tmp'), os.path.join(path, 'meta.json'))
+
+# saved embeddings of a model, memory-mapped. returns (embeddings, ids, names, meta)
+def load_embeddings(name):
+    path = model_path(name)
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        raise FileNotFoundError(f"No saved embeddings for {name} in {path}, train the model first")
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    load = lambda array_name: np.load(os.path.join(path, f'{array_name}.npy'), mmap_mode='r')
+    return load('embeddings'), load('ids'), load('names'), meta
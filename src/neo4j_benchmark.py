@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import statistics
+import time
+from instrumentation import run_report, timer
+from logical_knowledge import GRAPH_MODELS, build_rule_query
+from neo4j_client import close_driver, get_driver
+from populate_neo4j import ARTISTS_FILE, BATCH_SIZE, COLLABORATIONS_FILE, populate
+from rule_engine import DEFAULT_WEIGHTS
+
+SIZES = [0, 10000]  # 0 is the shipped data, other sizes are synthetic graphs from benchmark.py
+REPEATS = 3  # timed runs per query, the median is reported
+RESULTS_FILE = 'benchmarks/neo4j_models.json'
+
+# db hits of a profiled plan, summed over all operators
+def total_db_hits(plan):
+    return plan.get('dbHits', 0) + sum(total_db_hits(child) for child in plan.get('children', []))
+
+# time and db hits of the rule query on one graph model. every run streams all result rows
+def profile_query(model, weights, repeats=REPEATS):
+    query = build_rule_query(model=model)
+    with get_driver().session() as session:
+        summary = session.run('PROFILE ' + query, **weights).consume()
+        db_hits = total_db_hits(summary.profile)
+        rows = summary.profile.get('rows', 0)
+
+        seconds = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            with timer('neo4j_query', model=model):
+                session.run(query, **weights).consume()
+            seconds.append(time.perf_counter() - start)
+    return {'seconds': statistics.median(seconds), 'db_hits': db_hits, 'rows': rows}
+
+# replace the database contents with each graph in turn, loaded with both models side by side (the
+# artists keep their string properties next to the Genre/Country/City nodes), and profile the rule
+# query on each model
+def run_benchmark(sizes=SIZES, repeats=REPEATS, batch_size=BATCH_SIZE, workers=1, weights=DEFAULT_WEIGHTS):
+    report = {}
+    for size in sizes:
+        if size:
+            from benchmark import synthetic_graph
+
+            graph_dir = synthetic_graph(size)
+            files = os.path.join(graph_dir, 'artists.csv'), os.path.join(graph_dir, 'collaborations.csv')
+        else:
+            files = ARTISTS_FILE, COLLABORATIONS_FILE
+        label = str(size) if size else 'shipped'
+        with timer('neo4j_populate', graph=label):
+            populate(*files, bulk=True, batch_size=batch_size, workers=workers, normalized=True)
+
+        report[label] = {model: profile_query(model, weights, repeats) for model in GRAPH_MODELS}
+        for model, row in report[label].items():
+            print(f"{label:>8} | {model:>10} | {row['seconds']:.3f}s | {row['db_hits']:>12} db hits | {row['rows']} rows")
+        string, normalized = report[label]['string'], report[label]['normalized']
+        print(f"{label:>8} | normalized model: {string['seconds'] / max(normalized['seconds'], 1e-9):.2f}x faster, "
+              f"{string['db_hits'] / max(normalized['db_hits'], 1):.2f}x fewer db hits")
+    if sizes and sizes[-1]:
+        print(f"Neo4j now holds the synthetic {sizes[-1]}-artist graph, run populate_neo4j.py to reload the shipped data")
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the rule query on the string and the normalized Neo4j graph model")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="artists per graph, 0 for the shipped data")
+    parser.add_argument('--repeats', type=int, default=REPEATS, help="timed runs per query")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="rows per UNWIND transaction while loading")
+    parser.add_argument('--workers', type=int, default=1, help="parallel sessions while loading")
+    parser.add_argument('--output', default=RESULTS_FILE)
+    return parser.parse_args()
+
+def main(args):
+    report = run_benchmark(args.sizes, args.repeats, args.batch_size, args.workers)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    close_driver()
+
+if __name__ == "__main__":
+    args = parse_args()
+    with run_report('neo4j_benchmark'):
+        main(args)
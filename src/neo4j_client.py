@@ -0,0 +1,29 @@
+import atexit
+import threading
+
+# Neo4j connection
+URI = "bolt://localhost:7687"
+AUTH = ("neo4j", "knowledgegraphs")
+MAX_POOL_SIZE = 64  # connections shared by all sessions of a process, e.g. parallel partitions or batches
+
+_driver = None
+_driver_lock = threading.Lock()
+
+# the driver shared by every session of the process, created on first use. importing the neo4j
+# package and opening the connection pool waits until a command actually talks to the database
+def get_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is None:
+            from neo4j import GraphDatabase
+
+            _driver = GraphDatabase.driver(URI, auth=AUTH, max_connection_pool_size=MAX_POOL_SIZE)
+            atexit.register(close_driver)
+        return _driver
+
+def close_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
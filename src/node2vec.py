@@ -1,88 +1,306 @@
-import pandas as pd
+import argparse
+import os
+import time
+import numpy as np
 import torch
+from torch.utils.data import DataLoader
 from torch_geometric.nn import Node2Vec
-from sklearn.metrics.pairwise import cosine_similarity
-
-artists_df = pd.read_csv("data/artists.csv")
-collabs_df = pd.read_csv("data/collaborations.csv")
-
-# keep only artists that appear in collaborations
-connected_ids = set(collabs_df["artist_1"]) | set(collabs_df["artist_2"])
-artists_df = artists_df[artists_df["id"].isin(connected_ids)].reset_index(drop=True)
-
-# rebuild mappings
-id_map = {artist_id: idx for idx, artist_id in enumerate(artists_df["id"])}
-
-edges = []
-for a, b in zip(collabs_df["artist_1"], collabs_df["artist_2"]):
-    a1 = id_map.get(a)
-    a2 = id_map.get(b)
-    if a1 is not None and a2 is not None:
-        edges.append([a1, a2])
-        edges.append([a2, a1])  # ensure bi-directional edges
-
-edge_index = torch.tensor(edges, dtype=torch.long).t().contiguous()
-
-node2vec = Node2Vec(
-    edge_index,
-    embedding_dim=32,
-    walk_length=15,  
-    context_size=10,
-    walks_per_node=10,  
-    num_negative_samples=5,  
-    sparse=True
-)
-
-# Training setup
+from graph_store import open_store
+from scoring import build_edge_keys, has_edges, normalize_rows, top_k_for_rows, top_k_pairs
+from ann_index import N_PROBE, IVFIndex, top_k_pairs_ann
+from incremental import DELTA_HOPS, GraphDelta, load_checkpoint, save_checkpoint
+from model_store import save_embeddings
+from predict import predict
+from instrumentation import observe, run_report, timed, timer
+from walk_corpus import WALK_DIR, build_corpus, random_walks
+
+ARTISTS_FILE = 'data/artists.csv'
+COLLABORATIONS_FILE = 'data/collaborations.csv'
+PREDICTIONS_FILE = 'predictions/node2vec.csv'
+TOP_K = 200
+SCORING_BLOCK_SIZE = 1024  # rows scored per matmul, bounds memory to SCORING_BLOCK_SIZE x num_nodes
+SCORING_BACKEND = 'exact'  # 'exact' scores every pair, 'ann' only each artist's approximate nearest neighbours
+EPOCHS = 200
+MODEL_NAME = 'node2vec'
+INCREMENTAL_EPOCHS = 20  # epochs over the walks of affected artists in an incremental update
+WALK_LENGTH = 15
+CONTEXT_SIZE = 10
+WALKS_PER_NODE = 10
+NUM_NEGATIVE_SAMPLES = 5
+BATCH_SIZE = 128  # start nodes per training batch
+LOADER_WORKERS = min(2, (os.cpu_count() or 1) - 1)  # processes cutting contexts and negatives from the walk corpus ahead of the training step
+PREFETCH_BATCHES = 4  # batches each loader worker keeps ready
+
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
-node2vec = node2vec.to(device)
-loader = node2vec.loader(batch_size=128, shuffle=True)
-optimizer = torch.optim.SparseAdam(list(node2vec.parameters()), lr=0.01)
 
-# 1 epoch of training
-def train():
+# keep only artists that appear in collaborations. returns their store indices,
+# the store -> connected-artist index map and the collaboration pairs in connected indices
+def load_graph(store):
+    connected = np.flatnonzero(store.degree() > 0)
+
+    # rebuild mappings from store indices to connected-artist indices
+    id_map = np.full(store.num_nodes, -1, dtype=np.int64)
+    id_map[connected] = np.arange(len(connected))
+    return connected, id_map, id_map[store.edges]
+
+def build_model(pairs, num_nodes):
+    # ensure bi-directional edges
+    edges = np.stack([pairs, pairs[:, ::-1]], axis=1).reshape(-1, 2)
+    edge_index = torch.from_numpy(edges).t().contiguous()
+
+    node2vec = Node2Vec(
+        edge_index,
+        embedding_dim=32,
+        walk_length=WALK_LENGTH,
+        context_size=CONTEXT_SIZE,
+        walks_per_node=WALKS_PER_NODE,
+        num_negative_samples=NUM_NEGATIVE_SAMPLES,
+        sparse=True,
+        num_nodes=num_nodes,
+    )
+    return node2vec.to(device)
+
+# CSR adjacency of the connected artists, in connected-artist indices.
+# artists without collaborations have empty rows, so the store's offsets carry over
+def connected_csr(store, connected, id_map):
+    return np.append(store.indptr[connected], store.indptr[-1]), id_map[store.indices]
+
+# positive contexts and negative samples cut from precomputed walks, the same way as Node2Vec.sample
+# cuts them from walks it samples on the fly
+class WalkSampler:
+    def __init__(self, walks, num_nodes, context_size=CONTEXT_SIZE, num_negative_samples=NUM_NEGATIVE_SAMPLES):
+        self.walks = walks
+        self.num_nodes = num_nodes
+        self.context_size = context_size
+        self.num_negative_samples = num_negative_samples
+
+    # every window of context_size consecutive nodes of every walk
+    def windows(self, rw):
+        return torch.cat([rw[:, j:j + self.context_size] for j in range(rw.size(1) - self.context_size + 1)], dim=0)
+
+    def sample(self, batch):
+        rows = np.sort(np.asarray(batch))  # sorted, so reads from the memory map go forwards
+        pos_rw = torch.from_numpy(self.walks[rows].astype(np.int64))
+        start = pos_rw[:, 0].repeat(self.num_negative_samples)
+        neg_rw = torch.randint(self.num_nodes, (start.size(0), pos_rw.size(1) - 1))
+        neg_rw = torch.cat([start.view(-1, 1), neg_rw], dim=-1)
+        return self.windows(pos_rw), self.windows(neg_rw)
+
+    # batches hold the walks of batch_size start nodes, like Node2Vec.loader(batch_size=...)
+    def loader(self, batch_size=BATCH_SIZE, walks_per_node=WALKS_PER_NODE, num_workers=LOADER_WORKERS):
+        return DataLoader(range(len(self.walks)), batch_size=batch_size * walks_per_node, shuffle=True,
+                          collate_fn=self.sample, num_workers=num_workers, persistent_workers=num_workers > 0,
+                          prefetch_factor=PREFETCH_BATCHES if num_workers > 0 else None)
+
+# training batches streamed from the cached walk corpus of the connected graph, generated on first use
+def corpus_loader(store, connected, id_map, num_workers=LOADER_WORKERS, corpus_dir=WALK_DIR):
+    rowptr, col = connected_csr(store, connected, id_map)
+    with timer('walk_corpus', model=MODEL_NAME):
+        walks = build_corpus(rowptr, col, WALK_LENGTH, WALKS_PER_NODE, corpus_dir=corpus_dir)
+    return WalkSampler(walks, len(connected)).loader(num_workers=num_workers)
+
+# 1 epoch of training. walk sampling happens in the loader, so samples/sec covers it too
+def train(node2vec, loader, optimizer):
     node2vec.train()
+    start = time.perf_counter()
     total_loss = 0
+    total_walks = 0
     for pos_rw, neg_rw in loader:
         optimizer.zero_grad()
         loss = node2vec.loss(pos_rw.to(device), neg_rw.to(device))
         loss.backward()
         optimizer.step()
         total_loss += loss.item()
+        total_walks += pos_rw.size(0) + neg_rw.size(0)
+    observe('train_samples_per_second', total_walks / (time.perf_counter() - start), model=MODEL_NAME)
     return total_loss / len(loader)
 
 # training loop
-for epoch in range(1, 201):
-    loss = train()
-    print(f"Epoch {epoch:03d} | Loss: {loss:.4f}")
-
-# prepare to score unconnected nodes
-node2vec.eval()
-embeddings = node2vec.embedding.weight.detach().cpu()
-num_nodes = len(artists_df)
-existing = set(tuple(sorted((id_map[a], id_map[b]))) for a, b in zip(collabs_df["artist_1"], collabs_df["artist_2"]))
-scores = []
-
-# scoring
-for i in range(num_nodes):
-    for j in range(i + 1, num_nodes):
-        if (i, j) not in existing:
-            sim = cosine_similarity([embeddings[i]], [embeddings[j]])[0][0]
-            # NOTE: optional fix for Windows OS:
-            # vec_i = embeddings[i].detach().cpu().numpy() if hasattr(embeddings[i], 'detach') else embeddings[i]
-            # vec_j = embeddings[j].detach().cpu().numpy() if hasattr(embeddings[j], 'detach') else embeddings[j]
-            # sim = cosine_similarity([vec_i], [vec_j])[0][0]
-            scores.append((i, j, sim))
-
-# sort top results - similar to how it is logged for prediction with logical rule
-top_links = sorted(scores, key=lambda x: x[2], reverse=True)[:200]
+@timed('training', model=MODEL_NAME)
+def fit(node2vec, loader, epochs=EPOCHS):
+    optimizer = torch.optim.SparseAdam(list(node2vec.parameters()), lr=0.01)
+    for epoch in range(1, epochs + 1):
+        loss = train(node2vec, loader, optimizer)
+        print(f"Epoch {epoch:03d} | Loss: {loss:.4f}")
+
+def get_embeddings(node2vec):
+    node2vec.eval()
+    return node2vec.embedding.weight.detach().cpu().numpy()
+
+# scoring: blocked matmul over unit vectors, keeping only the best TOP_K pairs
+# sorted like the output of the prediction with logical rules
+@timed('scoring', model=MODEL_NAME)
+def score_pairs(embeddings, existing, top_k=TOP_K, backend=SCORING_BACKEND, n_probe=N_PROBE):
+    if backend == 'ann':
+        index = IVFIndex.build(embeddings, n_probe=n_probe)
+        return top_k_pairs_ann(index, top_k, block_size=SCORING_BLOCK_SIZE, edge_keys=existing)
+    return top_k_pairs(normalize_rows(embeddings), top_k, block_size=SCORING_BLOCK_SIZE, edge_keys=existing)
+
+# copy the embeddings of a checkpoint into the grown table of the current graph.
+# new artists start at the mean of their already embedded collaborators
+def warm_start(node2vec, checkpoint, rows, store, connected, id_map):
+    weight = node2vec.embedding.weight.data
+    old = checkpoint['state_dict']['embedding.weight'].to(weight.device)
+    kept = rows >= 0
+    weight[torch.from_numpy(rows[kept])] = old[torch.from_numpy(np.flatnonzero(kept))]
+
+    embedded = np.zeros(len(connected), dtype=bool)
+    embedded[rows[kept]] = True
+    for row in np.flatnonzero(~embedded).tolist():
+        neighbours = id_map[store.neighbours(connected[row])]
+        neighbours = neighbours[embedded[neighbours]]
+        if len(neighbours):
+            weight[row] = weight[torch.from_numpy(neighbours)].mean(dim=0)
+
+# previous top pairs that do not touch affected artists, plus fresh candidates of the affected
+# artists, rescored with the current embeddings and cut back to the best top_k
+@timed('scoring', model=MODEL_NAME)
+def rerank_pairs(embeddings, existing, old_ranking, rows, affected, top_k=TOP_K):
+    normalized = normalize_rows(embeddings)
+    num_nodes = len(normalized)
+
+    old_i, old_j, _ = old_ranking
+    i, j = rows[old_i], rows[old_j]
+    keep = (i >= 0) & (j >= 0)
+    i, j = i[keep], j[keep]
+    keep = ~affected[i] & ~affected[j] & ~has_edges(existing, i, j, num_nodes)
+    cand_i, cand_j = [i[keep]], [j[keep]]
+
+    for block_rows, indices, scores in top_k_for_rows(normalized, np.flatnonzero(affected), top_k,
+                                                      SCORING_BLOCK_SIZE, existing):
+        scored = np.isfinite(scores).ravel()
+        cand_i.append(np.repeat(block_rows, indices.shape[1])[scored])
+        cand_j.append(indices.ravel()[scored])
+
+    # unordered pairs, each once
+    pairs = np.unique(np.sort(np.stack([np.concatenate(cand_i), np.concatenate(cand_j)], axis=1), axis=1), axis=0)
+    scores = (normalized[pairs[:, 0]] * normalized[pairs[:, 1]]).sum(axis=1)
+    order = np.lexsort((pairs[:, 1], pairs[:, 0], -scores))[:top_k]
+    return [(a, b, s) for (a, b), s in zip(pairs[order].tolist(), scores[order].tolist())]
+
+# warm-started update: grow the embedding table, resample walks only for artists within a few hops
+# of changed collaborations and re-rank pairs of those artists. returns None without a checkpoint
+def update_incrementally(node2vec, store, connected, id_map, existing, top_k=TOP_K, epochs=INCREMENTAL_EPOCHS,
+                         hops=DELTA_HOPS):
+    checkpoint = load_checkpoint(MODEL_NAME)
+    if checkpoint is None:
+        print("No checkpoint found, training from scratch.")
+        return None
+
+    # the checkpoint only holds connected artists, unconnected ones are not new
+    delta = GraphDelta(store, checkpoint['ids'], checkpoint['edges'], hops, nodes=store.degree() > 0)
+    print(f"Graph delta: {delta.summary()}")
+
+    # old embedding rows -> current rows, -1 if the artist is gone or no longer connected
+    rows = np.where(delta.remap >= 0, id_map[np.maximum(delta.remap, 0)], -1)
+    warm_start(node2vec, checkpoint, rows, store, connected, id_map)
+
+    affected = delta.affected[connected]
+    affected_rows = np.flatnonzero(affected)
+    if len(affected_rows):
+        # fresh walks from the affected artists only, few enough to keep in memory
+        rowptr, col = connected_csr(store, connected, id_map)
+        walks = random_walks(rowptr, col, np.tile(affected_rows, WALKS_PER_NODE), WALK_LENGTH, np.random.default_rng())
+        fit(node2vec, WalkSampler(walks, len(connected)).loader(num_workers=0), epochs)
+
+    print(f"Re-ranking pairs of {len(affected_rows)} of {len(connected)} artists")
+    old_ranking = tuple(np.asarray(col) for col in checkpoint['ranking'])
+    return rerank_pairs(get_embeddings(node2vec), existing, old_ranking, rows, affected, top_k)
+
+# epoch time and training throughput of on-the-fly walk sampling vs the precomputed walk corpus.
+# the corpus is built (or loaded from the cache) before timing, its build time is reported separately
+def compare_loaders(node2vec, store, connected, id_map, epochs=3, num_workers=LOADER_WORKERS):
+    start = time.perf_counter()
+    loaders = {'online': node2vec.loader(batch_size=BATCH_SIZE, shuffle=True)}
+    loaders['corpus'] = corpus_loader(store, connected, id_map, num_workers)
+    print(f"Walk corpus ready in {time.perf_counter() - start:.2f}s")
+
+    report = {}
+    for name, loader in loaders.items():
+        node2vec.reset_parameters()
+        optimizer = torch.optim.SparseAdam(list(node2vec.parameters()), lr=0.01)
+        start = time.perf_counter()
+        samples = 0
+        for _ in range(epochs):
+            for pos_rw, neg_rw in loader:
+                optimizer.zero_grad()
+                node2vec.loss(pos_rw.to(device), neg_rw.to(device)).backward()
+                optimizer.step()
+                samples += pos_rw.size(0) + neg_rw.size(0)
+        elapsed = time.perf_counter() - start
+        report[name] = {'epoch_time': elapsed / epochs, 'samples_per_second': samples / elapsed}
+
+    for name, row in report.items():
+        print(f"{name:>6} | {row['epoch_time']:.3f}s / epoch | {row['samples_per_second']:.0f} samples/s")
+    return report
 
 # write results to CSV
-csv_data = []
-for i, j, score in top_links:
-    artist_1_name = artists_df.loc[i, 'name']
-    artist_2_name = artists_df.loc[j, 'name']
-    csv_data.append([artist_1_name, artist_2_name, score])
-csv_df = pd.DataFrame(csv_data, columns=["Artist 1", "Artist 2", "Score"])
-csv_df.to_csv("predictions/node2vec.csv", index=False)
-print(f"Collaborations saved to predictions/node2vec.csv")
\ No newline at end of file
+@timed('csv_write', model=MODEL_NAME)
+def write_predictions(top_links, artist_names):
+    import pandas as pd
+
+    csv_data = []
+    for i, j, score in top_links:
+        artist_1_name = artist_names[i]
+        artist_2_name = artist_names[j]
+        csv_data.append([artist_1_name, artist_2_name, score])
+    csv_df = pd.DataFrame(csv_data, columns=["Artist 1", "Artist 2", "Score"])
+    csv_df.to_csv(PREDICTIONS_FILE, index=False)
+    print(f"Collaborations saved to {PREDICTIONS_FILE}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="node2vec link prediction")
+    parser.add_argument('--incremental', action='store_true', help="warm-start from the last checkpoint and only retrain near new collaborations")
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--incremental-epochs', type=int, default=INCREMENTAL_EPOCHS)
+    parser.add_argument('--predict-only', action='store_true', help="rank the saved embeddings without training")
+    parser.add_argument('--top-k', type=int, default=TOP_K, help="number of predicted pairs")
+    parser.add_argument('--walks', choices=['corpus', 'online'], default='corpus',
+                        help="train on the cached walk corpus, or sample walks on the fly every epoch")
+    parser.add_argument('--loader-workers', type=int, default=LOADER_WORKERS, help="processes preparing corpus batches")
+    parser.add_argument('--compare-loaders', action='store_true', help="only compare epoch throughput of both walk sources")
+    parser.add_argument('--backend', choices=['exact', 'ann'], default=SCORING_BACKEND,
+                        help="score every pair, or only each artist's approximate nearest neighbours from an IVF index")
+    parser.add_argument('--n-probe', type=int, default=N_PROBE, help="IVF clusters scanned per artist with --backend ann")
+    return parser.parse_args()
+
+def main(args):
+    if args.predict_only:
+        predict(MODEL_NAME, args.top_k)
+        return
+
+    with timer('load', model=MODEL_NAME):
+        store = open_store(ARTISTS_FILE, COLLABORATIONS_FILE)
+        connected, id_map, pairs = load_graph(store)
+        num_nodes = len(connected)
+        existing = build_edge_keys(pairs[:, 0], pairs[:, 1], num_nodes)
+
+    node2vec = build_model(pairs, num_nodes)
+    if args.compare_loaders:
+        compare_loaders(node2vec, store, connected, id_map, num_workers=args.loader_workers)
+        return
+
+    top_links = None
+    if args.incremental:
+        top_links = update_incrementally(node2vec, store, connected, id_map, existing, args.top_k, args.incremental_epochs)
+
+    if top_links is None:
+        if args.walks == 'corpus':
+            loader = corpus_loader(store, connected, id_map, args.loader_workers)
+        else:
+            loader = node2vec.loader(batch_size=BATCH_SIZE, shuffle=True)
+        fit(node2vec, loader, args.epochs)
+        top_links = score_pairs(get_embeddings(node2vec), existing, args.top_k, args.backend, args.n_probe)
+
+    write_predictions(top_links, store.names[connected])
+
+    ranking = tuple(np.array(col) for col in zip(*top_links)) if top_links else (np.empty(0, np.int64),) * 3
+    with timer('save', model=MODEL_NAME):
+        save_checkpoint(MODEL_NAME, node2vec.state_dict(), store.ids[connected], pairs, ranking)
+        save_embeddings(MODEL_NAME, get_embeddings(node2vec), store.ids[connected], store.names[connected],
+                        ranking='pairs', top_k=args.top_k, predictions_file=PREDICTIONS_FILE, graph_store=store.path)
+
+if __name__ == "__main__":
+    args = parse_args()
+    with run_report(MODEL_NAME):
+        main(args)
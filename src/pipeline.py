@@ -0,0 +1,198 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from instrumentation import REPORTS_DIR
+
+ARTISTS_FILE = 'data/artists.csv'
+COLLABORATIONS_FILE = 'data/collaborations.csv'
+STATE_FILE = 'data/.pipeline_state.json'
+GRAPH_STORE_DIR = 'data/.graph_store'
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+JOBS = 3  # stages run at the same time, enough for the three predictors
+
+# one step of the pipeline: a script run with arguments. it is skipped when the content of its
+# inputs (data files and the source files it runs) and its arguments did not change since its
+# last successful run and all its outputs still exist
+class Stage:
+    def __init__(self, name, script, args=(), inputs=(), sources=(), outputs=(), deps=(), always=False):
+        self.name = name
+        self.script = script
+        self.args = list(args)
+        self.inputs = list(inputs)
+        self.sources = [os.path.join(SRC_DIR, f) for f in [script, *sources]]
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.always = always  # e.g. the crawler, whose real input is the Spotify API
+
+    @property
+    def command(self):
+        return [sys.executable, os.path.join(SRC_DIR, self.script), *self.args]
+
+    def key(self, hashes):
+        h = hashlib.sha256(json.dumps([self.name, self.args]).encode())
+        for path in self.inputs + self.sources:
+            h.update(f'{path}:{hashes.file(path)}'.encode())
+        return h.hexdigest()[:16]
+
+# content hashes of files, remembered by size and mtime so unchanged files are not read again
+class FileHashes:
+    def __init__(self, known=None):
+        self.known = known or {}
+
+    def file(self, path):
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        entry = self.known.get(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        self.known[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': h.hexdigest()}
+        return self.known[path]['sha256']
+
+# the stages as a DAG: crawl -> graph store (+ Neo4j) -> the three predictors.
+# the predictors only depend on the data, so they run side by side
+def build_stages(crawl=False, rules_backend='neo4j', incremental=False, tuned=False, graph_model='string'):
+    data = [ARTISTS_FILE, COLLABORATIONS_FILE]
+    upstream = ['crawl'] if crawl else []
+    stages = []
+    if crawl:
+        stages.append(Stage('crawl', 'load_spotify_data.py', outputs=data, always=True,
+                            sources=['crawl_journal.py', 'frontier.py', 'rate_limit.py', 'response_cache.py']))
+
+    # compile the graph store once, instead of every predictor racing to compile it
+    stages.append(Stage('graph_store', 'graph_store.py', inputs=data, outputs=[GRAPH_STORE_DIR], deps=upstream))
+
+    rules_inputs = data + ([os.path.join('models', 'rules', 'weights.json')] if tuned else [])
+    rules_args = ['--tuned'] if tuned else []
+    if rules_backend == 'neo4j':
+        normalized = graph_model == 'normalized'
+        stages.append(Stage('neo4j', 'populate_neo4j.py', ['--bulk'] + (['--normalized'] if normalized else []),
+                            inputs=data, sources=['instrumentation.py', 'neo4j_client.py'], deps=upstream))
+        stages.append(Stage('rules', 'logical_knowledge.py', rules_args + (['--graph-model', graph_model] if normalized else []),
+                            inputs=rules_inputs, sources=['instrumentation.py', 'neo4j_client.py', 'rule_engine.py'],
+                            outputs=['predictions/logical_rules.csv'], deps=['neo4j']))
+    else:
+        stages.append(Stage('rules', 'rule_engine.py', rules_args, inputs=rules_inputs,
+                            sources=['graph_store.py', 'scoring.py', 'instrumentation.py', 'model_store.py'],
+                            outputs=['predictions/logical_rules.csv'], deps=['graph_store']))
+
+    model_args = ['--incremental'] if incremental else []
+    model_sources = ['graph_store.py', 'scoring.py', 'ann_index.py', 'incremental.py', 'model_store.py', 'predict.py',
+                     'quantize.py', 'instrumentation.py']
+    stages.append(Stage('graphSAGE', 'graphSAGE.py', model_args, inputs=data, sources=model_sources,
+                        outputs=['predictions/graphSAGE.csv', 'models/graphSAGE/meta.json'], deps=['graph_store']))
+    stages.append(Stage('node2vec', 'node2vec.py', model_args, inputs=data, sources=model_sources + ['walk_corpus.py'],
+                        outputs=['predictions/node2vec.csv', 'models/node2vec/meta.json'], deps=['graph_store']))
+    return stages
+
+def load_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return {'stages': {}, 'files': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+# run a stage script, its output goes to reports/pipeline-<stage>.log
+def run_stage(stage, threads):
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    log_path = os.path.join(REPORTS_DIR, f'pipeline-{stage.name}.log')
+    # stages running side by side share the cores instead of each starting one thread per core
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads), MKL_NUM_THREADS=str(threads))
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        returncode = subprocess.run(stage.command, stdout=log, stderr=subprocess.STDOUT, env=env).returncode
+    return returncode, time.perf_counter() - start, log_path
+
+# run the DAG: a stage starts once its dependencies are done, up to `jobs` at a time. a stage
+# whose key is unchanged is skipped, a failed stage skips its dependents. returns True if nothing failed
+def run_pipeline(stages, jobs=JOBS, force=(), dry_run=False, state_path=STATE_FILE):
+    state = load_state(state_path)
+    hashes = FileHashes(state['files'])
+    by_name = {stage.name: stage for stage in stages}
+    pending = list(stages)
+    done, failed = set(), set()
+    running = {}
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for stage in list(pending):
+                if any(dep in failed for dep in stage.deps):
+                    print(f"{stage.name:>12} | skipped, a dependency failed")
+                    failed.add(stage.name)
+                    pending.remove(stage)
+                    continue
+                if not all(dep in done for dep in stage.deps if dep in by_name):
+                    continue
+                if len(running) >= jobs:
+                    break
+
+                pending.remove(stage)
+                key = stage.key(hashes)
+                previous = state['stages'].get(stage.name, {})
+                fresh = (previous.get('key') == key and not stage.always and stage.name not in force
+                         and all(os.path.exists(path) for path in stage.outputs))
+                if fresh or dry_run:
+                    print(f"{stage.name:>12} | {'up to date' if fresh else 'would run'}")
+                    done.add(stage.name)
+                    continue
+                print(f"{stage.name:>12} | running: {' '.join(stage.command[1:])}")
+                running[pool.submit(run_stage, stage, threads)] = (stage, key)
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, key = running.pop(future)
+                returncode, elapsed, log_path = future.result()
+                if returncode != 0:
+                    print(f"{stage.name:>12} | FAILED with exit code {returncode} after {elapsed:.1f}s, see {log_path}")
+                    failed.add(stage.name)
+                    continue
+                state['stages'][stage.name] = {'key': key, 'seconds': elapsed, 'finished_at': time.time()}
+                save_state(dict(state, files=hashes.known), state_path)
+                print(f"{stage.name:>12} | done in {elapsed:.1f}s")
+                done.add(stage.name)
+
+    save_state(dict(state, files=hashes.known), state_path)
+    print(f"Pipeline {'failed' if failed else 'finished'} in {time.perf_counter() - start:.1f}s")
+    return not failed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the pipeline stages as a DAG, skipping stages whose inputs did not change")
+    parser.add_argument('--crawl', action='store_true', help="crawl new data first (always runs)")
+    parser.add_argument('--rules-backend', choices=['neo4j', 'sparse'], default='neo4j',
+                        help="logical rules through Neo4j, or in-process without a database")
+    parser.add_argument('--incremental', action='store_true', help="warm-start the predictors from their checkpoints")
+    parser.add_argument('--tuned', action='store_true', help="logical rules with the weights saved by tune_rules.py")
+    parser.add_argument('--graph-model', choices=['string', 'normalized'], default='string',
+                        help="Neo4j model of genres and locations: string properties, or Genre/Country/City nodes")
+    parser.add_argument('--jobs', type=int, default=JOBS, help="stages run at the same time")
+    parser.add_argument('--force', nargs='*', default=None, help="stages to run even if they are up to date (none given: all)")
+    parser.add_argument('--dry-run', action='store_true', help="only show which stages would run")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    stages = build_stages(args.crawl, args.rules_backend, args.incremental, args.tuned, args.graph_model)
+    force = [stage.name for stage in stages] if args.force == [] else args.force or []
+    if not run_pipeline(stages, args.jobs, force, args.dry_run):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
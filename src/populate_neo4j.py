@@ -1,19 +1,31 @@
-from neo4j import GraphDatabase
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import argparse
 import csv
-
-# neo4j connection
-URI = "bolt://localhost:7687"
-AUTH = ("neo4j", "knowledgegraphs")
-driver = GraphDatabase.driver(URI, auth=AUTH)
+import time
+from instrumentation import count, gauge, run_report, timed
+from neo4j_client import close_driver, get_driver
 
 ARTISTS_FILE = 'data/artists.csv'
 COLLABORATIONS_FILE = 'data/collaborations.csv'
+BATCH_SIZE = 5000  # rows per UNWIND transaction in bulk mode
+DELETE_BATCH_SIZE = 10000  # relationships or nodes deleted per transaction when clearing the database
+
+# normalized model: CSV column -> (label, key property, relationship from the artist) of the nodes
+# that replace the comma-joined genres and the country/begin_area properties
+ATTRIBUTES = {
+    'genres': ('Genre', 'name', 'HAS_GENRE'),
+    'country': ('Country', 'code', 'FROM_COUNTRY'),
+    'begin_area': ('City', 'name', 'STARTED_IN'),
+}
 
-# clear all nodes and relationships
-def clear_all():
-    with driver.session() as session:
+# clear all nodes and relationships in transactions of batch_size rows, so clearing a large graph
+# never holds it all in one transaction. relationships go first, so deleting a highly connected
+# node does not detach all of its relationships at once
+def clear_all(batch_size=DELETE_BATCH_SIZE):
+    with get_driver().session() as session:
         print("Clearing all nodes and relationships...")
-        session.run("MATCH (n) DETACH DELETE n")
+        session.run(f"MATCH ()-[r]->() CALL {{ WITH r DELETE r }} IN TRANSACTIONS OF {int(batch_size)} ROWS").consume()
+        session.run(f"MATCH (n) CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF {int(batch_size)} ROWS").consume()
         print("All nodes and relationships have been cleared.")
 
 # create artists (nodes)
@@ -54,41 +66,226 @@ def create_collaboration(tx, artist_1, artist_2):
     """
     tx.run(query, artist_1=artist_1, artist_2=artist_2)
 
+# convert a CSV row into create_artist parameters
+def artist_params(row):
+    return {
+        'artist_id': row["id"],
+        'name': row["name"],
+        'followers': int(row["followers"]) if row["followers"] else 0,
+        'genres': row["genres"],
+        'popularity': int(row["popularity"]) if row["popularity"] else 0,
+        'num_albums': int(row["num_albums"]) if row.get("num_albums") else 0,
+        'debut_year': int(row["debut_year"]) if row.get("debut_year") else 0,
+        'last_active_year': int(row["last_active_year"]) if row.get("last_active_year") else 0,
+        'active_years': int(row["active_years"]) if row.get("active_years") else 0,
+        'country': row["country"],
+        'begin_area': row["begin_area"],
+    }
+
 # load artists from CSV
+@timed('neo4j_load', kind='artists')
 def load_artists(csv_file):
-    with driver.session() as session:
+    with get_driver().session() as session:
         with open(csv_file, 'r', encoding='utf-8') as file:
             reader = csv.DictReader(file)
             for row in reader:
-                session.execute_write(
-                    create_artist,
-                    row["id"],
-                    row["name"],
-                    int(row["followers"]) if row["followers"] else 0,
-                    row["genres"],
-                    int(row["popularity"]) if row["popularity"] else 0,
-                    int(row["num_albums"]) if row.get("num_albums") else 0,
-                    int(row["debut_year"]) if row.get("debut_year") else 0,
-                    int(row["last_active_year"]) if row.get("last_active_year") else 0,
-                    int(row["active_years"]) if row.get("active_years") else 0,
-                    row["country"],
-                    row["begin_area"]
-                )
+                session.execute_write(create_artist, **artist_params(row))
+                count('neo4j_rows_written', work='create_artist')
 
 # load collaborations from CSV
+@timed('neo4j_load', kind='collaborations')
 def load_collaborations(csv_file):
-    with driver.session() as session:
+    with get_driver().session() as session:
         with open(csv_file, 'r', encoding='utf-8') as file:
             reader = csv.DictReader(file)
             for row in reader:
                 session.execute_write(create_collaboration, row["artist_1"], row["artist_2"])
+                count('neo4j_rows_written', work='create_collaboration')
+
+# uniqueness constraint on Artist.id, which also backs the MATCH/MERGE lookups with an index
+def create_constraints():
+    with get_driver().session() as session:
+        session.run("CREATE CONSTRAINT artist_id IF NOT EXISTS FOR (a:Artist) REQUIRE a.id IS UNIQUE")
+        session.run("CALL db.awaitIndexes()")
+
+# create a batch of artists in one transaction
+def create_artists_batch(tx, rows):
+    query = """
+    UNWIND $rows AS row
+    MERGE (a:Artist {id: row.artist_id})
+    SET a.name = row.name,
+        a.followers = row.followers,
+        a.genres = row.genres,
+        a.popularity = row.popularity,
+        a.num_albums = row.num_albums,
+        a.debut_year = row.debut_year,
+        a.last_active_year = row.last_active_year,
+        a.active_years = row.active_years,
+        a.country = row.country,
+        a.begin_area = row.begin_area
+    """
+    tx.run(query, rows=rows).consume()
+
+# create a batch of collaborations in one transaction
+def create_collaborations_batch(tx, rows):
+    query = """
+    UNWIND $rows AS row
+    MATCH (a1:Artist {id: row.artist_1}), (a2:Artist {id: row.artist_2})
+    MERGE (a1)-[:COLLABORATED_WITH]->(a2)
+    """
+    tx.run(query, rows=rows).consume()
+
+# split an iterable into lists of at most batch_size items
+def batched(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# write batches with execute_write, optionally across several parallel sessions.
+# transient errors such as lock conflicts between parallel batches are retried by the driver
+def write_batches(work, batches, workers):
+    def run(batch):
+        with get_driver().session() as session:
+            session.execute_write(work, batch)
+        return len(batch)
+
+    start = time.perf_counter()
+    total = 0
+    if workers > 1:
+        # keep at most 2 batches per worker in flight, so the CSV is streamed instead of read up front
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for batch in batches:
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    total += sum(f.result() for f in done)
+                pending.add(pool.submit(run, batch))
+            total += sum(f.result() for f in pending)
+    else:
+        with get_driver().session() as session:
+            for batch in batches:
+                session.execute_write(work, batch)
+                total += len(batch)
+    elapsed = time.perf_counter() - start
+    count('neo4j_rows_written', total, work=work.__name__)
+    gauge('neo4j_rows_per_second', total / max(elapsed, 1e-9), work=work.__name__)
+    return total, elapsed
+
+# uniqueness constraints on the attribute nodes of the normalized model. each is backed by an
+# index, which the MERGE/MATCH lookups while linking artists use
+def create_normalized_constraints():
+    with get_driver().session() as session:
+        for label, key, _ in ATTRIBUTES.values():
+            session.run(f"CREATE CONSTRAINT {label.lower()}_{key} IF NOT EXISTS FOR (n:{label}) REQUIRE n.{key} IS UNIQUE")
+        session.run("CALL db.awaitIndexes()")
+
+# attribute values of a CSV row: distinct genres with surrounding spaces stripped, and the country
+# and city if set. empty values get no node
+def artist_attributes(row):
+    genres = [genre.strip() for genre in row['genres'].split(',')]
+    return {
+        'genres': [genre for genre in dict.fromkeys(genres) if genre],
+        'country': [row['country']] if row['country'] else [],
+        'begin_area': [row['begin_area']] if row['begin_area'] else [],
+    }
+
+# transaction functions creating the nodes of one attribute and linking artists to them
+def attribute_writers(label, key, relationship):
+    def create_nodes(tx, rows):
+        tx.run(f"UNWIND $rows AS value MERGE (:{label} {{{key}: value}})", rows=rows).consume()
+
+    def create_links(tx, rows):
+        query = f"""
+        UNWIND $rows AS row
+        MATCH (a:Artist {{id: row.artist_id}}), (n:{label} {{{key}: row.value}})
+        MERGE (a)-[:{relationship}]->(n)
+        """
+        tx.run(query, rows=rows).consume()
+
+    create_nodes.__name__ = f'create_{label.lower()}_nodes'
+    create_links.__name__ = f'create_{relationship.lower()}_links'
+    return create_nodes, create_links
+
+# normalized model: Genre, Country and City nodes, linked from the artists already loaded.
+# the distinct values are created first, so parallel link batches never race to create a node
+@timed('neo4j_load', kind='attributes')
+def load_attributes_batched(csv_file, batch_size=BATCH_SIZE, workers=1):
+    values = {column: set() for column in ATTRIBUTES}
+    with open(csv_file, 'r', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            for column, row_values in artist_attributes(row).items():
+                values[column].update(row_values)
+
+    for column, (label, key, relationship) in ATTRIBUTES.items():
+        create_nodes, create_links = attribute_writers(label, key, relationship)
+        write_batches(create_nodes, batched(sorted(values[column]), batch_size), 1)
+        with open(csv_file, 'r', encoding='utf-8') as file:
+            links = ({'artist_id': row['id'], 'value': value}
+                     for row in csv.DictReader(file) for value in artist_attributes(row)[column])
+            total, elapsed = write_batches(create_links, batched(links, batch_size), workers)
+        print(f"Created {total} {relationship} links to {len(values[column])} {label} nodes in {elapsed:.1f}s")
+
+# load artists from CSV in UNWIND batches
+@timed('neo4j_load', kind='artists')
+def load_artists_batched(csv_file, batch_size=BATCH_SIZE, workers=1):
+    with open(csv_file, 'r', encoding='utf-8') as file:
+        rows = (artist_params(row) for row in csv.DictReader(file))
+        total, elapsed = write_batches(create_artists_batch, batched(rows, batch_size), workers)
+    print(f"Loaded {total} artists in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/sec)")
+
+# load collaborations from CSV in UNWIND batches
+@timed('neo4j_load', kind='collaborations')
+def load_collaborations_batched(csv_file, batch_size=BATCH_SIZE, workers=1):
+    with open(csv_file, 'r', encoding='utf-8') as file:
+        rows = ({'artist_1': row["artist_1"], 'artist_2': row["artist_2"]} for row in csv.DictReader(file))
+        total, elapsed = write_batches(create_collaborations_batch, batched(rows, batch_size), workers)
+    print(f"Loaded {total} collaborations in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/sec)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Populate Neo4j from the CSV files")
+    parser.add_argument('--bulk', action='store_true', help="load in batched UNWIND transactions")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="rows per UNWIND transaction")
+    parser.add_argument('--workers', type=int, default=1, help="parallel sessions writing batches")
+    parser.add_argument('--normalized', action='store_true',
+                        help="also create Genre, Country and City nodes linked to the artists")
+    parser.add_argument('--delete-batch-size', type=int, default=DELETE_BATCH_SIZE,
+                        help="rows deleted per transaction when clearing the database")
+    parser.add_argument('--constraints-only', action='store_true',
+                        help="only create the constraints, e.g. after an offline import of bulk_export.py files")
+    return parser.parse_args()
 
+# load a graph from CSV files, optionally with the normalized attribute nodes
+def populate(artists_file=ARTISTS_FILE, collaborations_file=COLLABORATIONS_FILE, bulk=False, batch_size=BATCH_SIZE,
+             workers=1, normalized=False, delete_batch_size=DELETE_BATCH_SIZE):
+    clear_all(delete_batch_size)
+    if bulk or normalized:
+        create_constraints()
+    if bulk:
+        load_artists_batched(artists_file, batch_size, workers)
+        load_collaborations_batched(collaborations_file, batch_size, workers)
+    else:
+        load_artists(artists_file)
+        load_collaborations(collaborations_file)
+    if normalized:
+        create_normalized_constraints()
+        load_attributes_batched(artists_file, batch_size, workers)
 
-def main():
-    clear_all()
-    load_artists(ARTISTS_FILE)
-    load_collaborations(COLLABORATIONS_FILE)
-    driver.close()
+def main(args):
+    if args.constraints_only:
+        create_constraints()
+        if args.normalized:
+            create_normalized_constraints()
+    else:
+        populate(ARTISTS_FILE, COLLABORATIONS_FILE, args.bulk, args.batch_size, args.workers, args.normalized,
+                 args.delete_batch_size)
+    close_driver()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    with run_report('populate_neo4j'):
+        main(args)
@@ -0,0 +1,130 @@
+import argparse
+import csv
+import time
+import numpy as np
+from graph_store import open_store
+from model_store import load_embeddings
+from quantize import PRECISIONS, load_table, rerank
+from scoring import build_edge_keys, has_edges, normalize_rows, top_k_pairs, top_k_per_row
+from instrumentation import run_report, timer
+
+ARTISTS_FILE = 'data/artists.csv'
+COLLABORATIONS_FILE = 'data/collaborations.csv'
+BLOCK_SIZE = 1024
+
+# embedding rows of the given artist IDs, -1 for artists the model has not seen
+def rows_of(ids, artist_ids):
+    order = np.argsort(ids)
+    pos = np.searchsorted(ids[order], artist_ids)
+    pos[pos == len(ids)] = 0
+    return np.where(ids[order][pos] == artist_ids, order[pos], -1)
+
+# edge index of current collaborations between embedded artists, plus extra pairs from a CSV
+# with artist_1,artist_2 columns, in the row space of the embedding table
+def excluded_edge_keys(ids, exclude_file=None):
+    store = open_store(ARTISTS_FILE, COLLABORATIONS_FILE)
+    if len(ids) == store.num_nodes and np.array_equal(ids, store.ids):
+        pairs = np.asarray(store.edges, dtype=np.int64)  # trained on this graph, skip the ID lookup
+    else:
+        pairs = rows_of(ids, store.ids)[store.edges]
+
+    if exclude_file:
+        with open(exclude_file, newline='', encoding='utf-8') as f:
+            extra = np.array([[row['artist_1'], row['artist_2']] for row in csv.DictReader(f)], dtype=str)
+        if len(extra):
+            pairs = np.concatenate([pairs, rows_of(ids, extra.ravel()).reshape(-1, 2)])
+
+    pairs = pairs[(pairs >= 0).all(axis=1)]
+    return build_edge_keys(pairs[:, 0], pairs[:, 1], len(ids))
+
+# stream per-artist top-K rows to a CSV, dropping candidates that already collaborated
+def write_per_artist(indices, scores, names, edge_keys, path, block_size=BLOCK_SIZE):
+    num_nodes = indices.shape[0]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Artist 1", "Artist 2", "Score"])
+
+        for start in range(0, num_nodes, block_size):
+            top_k_indices = indices[start:start + block_size]
+            row_ids = np.repeat(np.arange(start, start + top_k_indices.shape[0]), top_k_indices.shape[1])
+            col_ids = top_k_indices.ravel()
+            flat_scores = scores[start:start + block_size].ravel()
+            keep = (col_ids >= 0) & ~has_edges(edge_keys, row_ids, np.maximum(col_ids, 0), num_nodes)
+
+            writer.writerows(
+                [names[i], names[j], score]
+                for i, j, score in zip(row_ids[keep].tolist(), col_ids[keep].tolist(), flat_scores[keep].tolist())
+            )
+    print(f"Collaborations saved to {path}")
+
+# top_k candidates of every artist, like graphSAGE.rank_collaborations. with a quantized table the
+# candidates are scored on it; rerank > 0 shortlists rerank * top_k of them and rescores those exactly
+def predict_per_artist(embeddings, names, edge_keys, top_k, path, block_size=BLOCK_SIZE, table=None, rerank_factor=0):
+    shortlist = top_k * rerank_factor if table is not None and rerank_factor else top_k
+    indices = np.full((len(embeddings), shortlist), -1, dtype=np.int64)
+    scores = np.full((len(embeddings), shortlist), -np.inf, dtype=np.float32)
+    for start, top_k_indices, top_k_scores in top_k_per_row(normalize_rows(embeddings) if table is None else table, shortlist, block_size):
+        stop = start + top_k_indices.shape[0]
+        indices[start:stop, :top_k_indices.shape[1]] = top_k_indices
+        scores[start:stop, :top_k_scores.shape[1]] = top_k_scores
+    if shortlist > top_k:
+        for start in range(0, len(indices), block_size):
+            rows = np.arange(start, min(start + block_size, len(indices)))
+            block_indices, block_scores = rerank(embeddings, rows, indices[rows], top_k)
+            indices[rows, :top_k], scores[rows, :top_k] = block_indices, block_scores
+        indices, scores = indices[:, :top_k], scores[:, :top_k]
+    write_per_artist(indices, scores, names, edge_keys, path, block_size)
+
+# best top_k new pairs overall, like node2vec. table and rerank_factor as in predict_per_artist
+def predict_pairs(embeddings, names, edge_keys, top_k, path, block_size=BLOCK_SIZE, table=None, rerank_factor=0):
+    if table is None:
+        top_links = top_k_pairs(normalize_rows(embeddings), top_k, block_size=block_size, edge_keys=edge_keys)
+    else:
+        top_links = top_k_pairs(table, top_k * max(rerank_factor, 1), block_size=block_size, edge_keys=edge_keys)
+        if rerank_factor:
+            pairs = np.array([(i, j) for i, j, _ in top_links], dtype=np.int64).reshape(-1, 2)
+            exact = np.einsum('kd,kd->k', normalize_rows(embeddings[pairs[:, 0]]), normalize_rows(embeddings[pairs[:, 1]]))
+            order = np.lexsort((pairs[:, 1], pairs[:, 0], -exact))[:top_k]
+            top_links = [(i, j, s) for (i, j), s in zip(pairs[order].tolist(), exact[order].tolist())]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Artist 1", "Artist 2", "Score"])
+        writer.writerows([names[i], names[j], score] for i, j, score in top_links)
+    print(f"Collaborations saved to {path}")
+
+# rank the saved embeddings of a model the same way its training script does, without torch or retraining.
+# rows are matched to the current graph by artist ID, so collaborations crawled after training are excluded too
+# precision other than float32 scores a quantized copy of the embeddings (see quantize.py)
+def predict(name, top_k=None, exclude_file=None, output=None, block_size=BLOCK_SIZE, precision='float32', rerank_factor=0):
+    start = time.perf_counter()
+    with timer('load', model=name):
+        embeddings, ids, names, meta = load_embeddings(name)
+        edge_keys = excluded_edge_keys(ids, exclude_file)
+        table = None if precision == 'float32' else load_table(name, precision)
+    print(f"Loaded {meta['num_nodes']} {name} embeddings in {time.perf_counter() - start:.3f}s")
+
+    top_k = top_k or meta['top_k']
+    output = output or meta['predictions_file']
+    with timer('predict', model=name):
+        if meta['ranking'] == 'pairs':
+            predict_pairs(embeddings, names, edge_keys, top_k, output, block_size, table, rerank_factor)
+        else:
+            predict_per_artist(embeddings, names, edge_keys, top_k, output, block_size, table, rerank_factor)
+    print(f"Ranking took {time.perf_counter() - start:.3f}s")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rank collaborations from saved model embeddings")
+    parser.add_argument('model', choices=['graphSAGE', 'node2vec'])
+    parser.add_argument('--top-k', type=int, default=None, help="default: the top-K the model was trained with")
+    parser.add_argument('--exclude', default=None, help="CSV of additional artist_1,artist_2 pairs to exclude")
+    parser.add_argument('--output', default=None, help="default: the model's predictions file")
+    parser.add_argument('--precision', choices=PRECISIONS, default='float32',
+                        help="score a quantized copy of the embeddings (4x smaller with int8)")
+    parser.add_argument('--rerank', type=int, default=0,
+                        help="rescore a shortlist of RERANK x top-K quantized candidates in float32 (0: off)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    with run_report(f'predict-{args.model}'):
+        predict(args.model, args.top_k, args.exclude, args.output, precision=args.precision, rerank_factor=args.rerank)
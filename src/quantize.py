@@ -0,0 +1,164 @@
+import argparse
+import os
+import time
+import numpy as np
+from model_store import load_embeddings, model_path
+from scoring import normalize_rows, top_k_for_rows
+
+PRECISIONS = ['float32', 'float16', 'bfloat16', 'int8']
+TILE_SIZE = 4096  # candidate rows decoded to float32 at a time, small enough to stay in cache
+RERANK_FACTOR = 4  # the exact re-rank rescores RERANK_FACTOR * k candidates per row
+
+# embedding table stored in reduced precision. float16 is numpy's half type, bfloat16 keeps the
+# upper 16 bits of each float32 (stored as uint16, numpy has no bfloat16), and int8 holds
+# round(x / scale) with one float32 scale per row (max |x| / 127, symmetric)
+class QuantizedTable:
+    def __init__(self, codes, scales=None, precision='int8'):
+        self.codes = codes
+        self.scales = scales
+        self.precision = precision
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    # float32 rows of a slice or index array
+    def decode(self, rows):
+        codes = self.codes[rows]
+        if self.precision == 'int8':
+            return codes.astype(np.float32) * self.scales[rows][:, None]
+        if self.precision == 'bfloat16':
+            return (codes.astype(np.uint32) << 16).view(np.float32)
+        return codes.astype(np.float32)
+
+    # dot products of float32 queries with every row. candidates are decoded one cache-sized
+    # tile at a time; int8 codes are multiplied as they are and scaled per column afterwards
+    def similarity(self, queries):
+        num_rows = len(self.codes)
+        scores = np.empty((len(queries), num_rows), dtype=np.float32)
+        for start in range(0, num_rows, TILE_SIZE):
+            stop = min(start + TILE_SIZE, num_rows)
+            if self.precision == 'int8':
+                scores[:, start:stop] = queries @ self.codes[start:stop].astype(np.float32).T
+                scores[:, start:stop] *= self.scales[start:stop]
+            else:
+                scores[:, start:stop] = queries @ self.decode(slice(start, stop)).T
+        return scores
+
+# reduced-precision copy of (normalized) float32 embeddings
+def quantize(embeddings, precision):
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if precision == 'int8':
+        scales = np.abs(embeddings).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+        return QuantizedTable(codes, scales.astype(np.float32), precision)
+    if precision == 'bfloat16':
+        # round to nearest even before dropping the lower 16 bits
+        bits = embeddings.view(np.uint32)
+        rounded = bits + np.uint32(0x7FFF) + ((bits >> 16) & np.uint32(1))
+        return QuantizedTable((rounded >> 16).astype(np.uint16), None, precision)
+    if precision == 'float16':
+        return QuantizedTable(embeddings.astype(np.float16), None, precision)
+    raise ValueError(f"Unknown precision: {precision}")
+
+# quantized, normalized embeddings of a saved model, memory-mapped. written next to the
+# float32 embeddings on first use and rebuilt when the model is saved again
+def load_table(name, precision):
+    path = model_path(name)
+    codes_file = os.path.join(path, f'embeddings.{precision}.npy')
+    scales_file = os.path.join(path, f'scales.{precision}.npy')
+    meta_file = os.path.join(path, 'meta.json')
+
+    # the scales are written after the codes, so scales older than the codes (or missing) mean that
+    # a previous write was interrupted between the two
+    def stale(file, newer_than):
+        return not os.path.exists(file) or os.path.getmtime(file) < os.path.getmtime(newer_than)
+
+    if stale(codes_file, meta_file) or (precision == 'int8' and stale(scales_file, codes_file)):
+        embeddings, _, _, _ = load_embeddings(name)
+        table = quantize(normalize_rows(embeddings), precision)
+        # per-process temporary files, so processes quantizing the same model do not write into each other.
+        # np.save appends .npy to names without it
+        files = [(codes_file, table.codes)] + ([(scales_file, table.scales)] if table.scales is not None else [])
+        for file, array in files:
+            np.save(f'{file}.tmp-{os.getpid()}.npy', array)
+        for file, _ in files:
+            os.replace(f'{file}.tmp-{os.getpid()}.npy', file)
+
+    scales = np.load(scales_file, mmap_mode='r') if precision == 'int8' else None
+    return QuantizedTable(np.load(codes_file, mmap_mode='r'), scales, precision)
+
+# exact float32 rescoring of per-row shortlists: returns the best k (indices, scores) per row.
+# indices of -1 are empty slots. only the shortlisted rows of the (memory-mapped) embeddings are read
+def rerank(embeddings, rows, indices, k):
+    valid = indices >= 0
+    candidates = normalize_rows(embeddings[np.maximum(indices, 0).ravel()]).reshape(*indices.shape, -1)
+    scores = np.einsum('bd,bkd->bk', normalize_rows(embeddings[rows]), candidates)
+    scores[~valid] = -np.inf
+    order = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+# per-artist top-k of sample rows: table size, scoring time and overlap with the float32 top-k
+# for each precision, with and without the exact re-rank of a rerank_factor * k shortlist
+def precision_report(embeddings, precisions=PRECISIONS, k=10, sample_size=2000, rerank_factor=RERANK_FACTOR, seed=0):
+    normalized = normalize_rows(embeddings)
+    rows = np.sort(np.random.default_rng(seed).choice(len(normalized), min(sample_size, len(normalized)), replace=False))
+
+    def ranked(table, k):
+        return np.concatenate([indices for _, indices, _ in top_k_for_rows(table, rows, k)])
+
+    def overlap(indices, exact):
+        return np.mean([len(np.intersect1d(a[a >= 0], b[b >= 0])) / max((b >= 0).sum(), 1) for a, b in zip(indices, exact)])
+
+    start = time.perf_counter()
+    exact = ranked(normalized, k)
+    base_time = time.perf_counter() - start
+
+    report = {'float32': {'megabytes': normalized.nbytes / 2**20, 'seconds': base_time, 'overlap': 1.0}}
+    for precision in precisions:
+        if precision == 'float32':
+            continue
+        table = quantize(normalized, precision)
+        start = time.perf_counter()
+        indices = ranked(table, k)
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        shortlist = ranked(table, k * rerank_factor)
+        reranked, _ = rerank(normalized, rows, shortlist, k)
+        rerank_time = time.perf_counter() - start
+        report[precision] = {
+            'megabytes': table.nbytes / 2**20, 'seconds': elapsed, 'overlap': overlap(indices, exact),
+            'rerank_seconds': rerank_time, 'rerank_overlap': overlap(reranked, exact),
+        }
+
+    print(f"{len(normalized)} x {normalized.shape[1]} embeddings, top-{k} of {len(rows)} artists")
+    for precision, row in report.items():
+        line = (f"{precision:>8} | {row['megabytes']:8.1f} MB ({normalized.nbytes / 2**20 / row['megabytes']:.1f}x smaller) | "
+                f"{row['seconds']:.3f}s ({base_time / row['seconds']:.2f}x) | top-{k} overlap {row['overlap']:.3f}")
+        if 'rerank_overlap' in row:
+            line += f" | re-ranked {row['rerank_seconds']:.3f}s, overlap {row['rerank_overlap']:.3f}"
+        print(line)
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Memory, speed and accuracy of quantized embedding scoring")
+    parser.add_argument('model', choices=['graphSAGE', 'node2vec'])
+    parser.add_argument('--precisions', nargs='+', default=PRECISIONS, choices=PRECISIONS)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--sample', type=int, default=2000, help="artists whose top-k is compared")
+    parser.add_argument('--rerank-factor', type=int, default=RERANK_FACTOR, help="shortlist size of the exact re-rank, in multiples of k")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    embeddings, _, _, _ = load_embeddings(args.model)
+    precision_report(embeddings, args.precisions, args.k, args.sample, args.rerank_factor)
@@ -0,0 +1,318 @@
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from graph_store import open_store
+from instrumentation import count, metrics, observe, timer
+from model_store import load_embeddings
+from predict import ARTISTS_FILE, COLLABORATIONS_FILE, excluded_edge_keys
+from scoring import normalize_rows
+
+MODELS = ['graphSAGE', 'node2vec', 'rules']
+DEFAULT_K = 10
+CACHE_SIZE = 10000  # cached query results
+HOST = '127.0.0.1'
+PORT = 8080
+
+# thread-safe least-recently-used cache with hit/miss counters
+class LRUCache:
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+# embeddings of one model, normalized once, with the existing collaborations in its row space
+class EmbeddingModel:
+    def __init__(self, name):
+        embeddings, ids, names, self.meta = load_embeddings(name)
+        self.vectors = normalize_rows(embeddings)
+        self.edge_keys = excluded_edge_keys(ids)
+        self.ids = ids.tolist()
+        self.names = names.tolist()
+        self.rows = {artist_id: row for row, artist_id in enumerate(self.ids)}
+
+    # top-k candidates of several rows at once, skipping self-pairs and existing collaborations
+    def top_k(self, rows, k):
+        rows = np.asarray(rows, dtype=np.int64)
+        num_nodes = len(self.vectors)
+        scores = self.vectors[rows] @ self.vectors.T
+        local = np.arange(len(rows))
+        scores[local, rows] = -np.inf
+
+        # existing edges of row r are the keys in [r * n, (r + 1) * n)
+        lo = np.searchsorted(self.edge_keys, rows * num_nodes)
+        counts = np.searchsorted(self.edge_keys, (rows + 1) * num_nodes) - lo
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        keys = self.edge_keys[np.repeat(lo, counts) + offsets]
+        scores[np.repeat(local, counts), keys % num_nodes] = -np.inf
+
+        k = min(k, num_nodes - 1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [
+            [(j, s) for j, s in zip(r_top.tolist(), r_scores.tolist()) if s != -np.inf]
+            for r_top, r_scores in zip(top, top_scores)
+        ]
+
+# in-process "who should artist X collaborate with" queries over the saved model embeddings
+# and the logical rules. artists are given by Spotify ID or by name (case-insensitive)
+class CollaborationService:
+    def __init__(self, models=MODELS, cache_size=CACHE_SIZE, weights=None):
+        self.store = open_store(ARTISTS_FILE, COLLABORATIONS_FILE)
+        self.ids = self.store.ids.tolist()
+        self.names = self.store.names.tolist()
+        self.by_name = {}
+        for index, name in enumerate(self.names):
+            self.by_name.setdefault(name.lower(), index)
+
+        # scipy is only loaded when the rules are served
+        from rule_engine import DEFAULT_WEIGHTS, RuleEngine
+
+        self.models = {}
+        for name in models:
+            if name == 'rules':
+                self.models[name] = RuleEngine(self.store)
+            else:
+                self.models[name] = EmbeddingModel(name)
+        self.weights = weights or DEFAULT_WEIGHTS
+        self.cache = LRUCache(cache_size)
+
+    # store index of an artist ID or name. raises KeyError for unknown artists
+    def resolve(self, artist):
+        index = self.store.index_of(artist)
+        if index is None:
+            index = self.by_name.get(artist.lower())
+        if index is None:
+            raise KeyError(f"Unknown artist: {artist}")
+        return index
+
+    def _artist(self, index):
+        return {'id': self.ids[index], 'name': self.names[index]}
+
+    # best k collaborators for an artist, as [{'id', 'name', 'score'}]
+    def query(self, artist, k=DEFAULT_K, model='graphSAGE'):
+        return self.query_batch([artist], k, model)[0]
+
+    # answer several queries with one scoring pass per model; cached results are reused
+    def query_batch(self, artists, k=DEFAULT_K, model='graphSAGE'):
+        if not isinstance(artists, (list, tuple)) or not all(isinstance(artist, str) for artist in artists):
+            raise TypeError("artists must be a list of artist IDs or names")
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        if model not in self.models:
+            raise KeyError(f"Model not loaded: {model}")
+        indices = [self.resolve(artist) for artist in artists]
+        results = [self.cache.get((model, index, k)) for index in indices]
+        missing = list(dict.fromkeys(index for index, result in zip(indices, results) if result is None))
+
+        count('queries', len(indices), model=model)
+        if missing:
+            with timer('query_scoring', model=model):
+                scored = dict(zip(missing, self._score(model, missing, k)))
+            for index, result in scored.items():
+                self.cache.put((model, index, k), result)
+            results = [scored[index] if result is None else result for index, result in zip(indices, results)]
+        return results
+
+    def _score(self, model, indices, k):
+        engine = self.models[model]
+        if model == 'rules':
+            results = []
+            for index in indices:
+                candidates, *_, score = engine.score_artist(index, self.weights)
+                order = np.argsort(-score, kind='stable')[:k]
+                results.append([dict(self._artist(j), score=round(float(score[o]), 2))
+                                for o, j in zip(order.tolist(), candidates[order].tolist())])
+            return results
+
+        # embedding rows of the requested artists; artists the model has not seen get no candidates
+        rows = [engine.rows.get(self.ids[index], -1) for index in indices]
+        known = [row for row in rows if row >= 0]
+        ranked = dict(zip(known, engine.top_k(known, k))) if known else {}
+        return [
+            [{'id': engine.ids[j], 'name': engine.names[j], 'score': score} for j, score in ranked.get(row, [])]
+            for row in rows
+        ]
+
+    def stats(self):
+        return {'models': list(self.models), 'cache_entries': len(self.cache.entries),
+                'cache_hits': self.cache.hits, 'cache_misses': self.cache.misses}
+
+    # the process metrics in Prometheus text format, plus the query cache counters
+    def prometheus(self):
+        metrics.gauge('query_cache_entries', len(self.cache.entries))
+        metrics.gauge('query_cache_hits', self.cache.hits)
+        metrics.gauge('query_cache_misses', self.cache.misses)
+        return metrics.prometheus()
+
+# JSON over HTTP:
+#   GET  /collaborators?artist=<id or name>&k=10&model=graphSAGE
+#   POST /collaborators/batch  {"artists": [...], "k": 10, "model": "graphSAGE"}
+#   GET  /stats
+#   GET  /metrics  (Prometheus)
+# a malformed request (missing parameter, bad JSON, k < 1) gets a 400, an unknown artist or model a 404
+def make_handler(service):
+    def required(params, name):
+        if name not in params:
+            raise ValueError(f"Missing parameter: {name}")
+        return params[name]
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _answer(self, fn):
+            start = time.perf_counter()
+            try:
+                self._send(200, fn())
+            except KeyError as e:
+                self._send(404, {'error': e.args[0]})
+            except (ValueError, TypeError) as e:
+                self._send(400, {'error': str(e)})
+            observe('request_latency_seconds', time.perf_counter() - start, path=urllib.parse.urlparse(self.path).path)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            if url.path == '/collaborators':
+                self._answer(lambda: service.query(
+                    required(params, 'artist'), int(params.get('k', DEFAULT_K)), params.get('model', 'graphSAGE')))
+            elif url.path == '/stats':
+                self._answer(service.stats)
+            elif url.path == '/metrics':
+                payload = service.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            else:
+                self._send(404, {'error': f"Unknown path: {url.path}"})
+
+        def do_POST(self):
+            if self.path != '/collaborators/batch':
+                self._send(404, {'error': f"Unknown path: {self.path}"})
+                return
+            data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+            def answer():
+                body = json.loads(data or b'{}')
+                if not isinstance(body, dict):
+                    raise ValueError("The request body must be a JSON object")
+                return service.query_batch(
+                    required(body, 'artists'), int(body.get('k', DEFAULT_K)), body.get('model', 'graphSAGE'))
+
+            self._answer(answer)
+
+        # keep the console quiet under load
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def serve(service, host=HOST, port=PORT):
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"Serving collaboration queries on http://{host}:{server.server_address[1]}")
+    return server
+
+# latency percentiles and throughput of single-artist queries from `concurrency` threads.
+# url = None queries the service in-process, otherwise through its HTTP endpoint
+def benchmark(service, num_queries=2000, concurrency=8, k=DEFAULT_K, model='graphSAGE', url=None, seed=0):
+    rng = random.Random(seed)
+    artists = [rng.choice(service.ids) for _ in range(num_queries)]
+
+    def run(artist):
+        start = time.perf_counter()
+        if url is None:
+            service.query(artist, k, model)
+        else:
+            query = urllib.parse.urlencode({'artist': artist, 'k': k, 'model': model})
+            with urllib.request.urlopen(f"{url}/collaborators?{query}") as response:
+                response.read()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.array(list(pool.map(run, artists))) * 1000
+    elapsed = time.perf_counter() - start
+
+    report = {
+        'queries': num_queries,
+        'concurrency': concurrency,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'throughput_qps': num_queries / elapsed,
+    }
+    print(f"{model} via {'HTTP' if url else 'in-process'} | {num_queries} queries, {concurrency} threads | "
+          f"p50 {report['p50_ms']:.2f} ms | p99 {report['p99_ms']:.2f} ms | {report['throughput_qps']:.0f} queries/s")
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Collaborator query service over saved embeddings and logical rules")
+    parser.add_argument('--models', nargs='+', default=MODELS, choices=MODELS, help="models to load")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="cached query results")
+    parser.add_argument('--benchmark', action='store_true', help="measure query latency and throughput instead of serving")
+    parser.add_argument('--queries', type=int, default=2000, help="queries per benchmark run")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent benchmark clients")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    service = CollaborationService(args.models, args.cache_size)
+
+    if not args.benchmark:
+        serve(service, args.host, args.port).serve_forever()
+        return
+
+    # in-process and HTTP, each cold (empty cache) and warm (same queries again)
+    server = serve(service, args.host, args.port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://{args.host}:{server.server_address[1]}"
+    for model in args.models:
+        for target in [None, url]:
+            service.cache.clear()
+            for _ in ('cold', 'warm'):
+                benchmark(service, args.queries, args.concurrency, model=model, url=target)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from instrumentation import count, timer
+
+# thread-safe token bucket: `rate` requests per second on average, bursts of up to `capacity`
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    # block until a token is available
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    # stop handing out tokens for `seconds`, e.g. when the server sent Retry-After
+    def pause(self, seconds):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+# seconds to wait according to a Retry-After header (delta-seconds or HTTP date), or None
+def parse_retry_after(headers):
+    if not headers:
+        return None
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# calls to one API, limited by a token bucket and retried on throttling or transient errors.
+# retry_delay(exc) decides what a failure means: None = give up, a number = the server asked
+# to wait that many seconds, 0 = transient error, back off exponentially with jitter
+class RateLimitedAPI:
+    def __init__(self, name, rate, capacity=1, retry_delay=None, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, capacity)
+        self.retry_delay = retry_delay or (lambda exc: None)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.calls = 0
+        self.retries = 0
+        self.stats_lock = threading.Lock()
+
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            with self.stats_lock:
+                self.calls += 1
+            count('api_calls', api=self.name)
+            try:
+                with timer('api_request', api=self.name):
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                delay = self.retry_delay(e)
+                if delay is None or attempt == self.max_retries:
+                    count('api_errors', api=self.name)
+                    raise
+                with self.stats_lock:
+                    self.retries += 1
+                count('api_retries', api=self.name)
+
+                # jitter, so parallel workers do not retry in lockstep
+                if delay > 0:
+                    # the server is throttling the whole API, hold back every worker
+                    self.bucket.pause(delay)
+                    count('api_throttled', api=self.name)
+                    print(f"{self.name}: rate limited, retrying in {delay:.1f}s")
+                    time.sleep(delay + random.uniform(0, self.base_delay))
+                else:
+                    time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+# apply fn to every item on `concurrency` threads. yields (item, result, error) in input order
+# and keeps at most 2 * concurrency calls in flight
+def map_concurrent(fn, items, concurrency):
+    if concurrency <= 1:
+        for item in items:
+            try:
+                yield item, fn(item), None
+            except Exception as e:
+                yield item, None, e
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = deque()
+        for item in items:
+            pending.append((item, pool.submit(fn, item)))
+            if len(pending) >= 2 * concurrency:
+                yield _result(*pending.popleft())
+        while pending:
+            yield _result(*pending.popleft())
+
+def _result(item, future):
+    try:
+        return item, future.result(), None
+    except Exception as e:
+        return item, None, e
@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from instrumentation import count
+
+CACHE_FILE = 'data/api_cache.sqlite'
+MAX_CACHE_BYTES = 1 << 30  # least recently used responses are evicted above this size
+ACCESS_FLUSH_SIZE = 1000  # cache hits whose access times are written together
+
+DAY = 24 * 60 * 60
+
+# seconds a cached response stays valid, per endpoint. None = never expires
+DEFAULT_TTLS = {
+    'spotify.artist': 7 * DAY,           # followers and popularity change
+    'spotify.artist_albums': 7 * DAY,    # new releases
+    'spotify.album': None,               # track listings of a release do not change
+    'spotify.album_tracks': None,
+    'spotify.search': 1 * DAY,
+    'musicbrainz.search_artists': 30 * DAY,
+}
+
+# persistent SQLite cache of API responses, keyed by endpoint and call parameters.
+# responses are stored as compressed JSON, so only JSON-serializable results can be cached
+class ResponseCache:
+    def __init__(self, path=CACHE_FILE, ttls=None, max_bytes=MAX_CACHE_BYTES):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        self.hits = Counter()
+        self.misses = Counter()
+        self.accessed = {}  # key -> access time of hits, not written yet
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=60)  # may be shared by crawler processes
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.db.commit()
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(endpoint, args=(), kwargs=None):
+        return endpoint + ':' + json.dumps([list(args), kwargs or {}], sort_keys=True, default=str)
+
+    # cached response, or None if it is missing or expired
+    def get(self, endpoint, args=(), kwargs=None):
+        key = self.make_key(endpoint, args, kwargs)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            ttl = self.ttls.get(endpoint)
+            if row is None or (ttl is not None and now - row[1] > ttl):
+                self.misses[endpoint] += 1
+                count('cache_misses', endpoint=endpoint)
+                return None
+            # access times are written in short batches, a write per hit would hold SQLite's write lock
+            # and block the other crawler processes sharing the file
+            self.accessed[key] = now
+            if len(self.accessed) >= ACCESS_FLUSH_SIZE:
+                self._flush_accessed()
+            self.hits[endpoint] += 1
+            count('cache_hits', endpoint=endpoint)
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, endpoint, value, args=(), kwargs=None):
+        key = self.make_key(endpoint, args, kwargs)
+        blob = zlib.compress(json.dumps(value).encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            self.accessed.pop(key, None)
+            self._flush_accessed()
+            old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, blob, len(blob), now, now))
+            self.size += len(blob) - (old[0] if old else 0)
+            if self.size > self.max_bytes:
+                self._evict()
+            self.db.commit()
+
+    # return the cached response for the call, or run fetch() and cache its result
+    def call(self, endpoint, fetch, args=(), kwargs=None):
+        value = self.get(endpoint, args, kwargs)
+        if value is None:
+            value = fetch()
+            self.put(endpoint, value, args, kwargs)
+        return value
+
+    # write the buffered access times in one transaction. called with the lock held
+    def _flush_accessed(self):
+        if self.accessed:
+            self.db.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                                [(accessed, key) for key, accessed in self.accessed.items()])
+            self.db.commit()
+            self.accessed.clear()
+
+    # drop least recently used responses until the cache is back under 90% of max_bytes
+    def _evict(self):
+        target = int(self.max_bytes * 0.9)
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed")
+        evicted = []
+        for key, size in rows:
+            if self.size <= target:
+                break
+            evicted.append((key,))
+            self.size -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def report(self):
+        endpoints = sorted(set(self.hits) | set(self.misses))
+        for endpoint in endpoints:
+            hits, misses = self.hits[endpoint], self.misses[endpoint]
+            print(f"{endpoint:>28} | {hits} hits, {misses} misses ({hits / max(hits + misses, 1):.0%} hit rate)")
+        print(f"Cache size: {self.size / (1 << 20):.1f} MB")
+
+    def close(self):
+        with self.lock:
+            self._flush_accessed()
+            self.db.commit()
+            self.db.close()
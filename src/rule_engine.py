@@ -0,0 +1,205 @@
+import argparse
+import csv
+import json
+import os
+import numpy as np
+import scipy.sparse as sp
+from graph_store import open_store
+from scoring import build_edge_keys, has_edges
+from instrumentation import count, run_report, timer
+from model_store import model_path
+
+ARTISTS_FILE = 'data/artists.csv'
+COLLABORATIONS_FILE = 'data/collaborations.csv'
+PREDICTIONS_FILE = 'predictions/logical_rules.csv'
+BLOCK_SIZE = 4096  # anchor artists expanded per sparse product
+
+# rule weights of do_logical_prediction
+DEFAULT_WEIGHTS = {
+    'weight_common_neighbors': 2.0,
+    'weight_genre_overlap': 5.0,
+    'weight_popularity': 5.0,
+    'weight_same_country': 2.0,
+    'weight_same_city': 5.0,
+}
+
+# best weights found by tune_rules.py
+TUNED_WEIGHTS_FILE = os.path.join(model_path('rules'), 'weights.json')
+
+# the weights saved by tune_rules.py, as keyword arguments of do_sparse_prediction / do_logical_prediction
+def load_tuned_weights(path=TUNED_WEIGHTS_FILE):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No tuned weights in {path}, run tune_rules.py first")
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['weights']
+
+# in-process version of the rule query in logical_knowledge.py.
+# computes the same features with sparse linear algebra over the graph store, no Neo4j needed
+class RuleEngine:
+    def __init__(self, store):
+        self.store = store
+        n = store.num_nodes
+
+        # binary, symmetric adjacency: (A @ A)[a, b] = number of shared neighbours
+        self.adjacency = sp.csr_matrix(
+            (np.ones(len(store.indices), dtype=np.int32), store.indices, store.indptr), shape=(n, n))
+        src, dst = store.coo()
+        self.edge_keys = build_edge_keys(src, dst, n)
+
+        # artist x genre incidence. a's side keeps token multiplicity, b's side is binary,
+        # like [g IN split(a.genres, ',') WHERE g IN split(b.genres, ',')]
+        self.genre_counts = sp.csr_matrix(
+            (np.ones(len(store.genre_indices), dtype=np.int32), store.genre_indices, store.genre_indptr),
+            shape=(n, len(store.genre_vocab)))
+        self.genre_counts.sum_duplicates()
+        self.genre_sets = self.genre_counts.copy()
+        self.genre_sets.data[:] = 1
+
+        self.popularity = np.nan_to_num(store.feature('popularity'), nan=0.0).astype(np.int64)
+        self.country = np.asarray(store.country)
+        self.city = np.asarray(store.city)
+
+        # a.id < b.id in Cypher compares the Spotify ID strings
+        self.id_rank = np.empty(n, dtype=np.int64)
+        self.id_rank[np.argsort(store.ids)] = np.arange(n)
+
+    # rule features and scores of the candidate pairs anchored in rows [start, stop):
+    # 2-hop neighbours that are not already collaborators, each unordered pair once
+    def score_block(self, start, stop, weights):
+        two_hop = (self.adjacency[start:stop] @ self.adjacency).tocoo()
+        a = two_hop.row.astype(np.int64) + start
+        b = two_hop.col.astype(np.int64)
+        shared = two_hop.data.astype(np.int64)
+
+        keep = (self.id_rank[a] < self.id_rank[b]) & ~has_edges(self.edge_keys, a, b, self.store.num_nodes)
+        return self.score_pairs(a[keep], b[keep], shared[keep], weights)
+
+    # rule scores of all 2-hop candidates of one artist, whichever side of the pair it anchors.
+    # returns (candidates, shared, genre_overlap, pop_diff, same_country, same_city, score)
+    def score_artist(self, node, weights):
+        two_hop = (self.adjacency[node] @ self.adjacency).tocoo()
+        b = two_hop.col.astype(np.int64)
+        shared = two_hop.data.astype(np.int64)
+        keep = (b != node) & ~has_edges(self.edge_keys, np.full_like(b, node), b, self.store.num_nodes)
+        b, shared = b[keep], shared[keep]
+
+        # features are computed with the smaller ID as a, like in the predictions CSV
+        first = self.id_rank[node] < self.id_rank[b]
+        a_side = np.where(first, node, b)
+        b_side = np.where(first, b, node)
+        columns = self.score_pairs(a_side, b_side, shared, weights)
+        return (b,) + columns[2:]
+
+    # rule features and score of the pairs (a[i], b[i]) with `shared` common neighbours
+    def score_pairs(self, a, b, shared, weights):
+        genre_overlap = np.asarray(self.genre_counts[a].multiply(self.genre_sets[b]).sum(axis=1)).ravel().astype(np.int64)
+        pop_diff = np.abs(self.popularity[a] - self.popularity[b])
+        same_country = (self.country[a] >= 0) & (self.country[a] == self.country[b])
+        same_city = (self.city[a] >= 0) & (self.city[a] == self.city[b])
+
+        score = (
+            (shared * weights['weight_common_neighbors']) +
+            (genre_overlap * weights['weight_genre_overlap']) +
+            (1.0 / (1 + pop_diff)) * weights['weight_popularity'] +
+            np.where(same_country, weights['weight_same_country'], 0) +
+            np.where(same_city, weights['weight_same_city'], 0)
+        )
+        return a, b, shared, genre_overlap, pop_diff, same_country, same_city, score
+
+    def iter_blocks(self, weights, block_size=BLOCK_SIZE):
+        for start in range(0, self.store.num_nodes, block_size):
+            yield self.score_block(start, min(start + block_size, self.store.num_nodes), weights)
+
+    # scored pairs sorted by descending score, as rows of the predictions CSV.
+    # top_k limits the output globally, or per anchor artist with per_artist=True,
+    # and only the current top-K candidates are kept between blocks
+    def predict(self, weights, top_k=None, per_artist=False, block_size=BLOCK_SIZE):
+        if top_k is None:
+            blocks = list(self.iter_blocks(weights, block_size))
+            columns = [np.concatenate(col) for col in zip(*blocks)]
+        elif per_artist:
+            columns = self._per_artist_top_k(weights, top_k, block_size)
+        else:
+            columns = self._global_top_k(weights, top_k, block_size)
+
+        order = np.argsort(-columns[-1], kind='stable')
+        return [col[order] for col in columns]
+
+    # running top-K: merge each block into the current best candidates and cut back to top_k
+    def _global_top_k(self, weights, top_k, block_size):
+        best = None
+        for block in self.iter_blocks(weights, block_size):
+            if best is not None:
+                block = [np.concatenate([kept, new]) for kept, new in zip(best, block)]
+            keep = np.argsort(-block[-1], kind='stable')[:top_k]
+            best = [col[keep] for col in block]
+        return best
+
+    # best top_k candidates per anchor artist (the artist with the smaller ID, like the Cypher query).
+    # anchors never span two blocks, so each block is cut on its own
+    def _per_artist_top_k(self, weights, top_k, block_size):
+        kept = []
+        for block in self.iter_blocks(weights, block_size):
+            a, score = block[0], block[-1]
+            order = np.lexsort((-score, a))
+            rank = np.arange(len(a)) - np.searchsorted(a[order], a[order])
+            kept.append([col[order[rank < top_k]] for col in block])
+        return [np.concatenate(col) for col in zip(*kept)]
+
+# write predictions in the same format as logical_knowledge.do_logical_prediction
+def write_predictions(store, columns, log_path):
+    a, b, shared, genre_overlap, pop_diff, same_country, same_city, score = columns
+    names = store.names
+    with open(log_path, 'w', newline='', encoding='utf-8') as log_file:
+        writer = csv.writer(log_file)
+        writer.writerow([
+            'Artist 1', 'Artist 2', 'Shared Neighbors',
+            'Genre Overlap', 'Popularity Diff',
+            'Same Country', 'Same City', 'Score'
+        ])
+        writer.writerows(
+            [names[i], names[j], s, g, p, c, ct, round(sc, 2)]
+            for i, j, s, g, p, c, ct, sc in zip(
+                a.tolist(), b.tolist(), shared.tolist(), genre_overlap.tolist(), pop_diff.tolist(),
+                same_country.tolist(), same_city.tolist(), score.tolist())
+        )
+
+def do_sparse_prediction(
+    log_path=PREDICTIONS_FILE,
+    weight_common_neighbors = 2.0,
+    weight_genre_overlap = 5.0,
+    weight_popularity = 5.0,
+    weight_same_country = 2.0,
+    weight_same_city = 5.0,
+    top_k=None,
+    per_artist=False,
+):
+    weights = {
+        'weight_common_neighbors': weight_common_neighbors,
+        'weight_genre_overlap': weight_genre_overlap,
+        'weight_popularity': weight_popularity,
+        'weight_same_country': weight_same_country,
+        'weight_same_city': weight_same_city,
+    }
+    with timer('load', model='rules'):
+        store = open_store(ARTISTS_FILE, COLLABORATIONS_FILE)
+        engine = RuleEngine(store)
+    with timer('scoring', model='rules'):
+        columns = engine.predict(weights, top_k=top_k, per_artist=per_artist)
+    with timer('csv_write', model='rules'):
+        write_predictions(store, columns, log_path)
+    count('predictions_written', len(columns[0]))
+    print("Prediction using logical rules complete.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Logical rule prediction without Neo4j")
+    parser.add_argument('--top-k', type=int, default=None, help="only keep the best K pairs")
+    parser.add_argument('--per-artist', action='store_true', help="apply --top-k per artist instead of globally")
+    parser.add_argument('--tuned', action='store_true', help="use the weights saved by tune_rules.py")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    weights = load_tuned_weights() if args.tuned else {}
+    with run_report('rule_engine'):
+        do_sparse_prediction(top_k=args.top_k, per_artist=args.per_artist, **weights)
@@ -0,0 +1,121 @@
+import heapq
+import numpy as np
+
+# rows of the similarity matrix computed per matmul; peak memory is block_size x num_nodes floats
+DEFAULT_BLOCK_SIZE = 1024
+
+# scale embeddings to unit length once, so dot product = cosine similarity
+def normalize_rows(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+# sorted int64 edge index: every undirected edge (a, b) is stored as a * n + b and b * n + a
+def build_edge_keys(src, dst, num_nodes):
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    keys = np.concatenate([src * num_nodes + dst, dst * num_nodes + src])
+    return np.unique(keys)
+
+# vectorized membership test of (rows[k], cols[k]) pairs in the edge index
+def has_edges(edge_keys, rows, cols, num_nodes):
+    if edge_keys is None or len(edge_keys) == 0:
+        return np.zeros(np.shape(rows), dtype=bool)
+    keys = np.asarray(rows, dtype=np.int64) * num_nodes + np.asarray(cols, dtype=np.int64)
+    pos = np.searchsorted(edge_keys, keys)
+    pos[pos == len(edge_keys)] = 0
+    return edge_keys[pos] == keys
+
+# set the scores of existing edges within rows [start, stop) to -inf
+def mask_existing(block, start, stop, edge_keys, num_nodes):
+    if edge_keys is None or len(edge_keys) == 0:
+        return
+    lo = np.searchsorted(edge_keys, start * num_nodes)
+    hi = np.searchsorted(edge_keys, stop * num_nodes)
+    keys = edge_keys[lo:hi]
+    block[keys // num_nodes - start, keys % num_nodes] = -np.inf
+
+# similarities of the given rows (slice or index array) to every row. the table is a float32
+# array or a quantize.QuantizedTable, which scores its reduced-precision codes directly
+def similarity(normalized, rows):
+    if isinstance(normalized, np.ndarray):
+        return normalized[rows] @ normalized.T
+    return normalized.similarity(normalized.decode(rows))
+
+# yield (start, stop, scores) where scores holds the cosine similarities of rows [start, stop)
+def iter_similarity_blocks(normalized, block_size=DEFAULT_BLOCK_SIZE):
+    num_nodes = normalized.shape[0]
+    for start in range(0, num_nodes, block_size):
+        stop = min(start + block_size, num_nodes)
+        yield start, stop, similarity(normalized, slice(start, stop))
+
+# indices of the k largest entries per row, sorted by descending score
+def _row_top_k(block, k):
+    k = min(k, block.shape[1])
+    idx = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(block, idx, axis=1)
+    order = np.argsort(-part, axis=1, kind='stable')
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+# per-artist top-K: yields (start, indices, scores) for each row block.
+# self-pairs are always excluded, existing edges only if edge_keys is given
+def top_k_per_row(normalized, k, block_size=DEFAULT_BLOCK_SIZE, edge_keys=None):
+    num_nodes = normalized.shape[0]
+    for start, stop, block in iter_similarity_blocks(normalized, block_size):
+        rows = np.arange(stop - start)
+        block[rows, rows + start] = -np.inf
+        mask_existing(block, start, stop, edge_keys, num_nodes)
+        indices, scores = _row_top_k(block, k)
+        yield start, indices, scores
+
+# per-artist top-K of selected rows only, e.g. the artists touched by an incremental update.
+# yields (rows, indices, scores) for each block of rows
+def top_k_for_rows(normalized, rows, k, block_size=DEFAULT_BLOCK_SIZE, edge_keys=None):
+    num_nodes = normalized.shape[0]
+    rows = np.asarray(rows, dtype=np.int64)
+    for pos in range(0, len(rows), block_size):
+        block_rows = rows[pos:pos + block_size]
+        block = similarity(normalized, block_rows)
+        local = np.arange(len(block_rows))
+        block[local, block_rows] = -np.inf
+
+        if edge_keys is not None and len(edge_keys):
+            # keys of row r lie in [r * n, (r + 1) * n)
+            lo = np.searchsorted(edge_keys, block_rows * num_nodes)
+            counts = np.searchsorted(edge_keys, (block_rows + 1) * num_nodes) - lo
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            keys = edge_keys[np.repeat(lo, counts) + offsets]
+            block[np.repeat(local, counts), keys % num_nodes] = -np.inf
+
+        indices, scores = _row_top_k(block, k)
+        yield block_rows, indices, scores
+
+# global top-K over unordered pairs (i < j) that are not existing edges.
+# returns a list of (i, j, score) sorted by descending score
+def top_k_pairs(normalized, k, block_size=DEFAULT_BLOCK_SIZE, edge_keys=None):
+    num_nodes = normalized.shape[0]
+    heap = []  # min-heap of (score, -i, -j), bounded to k entries
+
+    for start, stop, block in iter_similarity_blocks(normalized, block_size):
+        # keep only the upper triangle, so each pair is scored once
+        rows = np.arange(start, stop)[:, None]
+        block[rows >= np.arange(num_nodes)[None, :]] = -np.inf
+        mask_existing(block, start, stop, edge_keys, num_nodes)
+
+        # best k candidates of this block, then merge them into the bounded heap
+        flat = block.ravel()
+        n_cand = min(k, flat.size)
+        if n_cand == 0:
+            continue
+        cand = np.argpartition(-flat, n_cand - 1)[:n_cand]
+        cand = cand[np.isfinite(flat[cand])]
+        for pos, score in zip(cand.tolist(), flat[cand].tolist()):
+            i, j = divmod(pos, num_nodes)
+            entry = (score, -(start + i), -j)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    return [(-i, -j, score) for score, i, j in sorted(heap, reverse=True)]
@@ -0,0 +1,145 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from graph_store import GraphStore, build_store, open_store
+from instrumentation import run_report, timer
+from rule_engine import ARTISTS_FILE, COLLABORATIONS_FILE, DEFAULT_WEIGHTS, TUNED_WEIGHTS_FILE, RuleEngine
+
+WEIGHT_NAMES = list(DEFAULT_WEIGHTS)  # column order of the feature matrix
+GRID_VALUES = [0.0, 1.0, 2.0, 5.0, 10.0]  # per weight, 5^5 = 3125 weight vectors
+HOLDOUT_FRACTION = 0.1  # collaborations hidden from the graph and used as positives
+HITS_AT = 10
+MAX_CELLS = 1 << 24  # competitor x weight-vector score differences held at once
+TIE_TOLERANCE = 1e-9  # score differences this small are ties
+
+# hide a random fraction of the collaborations. returns the held-out pairs (store indices, a < b)
+# and a graph store compiled from the remaining collaborations, in a temporary directory
+def split_graph(store, tmp_dir, fraction=HOLDOUT_FRACTION, seed=0):
+    src, dst = store.coo()
+    pairs = np.stack([src[src < dst], dst[src < dst]], axis=1)
+    held_out = np.random.default_rng(seed).random(len(pairs)) < fraction
+
+    train_file = os.path.join(tmp_dir, 'collaborations.csv')
+    with open(train_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['artist_1', 'artist_2'])
+        writer.writerows((store.ids[a], store.ids[b]) for a, b in pairs[~held_out].tolist())
+    build_store(ARTISTS_FILE, train_file, os.path.join(tmp_dir, 'store'))
+    return pairs[held_out], GraphStore(os.path.join(tmp_dir, 'store'))
+
+# rule features of every 2-hop candidate pair, once: (a, b, features) with feature columns in
+# WEIGHT_NAMES order, so candidate scores for a weight vector w are features @ w
+def extract_features(engine):
+    a, b, features = [], [], []
+    for block in engine.iter_blocks(DEFAULT_WEIGHTS):
+        block_a, block_b, shared, genre_overlap, pop_diff, same_country, same_city, _ = block
+        a.append(block_a)
+        b.append(block_b)
+        features.append(np.stack([shared, genre_overlap, 1.0 / (1 + pop_diff), same_country, same_city], axis=1))
+    return np.concatenate(a), np.concatenate(b), np.concatenate(features).astype(np.float64)
+
+# every combination of `values` for the five weights, as rows of a (num_vectors, 5) matrix
+def weight_grid(values=GRID_VALUES):
+    return np.array(list(itertools.product(values, repeat=len(WEIGHT_NAMES))), dtype=np.float64)
+
+# Hits@k and MRR of every weight vector. each held-out collaboration (u, v) is a query from u for v
+# and from v for u, ranked among the query artist's candidates. other held-out partners of the
+# query artist are left out of its ranking, ties count half, and positives without 2-hop paths are misses
+def evaluate(a, b, features, held_out, weights, k=HITS_AT, max_cells=MAX_CELLS):
+    num_nodes = int(max(a.max(initial=0), b.max(initial=0), held_out.max(initial=0))) + 1
+    is_positive = np.isin(np.minimum(a, b) * num_nodes + np.maximum(a, b),
+                          held_out.min(axis=1) * num_nodes + held_out.max(axis=1))
+
+    # directed candidates (anchor -> other) grouped by anchor
+    anchor = np.concatenate([a, b])
+    pair = np.tile(np.arange(len(a)), 2)
+    order = np.argsort(anchor, kind='stable')
+    anchor, pair = anchor[order], pair[order]
+    positive = is_positive[pair]
+
+    # competitors of every positive: the non-positive candidates of the same anchor
+    queries = np.flatnonzero(positive)
+    lo = np.searchsorted(anchor, anchor[queries], side='left')
+    counts = np.searchsorted(anchor, anchor[queries], side='right') - lo
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    members = np.repeat(lo, counts) + offsets
+    query_of = np.repeat(np.arange(len(queries)), counts)
+    keep = ~positive[members]
+    members, query_of = pair[members[keep]], query_of[keep]
+
+    # score differences competitor - positive are (feature difference) @ w
+    diffs = features[members] - features[pair[queries]][query_of]
+    starts = np.searchsorted(query_of, np.arange(len(queries)))
+    empty = np.diff(np.append(starts, len(query_of))) == 0
+
+    num_queries = 2 * len(held_out)
+    hits = np.zeros(len(weights))
+    reciprocal = np.zeros(len(weights))
+    step = max(1, max_cells // max(len(diffs), 1))
+    for start in range(0, len(weights), step):
+        # 1 per competitor that scores higher, 1/2 per tie
+        delta = diffs @ weights[start:start + step].T
+        beaten = (delta > TIE_TOLERANCE) + (np.abs(delta) <= TIE_TOLERANCE) / 2
+        beaten = np.vstack([beaten, np.zeros((1, beaten.shape[1]), dtype=beaten.dtype)])
+        rank = 1 + np.where(empty[:, None], 0, np.add.reduceat(beaten, starts, axis=0))
+        hits[start:start + step] = (rank <= k).sum(axis=0) / num_queries
+        reciprocal[start:start + step] = (1 / rank).sum(axis=0) / num_queries
+    return hits, reciprocal
+
+def tune(weights=None, k=HITS_AT, fraction=HOLDOUT_FRACTION, seed=0):
+    weights = weight_grid() if weights is None else weights
+    weights = np.concatenate([np.array([list(DEFAULT_WEIGHTS.values())], dtype=np.float64), weights])
+    store = open_store(ARTISTS_FILE, COLLABORATIONS_FILE)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with timer('tune_features'):
+            held_out, train_store = split_graph(store, tmp_dir, fraction, seed)
+            a, b, features = extract_features(RuleEngine(train_store))
+    print(f"{len(held_out)} held-out collaborations, {len(a)} candidate pairs")
+
+    start = time.perf_counter()
+    with timer('tune_scoring'):
+        hits, mrr = evaluate(a, b, features, held_out, weights, k)
+    print(f"Scored {len(weights)} weight vectors in {time.perf_counter() - start:.2f}s")
+
+    # best MRR, Hits@k breaks ties
+    order = np.lexsort((-hits, -mrr))
+    results = [dict(zip(WEIGHT_NAMES, weights[i].tolist()), hits=float(hits[i]), mrr=float(mrr[i])) for i in order]
+    print(f"{'default':>7} | Hits@{k} {hits[0]:.3f} | MRR {mrr[0]:.3f}")
+    for rank, row in enumerate(results[:10], 1):
+        values = ' '.join(f"{row[name]:g}" for name in WEIGHT_NAMES)
+        print(f"{rank:>7} | Hits@{k} {row['hits']:.3f} | MRR {row['mrr']:.3f} | {values}")
+    return {name: results[0][name] for name in WEIGHT_NAMES}, results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Grid search over the logical rule weights on held-out collaborations")
+    parser.add_argument('--values', type=float, nargs='+', default=GRID_VALUES, help="grid values of every weight")
+    parser.add_argument('--samples', type=int, default=None, help="score this many random weight vectors instead of the grid")
+    parser.add_argument('--k', type=int, default=HITS_AT, help="K of Hits@K")
+    parser.add_argument('--holdout', type=float, default=HOLDOUT_FRACTION, help="fraction of collaborations held out")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=TUNED_WEIGHTS_FILE, help="where to save the best weights")
+    return parser.parse_args()
+
+def main(args):
+    if args.samples:
+        rng = np.random.default_rng(args.seed)
+        weights = rng.uniform(0, max(args.values), (args.samples, len(WEIGHT_NAMES)))
+    else:
+        weights = weight_grid(args.values)
+
+    best, results = tune(weights, args.k, args.holdout, args.seed)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'weights': best, 'hits': results[0]['hits'], 'mrr': results[0]['mrr'], 'k': args.k}, f, indent=2)
+    print(f"Best weights saved to {args.output}")
+
+if __name__ == "__main__":
+    args = parse_args()
+    with run_report('tune_rules'):
+        main(args)
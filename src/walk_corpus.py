@@ -0,0 +1,98 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import numpy as np
+
+WALK_DIR = 'data/.walk_corpus'
+CHUNK_WALKS = 100000  # walks generated per worker task
+PARALLEL_MIN_WALKS = 500000  # smaller corpora are generated in-process, starting workers costs more
+
+# uniform random walks of walk_length nodes (node2vec with p = q = 1) over a CSR adjacency,
+# one per start node. nodes without neighbours stay in place
+def random_walks(rowptr, col, starts, walk_length, rng):
+    walks = np.empty((len(starts), walk_length), dtype=np.int32)
+    current = np.asarray(starts, dtype=np.int64)
+    walks[:, 0] = current
+    for step in range(1, walk_length):
+        degree = rowptr[current + 1] - rowptr[current]
+        moving = degree > 0
+        offset = (rng.random(int(moving.sum())) * degree[moving]).astype(np.int64)
+        current = current.copy()
+        current[moving] = col[rowptr[current[moving]] + offset]
+        walks[:, step] = current
+    return walks
+
+# fill rows [start, stop) of the corpus. row r is a walk from node r % num_nodes, and every chunk
+# has its own seed, so the corpus is the same no matter how many workers build it
+def _fill_chunk(tmp, start, stop, num_nodes, walk_length, seed):
+    rowptr = np.load(os.path.join(tmp, 'rowptr.npy'), mmap_mode='r')
+    col = np.load(os.path.join(tmp, 'col.npy'), mmap_mode='r')
+    walks = np.load(os.path.join(tmp, 'walks.npy'), mmap_mode='r+')
+    rng = np.random.default_rng([seed, start])
+    walks[start:stop] = random_walks(rowptr, col, np.arange(start, stop) % num_nodes, walk_length, rng)
+    walks.flush()
+
+# cache key of a corpus: the adjacency itself plus the walk parameters
+def corpus_key(rowptr, col, params):
+    h = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+    h.update(np.ascontiguousarray(rowptr, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(col, dtype=np.int32).tobytes())
+    return h.hexdigest()[:16]
+
+# walks_per_node walks from every node as a memory-mapped (walks_per_node * num_nodes, walk_length)
+# int32 array. generated once per graph and walk parameters, in parallel processes for large graphs
+def build_corpus(rowptr, col, walk_length, walks_per_node, seed=0, workers=None, corpus_dir=WALK_DIR):
+    num_nodes = len(rowptr) - 1
+    params = {'num_nodes': num_nodes, 'walk_length': walk_length, 'walks_per_node': walks_per_node, 'seed': seed}
+    path = os.path.join(corpus_dir, corpus_key(rowptr, col, params))
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        return np.load(os.path.join(path, 'walks.npy'), mmap_mode='r')
+
+    num_walks = walks_per_node * num_nodes
+    print(f"Generating {num_walks} random walks of length {walk_length}...")
+
+    # write into a temporary directory and rename, so readers never see a half-built corpus
+    tmp = f'{path}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'rowptr.npy'), np.asarray(rowptr, dtype=np.int64))
+    np.save(os.path.join(tmp, 'col.npy'), np.asarray(col, dtype=np.int32))
+    np.lib.format.open_memmap(os.path.join(tmp, 'walks.npy'), mode='w+', dtype=np.int32,
+                              shape=(num_walks, walk_length)).flush()
+
+    tasks = [(tmp, start, min(start + CHUNK_WALKS, num_walks), num_nodes, walk_length, seed)
+             for start in range(0, num_walks, CHUNK_WALKS)]
+    workers = workers or os.cpu_count() or 1
+    if num_walks < PARALLEL_MIN_WALKS or workers == 1:
+        for task in tasks:
+            _fill_chunk(*task)
+    else:
+        with multiprocessing.get_context('spawn').Pool(min(workers, len(tasks))) as pool:
+            pool.starmap(_fill_chunk, tasks)
+
+    os.remove(os.path.join(tmp, 'rowptr.npy'))
+    os.remove(os.path.join(tmp, 'col.npy'))
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(dict(params, num_walks=num_walks), f, indent=2)
+    if os.path.exists(path):
+        shutil.rmtree(tmp)  # another process built the same corpus first
+    else:
+        os.rename(tmp, path)
+        _remove_stale(corpus_dir, path, params)
+    return np.load(os.path.join(path, 'walks.npy'), mmap_mode='r')
+
+# delete corpora with the same walk parameters that were built from an older graph
+def _remove_stale(corpus_dir, current, params):
+    for name in os.listdir(corpus_dir):
+        path = os.path.join(corpus_dir, name)
+        if path == current or not os.path.isdir(path):
+            continue
+        try:
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if all(meta.get(key) == value for key, value in params.items() if key != 'num_nodes'):
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,42 @@
+import os
+import sys
+import pytest
+
+# the scripts in src/ import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+ARTISTS_CSV = '''id,name,followers,genres,popularity,num_albums,debut_year,last_active_year,active_years,country,begin_area
+a,Artist A,10,"pop, rock",50,3,2001,2005,5,US,Boston
+b,Artist B,,pop,,,,,,US,
+c,"Name, with comma",5,,1,1,2010,2010,1,GB,London
+d,"Quote ""D""",0,"rock, pop , rock",7,2,2015,2016,2,,
+a,Artist A,10,"pop, rock",50,3,2001,2005,5,US,Boston
+'''
+COLLABORATIONS_CSV = '''artist_1,artist_2
+a,b
+a,b
+b,a
+b,c
+c,unknown
+'''
+
+# node and relationship counts the small graph loads into Neo4j: a duplicated artist row, duplicated
+# and reversed collaborations, one to an unknown artist, and untrimmed, repeated genres
+COUNTS = {
+    'Artist': 4, 'COLLABORATED_WITH': 3,
+    'Genre': 2, 'HAS_GENRE': 5,
+    'Country': 2, 'FROM_COUNTRY': 3,
+    'City': 2, 'STARTED_IN': 2,
+}
+
+# (artists file, collaborations file) of the small graph
+@pytest.fixture
+def small_graph(tmp_path):
+    artists, collaborations = tmp_path / 'artists.csv', tmp_path / 'collaborations.csv'
+    artists.write_text(ARTISTS_CSV, encoding='utf-8')
+    collaborations.write_text(COLLABORATIONS_CSV, encoding='utf-8')
+    return str(artists), str(collaborations)
+
+@pytest.fixture
+def small_graph_counts():
+    return dict(COUNTS)
@@ -0,0 +1,72 @@
+import csv
+import gzip
+import os
+import pytest
+
+pytest.importorskip('pandas')
+from bulk_export import export, import_command
+
+# rows of every part file of a manifest entry, the header row first
+def read_rows(out_dir, entry):
+    rows = []
+    for name in entry['files']:
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(os.path.join(out_dir, name), 'rt', encoding='utf-8', newline='') as f:
+            rows.extend(csv.reader(f))
+    return rows
+
+def test_export_counts_match_populate(small_graph, small_graph_counts, tmp_path):
+    manifest = export(*small_graph, out_dir=str(tmp_path / 'import'), normalized=True)
+
+    counts = {name: entry['rows'] for group in ('nodes', 'relationships') for name, entry in manifest[group].items()}
+    assert counts == small_graph_counts
+
+def test_export_artist_rows(small_graph, tmp_path):
+    out_dir = str(tmp_path / 'import')
+    manifest = export(*small_graph, out_dir=out_dir)
+
+    header, *rows = read_rows(out_dir, manifest['nodes']['Artist'])
+    assert header[:3] == ['id:ID(Artist)', 'name', 'followers:long']
+    artists = {row[0]: row for row in rows}
+    assert len(rows) == len(artists) == 4
+    assert artists['b'][2] == '0'  # missing numbers become 0 like in populate_neo4j.py
+    assert artists['c'][1] == 'Name, with comma'
+    assert artists['d'][1] == 'Quote "D"'
+
+    header, *rows = read_rows(out_dir, manifest['relationships']['COLLABORATED_WITH'])
+    assert sorted(map(tuple, rows)) == [('a', 'b'), ('b', 'a'), ('b', 'c')]
+
+def test_duplicated_artist_matches_populate(small_graph, tmp_path):
+    artists, collaborations = small_graph
+    with open(artists, 'a', encoding='utf-8') as f:
+        f.write('a,Artist A renamed,20,jazz,60,4,2001,2006,6,US,Boston\n')
+    out_dir = str(tmp_path / 'import')
+    manifest = export(artists, collaborations, out_dir=out_dir, normalized=True)
+
+    # the last row sets the properties, the genres of every row are linked
+    header, *rows = read_rows(out_dir, manifest['nodes']['Artist'])
+    assert [row[:3] for row in rows if row[0] == 'a'] == [['a', 'Artist A renamed', '20']]
+    header, *rows = read_rows(out_dir, manifest['relationships']['HAS_GENRE'])
+    assert sorted(row[1] for row in rows if row[0] == 'a') == ['jazz', 'pop', 'rock']
+    header, *rows = read_rows(out_dir, manifest['relationships']['FROM_COUNTRY'])
+    assert [row for row in rows if row[0] == 'a'] == [['a', 'US']]
+
+def test_compressed_parts(small_graph, tmp_path):
+    plain = export(*small_graph, out_dir=str(tmp_path / 'plain'), normalized=True)
+    compressed = export(*small_graph, out_dir=str(tmp_path / 'compressed'), normalized=True, compress=True, chunk_rows=2)
+
+    # a part per chunk of two rows: 'b', 'c' and 'd', then the last row of 'a'
+    entry = compressed['nodes']['Artist']
+    assert len(entry['files']) == 4 and all(name.endswith('.gz') for name in entry['files'][1:])
+    for group in ('nodes', 'relationships'):
+        for name in plain[group]:
+            assert (sorted(read_rows(str(tmp_path / 'compressed'), compressed[group][name]))
+                    == sorted(read_rows(str(tmp_path / 'plain'), plain[group][name])))
+
+def test_import_command_lists_every_file(small_graph, tmp_path):
+    manifest = export(*small_graph, out_dir=str(tmp_path / 'import'), normalized=True)
+    command = import_command(manifest)
+
+    assert command.startswith('neo4j-admin database import full')
+    assert '--nodes=Genre=/import/genre_header.csv,/import/genre-0000.csv' in command
+    assert '--relationships=COLLABORATED_WITH=/import/collaborations_header.csv,/import/collaborations-0000.csv' in command
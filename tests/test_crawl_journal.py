@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import pytest
+
+pytest.importorskip('pandas')
+from crawl_journal import CrawlJournal
+
+ARTIST = {
+    'id': 'e', 'name': 'Artist E', 'followers': 1, 'genres': 'pop', 'popularity': 1, 'num_albums': 1,
+    'debut_year': 2020, 'last_active_year': 2020, 'active_years': 1, 'country': '', 'begin_area': ''
+}
+
+# the journal rebuilds itself through the graph store, which needs unique artist IDs
+@pytest.fixture
+def graph(small_graph, tmp_path, monkeypatch):
+    artists, collaborations = small_graph
+    with open(artists, encoding='utf-8') as f:
+        lines = f.readlines()
+    with open(artists, 'w', encoding='utf-8') as f:
+        f.writelines(dict.fromkeys(lines))
+    monkeypatch.chdir(tmp_path)
+    return artists, collaborations
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / 'journal.sqlite')
+
+def test_unfinished_rows_are_dropped(graph, journal_path):
+    artists, collaborations = graph
+    CrawlJournal(artists, collaborations, journal_path).close()
+    size = os.path.getsize(artists)
+
+    journal = CrawlJournal(artists, collaborations, journal_path)
+    journal.add_artist(ARTIST)
+    journal.flush()  # written, but never checkpointed
+    journal.artists_out.close()
+    journal.collaborations_out.close()
+    journal.db.close()
+    assert os.path.getsize(artists) > size
+
+    journal = CrawlJournal(artists, collaborations, journal_path)
+    assert os.path.getsize(artists) == size
+    journal.close()
+
+def test_replaced_file_is_not_truncated(graph, journal_path):
+    artists, collaborations = graph
+    CrawlJournal(artists, collaborations, journal_path).close()
+
+    # a different, longer file under the same name
+    with open(artists, encoding='utf-8') as f:
+        text = f.read().replace('Artist A', 'Artist AA') + 'f,Artist F,,,,,,,,,\n'
+    with open(artists, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+    journal = CrawlJournal(artists, collaborations, journal_path)
+    with open(artists, encoding='utf-8') as f:
+        assert f.read() == text
+    assert journal.is_processed('b')
+    journal.close()
+
+def test_journal_without_tail_hashes_is_rebuilt(graph, journal_path):
+    artists, collaborations = graph
+    db = sqlite3.connect(journal_path)
+    db.execute("CREATE TABLE files (name TEXT PRIMARY KEY, size INTEGER NOT NULL)")
+    db.executemany("INSERT INTO files VALUES (?, ?)", [(artists, 10), (collaborations, 10)])
+    db.commit()
+    db.close()
+
+    journal = CrawlJournal(artists, collaborations, journal_path)
+    assert os.path.getsize(artists) > 10
+    assert journal.is_processed('a') and journal.has_pair('b', 'a')
+    journal.close()
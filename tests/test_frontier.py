@@ -0,0 +1,23 @@
+import csv
+from crawl_journal import ARTIST_FIELDS, COLLABORATION_FIELDS
+from frontier import CrawlFrontier
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+def test_export_writes_pipeline_csvs(tmp_path):
+    frontier = CrawlFrontier(str(tmp_path / 'frontier.sqlite'))
+    frontier.seed([('a', 50)])
+    [(artist_id, depth)] = frontier.claim(10)
+    info = {field: '' for field in ARTIST_FIELDS}
+    info.update(id='a', name='Artist A', genres='pop, rock', followers=10)
+    # 'b' is discovered but never crawled, so its collaboration is left out
+    frontier.complete([(artist_id, depth, info, [('b', 1)])])
+
+    artists, collaborations = tmp_path / 'artists.csv', tmp_path / 'collaborations.csv'
+    frontier.export(str(artists), str(collaborations))
+    frontier.close()
+
+    assert read_csv(artists) == [ARTIST_FIELDS, ['a', 'Artist A', '10', 'pop, rock'] + [''] * 7]
+    assert read_csv(collaborations) == [COLLABORATION_FIELDS]
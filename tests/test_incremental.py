@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('pandas')
+from graph_store import open_store
+from incremental import GraphDelta
+
+HEADER = 'id,name,followers,genres,popularity,num_albums,debut_year,last_active_year,active_years,country,begin_area\n'
+
+# graph store of artists a to e with the given collaborations
+def make_store(tmp_path, edges):
+    artists, collaborations = tmp_path / 'artists.csv', tmp_path / 'collaborations.csv'
+    artists.write_text(HEADER + ''.join(f'{a},Artist {a},1,pop,1,1,2000,2001,2,US,\n' for a in 'abcde'))
+    collaborations.write_text('artist_1,artist_2\n' + ''.join(f'{a},{b}\n' for a, b in edges))
+    return open_store(str(artists), str(collaborations), str(tmp_path / 'store'))
+
+# checkpoint IDs and edges of a model that only embeds connected artists, like node2vec
+def connected_checkpoint(store):
+    connected = np.flatnonzero(store.degree() > 0)
+    id_map = np.full(store.num_nodes, -1)
+    id_map[connected] = np.arange(len(connected))
+    return store.ids[connected], id_map[store.edges]
+
+def test_unconnected_artists_are_not_new(tmp_path):
+    store = make_store(tmp_path, [('a', 'b'), ('b', 'c')])
+    delta = GraphDelta(store, *connected_checkpoint(store), nodes=store.degree() > 0)
+
+    assert delta.is_empty
+    assert delta.summary() == "0 changed edges, 0 new artists, 0 affected artists"
+
+def test_new_collaboration_affects_its_neighbourhood(tmp_path):
+    (tmp_path / 'old').mkdir()
+    old = make_store(tmp_path / 'old', [('a', 'b'), ('b', 'c')])
+    ids, edges = connected_checkpoint(old)
+    store = make_store(tmp_path, [('a', 'b'), ('b', 'c'), ('c', 'd')])
+    delta = GraphDelta(store, ids, edges, hops=1, nodes=store.degree() > 0)
+
+    assert delta.num_changed_edges == 1
+    assert store.ids[delta.new_nodes].tolist() == ['d']
+    assert store.ids[delta.affected].tolist() == ['b', 'c', 'd']  # e is unconnected, a two hops away
@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pytest
+
+pytest.importorskip('spotipy')
+import load_spotify_data
+
+RETRY_AFTER = 2  # seconds the stub asks the crawler to wait
+ALBUMS_PER_ARTIST = 10
+
+# local stand-in for the Spotify token and Web API endpoints, serving a made-up catalogue: every
+# artist has ALBUMS_PER_ARTIST albums '<artist>Z<n>', each with one track by the artist and a guest.
+# with `throttle` set, the first request of every single artist gets a 429 with Retry-After.
+# request times are recorded per path, and the IDs of every multi-ID albums request in order
+class StubSpotify(BaseHTTPRequestHandler):
+    requests = {}
+    album_batches = []
+    throttle = False
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def artist(artist_id):
+        return {'id': artist_id, 'name': f'Stub {artist_id}', 'followers': {'total': 1}, 'genres': ['pop'], 'popularity': 1}
+
+    @staticmethod
+    def album(album_id):
+        tracks = [{'artists': [{'id': album_id.split('Z')[0]}, {'id': 'guest'}]}]
+        return {'id': album_id, 'release_date': '2001-01-01', 'tracks': {'items': tracks, 'next': None}}
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_json(200, {'access_token': 'stub', 'token_type': 'Bearer', 'expires_in': 3600})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/')
+        query = parse_qs(url.query)
+        times = self.requests.setdefault(path, [])
+        times.append(time.monotonic())
+        parts = path.split('/')[2:]  # after /v1
+
+        if parts == ['albums']:
+            ids = query['ids'][0].split(',')
+            self.album_batches.append(ids)
+            self.send_json(200, {'albums': [self.album(a) for a in ids]})
+        elif parts == ['artists']:
+            self.send_json(200, {'artists': [self.artist(a) for a in query['ids'][0].split(',')]})
+        elif parts[0] == 'albums' and parts[2:] == ['tracks']:
+            self.send_json(200, self.album(parts[1])['tracks'])
+        elif parts[0] == 'artists' and parts[2:] == ['albums']:
+            limit = min(int(query.get('limit', ['20'])[0]), ALBUMS_PER_ARTIST)
+            self.send_json(200, {'items': [self.album(f'{parts[1]}Z{n}') for n in range(limit)], 'next': None})
+        elif self.throttle and len(times) == 1:
+            self.send_json(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                           [('Retry-After', str(RETRY_AFTER))])
+        else:
+            self.send_json(200, self.artist(parts[1]))
+
+@pytest.fixture
+def stub_server(tmp_path, monkeypatch):
+    StubSpotify.requests = {}
+    StubSpotify.album_batches = []
+    StubSpotify.throttle = False
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubSpotify)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    # fresh clients and response cache pointed at the stub; spotipy caches its token in the cwd
+    from spotipy.oauth2 import SpotifyClientCredentials
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(SpotifyClientCredentials, 'OAUTH_TOKEN_URL', f'{url}/api/token')
+    monkeypatch.setattr(load_spotify_data, 'SPOTIFY_API_PREFIX', f'{url}/v1/')
+    monkeypatch.setattr(load_spotify_data, 'SPOTIFY_TOKEN_URL', None)
+    monkeypatch.setattr(load_spotify_data, 'CACHE_FILE', str(tmp_path / 'api_cache.sqlite'))
+    monkeypatch.setattr(load_spotify_data, '_clients', {})
+    yield StubSpotify.requests
+    load_spotify_data.close_response_cache()
+    server.shutdown()
+    server.server_close()
+
+def test_spotify_429_waits_for_retry_after(stub_server):
+    StubSpotify.throttle = True
+    api = load_spotify_data.spotify_api
+    retries = api.retries
+
+    artist = load_spotify_data.spotify_get('artist', 'abc')
+
+    assert artist['id'] == 'abc'
+    first, second = stub_server['/v1/artists/abc']
+    assert second - first >= RETRY_AFTER
+    assert api.retries == retries + 1
+    # the whole API is held back, not just the retrying worker
+    assert api.bucket.blocked_until >= first + RETRY_AFTER - 0.5
+
+def test_spotify_throttled_requests_are_not_cached_twice(stub_server):
+    StubSpotify.throttle = True
+    load_spotify_data.spotify_get('artist', 'def')
+    load_spotify_data.spotify_get('artist', 'def')
+
+    assert len(stub_server['/v1/artists/def']) == 2  # the 429 and one successful fetch
+
+def test_album_tracks_are_cached_per_album(stub_server, monkeypatch):
+    monkeypatch.setattr(load_spotify_data, 'ALBUMS_PER_REQUEST', 2)
+
+    planner = load_spotify_data.RequestPlanner(concurrency=1)
+    planner.fetch_album_tracks(['a', 'b', 'c'])
+    assert planner.album_artists['c'] == {'c', 'guest'}
+
+    # a resumed crawl meets the albums in other batches, only the new one is fetched
+    planner = load_spotify_data.RequestPlanner(concurrency=1)
+    planner.fetch_album_tracks(['c', 'd', 'b'])
+    assert StubSpotify.album_batches == [['a', 'b'], ['c'], ['d']]
+    assert set(planner.album_artists) == {'b', 'c', 'd'}
+
+# Spotify requests per artist for metadata and collaborations of `num_artists` artists: one by one
+# as the crawler used to (artist, two album lists and one track listing per album), and through the
+# request planner (multi-ID artists and albums, one shared album list per artist)
+def test_requests_per_artist(stub_server, tmp_path, monkeypatch):
+    from rate_limit import TokenBucket
+
+    num_artists = 100
+    api = load_spotify_data.spotify_api
+    monkeypatch.setattr(api, 'bucket', TokenBucket(1e6, 1e6))
+    monkeypatch.setattr(load_spotify_data, 'get_musicbrainz_info', lambda name: {'country': None, 'begin_area': None})
+    artist_ids = [f'artist{i}' for i in range(num_artists)]
+
+    calls = api.calls
+    for artist_id in artist_ids:
+        load_spotify_data.spotify_get('artist', artist_id)
+        load_spotify_data.spotify_get('artist_albums', artist_id, album_type='album', limit=25)
+        albums = load_spotify_data.spotify_get('artist_albums', artist_id, album_type='album', limit=50)['items']
+        for album in albums:
+            load_spotify_data.spotify_get('album_tracks', album['id'])
+    before = (api.calls - calls) / num_artists
+
+    # cold cache again
+    load_spotify_data.close_response_cache()
+    monkeypatch.setattr(load_spotify_data, 'CACHE_FILE', str(tmp_path / 'planner_cache.sqlite'))
+    calls = api.calls
+    planner = load_spotify_data.RequestPlanner(concurrency=4)
+    infos = planner.artist_infos(artist_ids)
+    collaborations = planner.collaborations(artist_ids)
+    after = (api.calls - calls) / num_artists
+
+    print(f"Spotify requests per artist: {before:.2f} one by one, {after:.2f} with the request planner")
+    assert [info['id'] for info in infos] == artist_ids
+    assert all(collaborations[a] == ['guest'] for a in artist_ids)
+    assert before == 3 + ALBUMS_PER_ARTIST
+    albums = num_artists * ALBUMS_PER_ARTIST
+    assert after == (num_artists / load_spotify_data.ARTISTS_PER_REQUEST + num_artists
+                     + albums / load_spotify_data.ALBUMS_PER_REQUEST) / num_artists
@@ -0,0 +1,109 @@
+import os
+import shutil
+import subprocess
+import time
+import uuid
+import pytest
+
+pytest.importorskip('neo4j')
+pytest.importorskip('pandas')
+import neo4j_client
+from bulk_export import export, import_command, verify_counts
+from populate_neo4j import clear_all, populate
+
+# these tests replace the contents of the database, so they only run against a throwaway instance,
+# e.g. `docker run -d -p 7688:7687 -e NEO4J_AUTH=neo4j/knowledgegraphs neo4j:5.14` and
+# NEO4J_TEST_URI=bolt://localhost:7688
+NEO4J_TEST_URI = os.environ.get('NEO4J_TEST_URI')
+NEO4J_TEST_AUTH = ('neo4j', os.environ.get('NEO4J_TEST_PASSWORD', 'knowledgegraphs'))
+# image for the neo4j-admin import test, which starts its own containers, e.g. neo4j:5.14
+NEO4J_TEST_IMAGE = os.environ.get('NEO4J_TEST_IMAGE')
+
+# point the shared driver at another database for one test
+def use_database(monkeypatch, uri, auth):
+    neo4j_client.close_driver()
+    monkeypatch.setattr(neo4j_client, 'URI', uri)
+    monkeypatch.setattr(neo4j_client, 'AUTH', auth)
+
+# counts of node labels and (all upper case) relationship types in the database
+def graph_counts(names):
+    queries = {name: f"MATCH ()-[r:{name}]->() RETURN count(r) AS n" if name.isupper() else
+               f"MATCH (n:{name}) RETURN count(n) AS n" for name in names}
+    with neo4j_client.get_driver().session() as session:
+        return {name: session.run(query).single()['n'] for name, query in queries.items()}
+
+@pytest.fixture
+def neo4j_database(monkeypatch):
+    if not NEO4J_TEST_URI:
+        pytest.skip("set NEO4J_TEST_URI to a throwaway Neo4j instance")
+    use_database(monkeypatch, NEO4J_TEST_URI, NEO4J_TEST_AUTH)
+    try:
+        neo4j_client.get_driver().verify_connectivity()
+    except Exception as e:
+        pytest.skip(f"Neo4j is not reachable at {NEO4J_TEST_URI}: {e}")
+    yield
+    clear_all()
+    neo4j_client.close_driver()
+
+@pytest.mark.parametrize('bulk, workers', [(False, 1), (True, 1), (True, 3)])
+def test_populate_counts(neo4j_database, small_graph, small_graph_counts, bulk, workers):
+    populate(*small_graph, bulk=bulk, batch_size=2, workers=workers, normalized=True)
+
+    assert graph_counts(small_graph_counts) == small_graph_counts
+
+def test_clear_all_in_batches(neo4j_database, small_graph, small_graph_counts):
+    populate(*small_graph, bulk=True, batch_size=2, normalized=True)
+    clear_all(batch_size=2)
+
+    with neo4j_client.get_driver().session() as session:
+        assert session.run("MATCH (n) RETURN count(n) AS n").single()['n'] == 0
+
+    # a second load into the cleared database has the same counts, not duplicates
+    populate(*small_graph, bulk=True, batch_size=2, normalized=True, delete_batch_size=2)
+    assert graph_counts(small_graph_counts) == small_graph_counts
+
+def test_export_manifest_matches_loaded_graph(neo4j_database, small_graph, tmp_path):
+    populate(*small_graph, bulk=True, normalized=True)
+    manifest = export(*small_graph, out_dir=str(tmp_path / 'import'), normalized=True)
+
+    assert verify_counts(manifest) == {}
+
+def docker(*args, check=True):
+    return subprocess.run(['docker', *args], check=check, capture_output=True, text=True).stdout.strip()
+
+# export, run neo4j-admin import into a fresh volume, start a database on it and compare the counts
+@pytest.mark.parametrize('compress', [False, True])
+def test_bulk_import_counts(small_graph, small_graph_counts, tmp_path, monkeypatch, compress):
+    if not NEO4J_TEST_IMAGE or not shutil.which('docker'):
+        pytest.skip("set NEO4J_TEST_IMAGE and install docker to run neo4j-admin import")
+    out_dir = tmp_path / 'import'
+    manifest = export(*small_graph, out_dir=str(out_dir), normalized=True, compress=compress, chunk_rows=2)
+
+    volume = f'spotifycollabs-test-{uuid.uuid4().hex[:8]}'
+    container = None
+    try:
+        docker('volume', 'create', volume)
+        docker('run', '--rm', '-v', f'{out_dir}:/import:ro', '-v', f'{volume}:/data', NEO4J_TEST_IMAGE,
+               *import_command(manifest).split())
+        container = docker('run', '-d', '-p', '127.0.0.1::7687', '-e', 'NEO4J_AUTH=none', '-v', f'{volume}:/data',
+                           NEO4J_TEST_IMAGE)
+        port = docker('port', container, '7687').splitlines()[0].rsplit(':', 1)[1]
+
+        use_database(monkeypatch, f'bolt://127.0.0.1:{port}', None)
+        deadline = time.monotonic() + 120
+        while True:
+            try:
+                neo4j_client.get_driver().verify_connectivity()
+                break
+            except Exception:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(1)
+
+        assert verify_counts(manifest) == {}
+        assert graph_counts(small_graph_counts) == small_graph_counts
+    finally:
+        neo4j_client.close_driver()
+        if container:
+            docker('rm', '-f', container, check=False)
+        docker('volume', 'rm', '-f', volume, check=False)
@@ -0,0 +1,62 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('scipy')
+import query_service
+
+# the service over the small graph without its duplicated artist row, with the logical rules,
+# on a free local port
+@pytest.fixture
+def server_url(small_graph, tmp_path, monkeypatch):
+    artists, collaborations = small_graph
+    with open(artists, encoding='utf-8') as f:
+        lines = f.readlines()
+    with open(artists, 'w', encoding='utf-8') as f:
+        f.writelines(dict.fromkeys(lines))
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(query_service, 'ARTISTS_FILE', artists)
+    monkeypatch.setattr(query_service, 'COLLABORATIONS_FILE', collaborations)
+    service = query_service.CollaborationService(['rules'])
+    server = query_service.serve(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+# (status, decoded JSON body) of a GET, or of a POST with a raw body
+def request(url, data=None):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data)) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def test_query(server_url):
+    status, body = request(f'{server_url}/collaborators?artist=artist%20a&k=2&model=rules')
+    assert status == 200
+    assert 1 <= len(body) <= 2 and all({'id', 'name', 'score'} <= set(row) for row in body)
+
+    status, body = request(f'{server_url}/collaborators/batch', json.dumps({'artists': ['a', 'c'], 'model': 'rules'}).encode())
+    assert status == 200 and len(body) == 2
+
+@pytest.mark.parametrize('path, data', [
+    ('/collaborators?model=rules', None),
+    ('/collaborators?artist=a&k=-2&model=rules', None),
+    ('/collaborators?artist=a&k=ten&model=rules', None),
+    ('/collaborators/batch', b'{"artists": ['),
+    ('/collaborators/batch', b'{"artists": "Drake", "model": "rules"}'),
+    ('/collaborators/batch', b'{"model": "rules"}'),
+    ('/collaborators/batch', b'[]'),
+])
+def test_bad_requests(server_url, path, data):
+    status, body = request(server_url + path, data)
+    assert status == 400 and body['error']
+
+def test_unknown_artist(server_url):
+    status, body = request(f'{server_url}/collaborators?artist=nobody&model=rules')
+    assert (status, body) == (404, {'error': "Unknown artist: nobody"})
@@ -0,0 +1,32 @@
+import time
+from response_cache import ResponseCache
+
+# crawler processes share one cache file. a hit in one connection must not keep SQLite's write lock,
+# or the next write of another connection fails with "database is locked"
+def test_hit_does_not_lock_other_connections(tmp_path):
+    path = str(tmp_path / 'api_cache.sqlite')
+    first = ResponseCache(path)
+    second = ResponseCache(path)
+    second.db.execute("PRAGMA busy_timeout = 100")
+    try:
+        first.put('spotify.artist', {'id': 'a'}, ('a',))
+        assert first.get('spotify.artist', ('a',)) == {'id': 'a'}
+
+        second.put('spotify.artist', {'id': 'b'}, ('b',))
+        assert first.get('spotify.artist', ('b',)) == {'id': 'b'}
+    finally:
+        first.close()
+        second.close()
+
+def test_access_times_are_written(tmp_path):
+    path = str(tmp_path / 'api_cache.sqlite')
+    cache = ResponseCache(path)
+    cache.put('spotify.artist', {'id': 'a'}, ('a',))
+    created = cache.db.execute("SELECT accessed FROM responses").fetchone()[0]
+    time.sleep(0.01)
+    cache.get('spotify.artist', ('a',))
+    cache.close()
+
+    cache = ResponseCache(path)
+    assert cache.db.execute("SELECT accessed FROM responses").fetchone()[0] > created
+    cache.close()